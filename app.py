@@ -3,9 +3,9 @@ Kings in the Corner - Pure Streamlit Native Version
 No HTML - only native Streamlit components for maximum compatibility
 """
 import streamlit as st
-from streamlit_autorefresh import st_autorefresh
 import time
-from game_manager import game_manager
+from bots import BOT_POLICIES, BotRunner
+from game_manager import ChangeFeed, game_manager
 
 
 # Page configuration
@@ -23,13 +23,29 @@ def init_session_state():
         'game_id': None,
         'player_name': "",
         'selected_cards': [],
-        'show_rules': False
+        'show_rules': False,
+        'state_version': None,
+        'poll_interval': POLL_INTERVAL_MIN,
+        'next_poll': 0.0,
+        'flash_messages': []
     }
     
     for key, default_value in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = default_value
 
+def flash(message, celebrate=False):
+    """Queue a message to show on the next rerun, so handlers need not wait."""
+    st.session_state.flash_messages.append((message, celebrate))
+
+def show_flash_messages():
+    """Show and clear the messages queued by the previous run."""
+    for message, celebrate in st.session_state.flash_messages:
+        if celebrate:
+            st.balloons()
+        st.toast(message, icon="✅")
+    st.session_state.flash_messages = []
+
 def get_card_display(card):
     """Get card display text with color indicator."""
     if not card:
@@ -111,8 +127,7 @@ def display_game_board(game_state):
         if st.button("🃏 Draw a Card", key="draw_card", type="primary", use_container_width=True):
             success, message = game_manager.draw_card(st.session_state.player_id)
             if success:
-                st.success(message)
-                time.sleep(0.5)
+                flash(message)
                 st.rerun()
             else:
                 st.error(message)
@@ -200,33 +215,19 @@ def display_actions_interface(game_state):
             
             with col_a:
                 if st.button("🃏 Play Selected", key="play_cards", type="primary", use_container_width=True):
-                    success_count = 0
-                    failed_cards = []
-                    
-                    for card_id in st.session_state.selected_cards.copy():
-                        rank = card_id[:-1]
-                        suit = card_id[-1]
-                        
-                        success, message = game_manager.play_card(
-                            st.session_state.player_id, rank, suit, target_pile
-                        )
-                        
-                        if success:
-                            success_count += 1
-                            st.session_state.selected_cards.remove(card_id)
-                        else:
-                            failed_cards.append(f"{card_id}: {message}")
-                            break
-                    
-                    if success_count > 0:
-                        st.success(f"✅ Played {success_count} card(s)!")
+                    selected = st.session_state.selected_cards
+                    success, results = game_manager.play_cards(
+                        st.session_state.player_id,
+                        [(card_id[:-1], card_id[-1], target_pile) for card_id in selected]
+                    )
                     
-                    if failed_cards:
-                        st.error(f"❌ {failed_cards[0]}")
-                    
-                    if success_count > 0:
-                        time.sleep(0.5)
+                    if success:
+                        st.session_state.selected_cards = []
+                        flash(f"Played {len(results)} card(s)!")
                         st.rerun()
+                    else:
+                        # The batch is all-or-nothing, so no card was played
+                        st.error(f"❌ {results[-1][1]}")
             
             with col_b:
                 if st.button("🧹 Clear Selection", key="clear_selection", use_container_width=True):
@@ -246,7 +247,7 @@ def display_actions_interface(game_state):
             else:
                 pile = game_state['corner_piles'][pile_name]
             
-            if pile['cards']:
+            if pile['size']:
                 moveable_piles.append(pile_name)
         
         if not moveable_piles:
@@ -273,8 +274,7 @@ def display_actions_interface(game_state):
                 )
                 
                 if success:
-                    st.success(message)
-                    time.sleep(0.5)
+                    flash(message)
                     st.rerun()
                 else:
                     st.error(message)
@@ -286,8 +286,7 @@ def display_game_status(game_state):
     current_player_name = game_state.get('current_player_name', 'Unknown')
     is_my_turn = False
     
-    if (st.session_state.player_id and current_player_idx >= 0 and 
-        game_state['players'][current_player_idx]['id'] == st.session_state.player_id):
+    if current_player_idx >= 0 and current_player_idx == game_state['seat']:
         is_my_turn = True
     
     # Status display
@@ -303,8 +302,10 @@ def display_game_status(game_state):
         icons = []
         if i == current_player_idx:
             icons.append("🎯")
-        if player['id'] == st.session_state.player_id:
+        if i == game_state['seat']:
             icons.append("👤 (You)")
+        elif player.get('bot'):
+            icons.append("🤖")
         
         status_text = " ".join(icons)
         st.write(f"**{player['name']}** - {player['hand_size']} cards {status_text}")
@@ -318,14 +319,13 @@ def display_turn_controls(is_my_turn):
     
     st.markdown("### ⚡ Turn Actions")
     
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
     
     with col1:
         if st.button("✅ End Turn", key="end_turn", type="primary", use_container_width=True):
             if game_manager.end_turn(st.session_state.player_id):
-                st.success("Turn ended!")
+                flash("Turn ended!")
                 st.session_state.selected_cards = []
-                time.sleep(0.5)
                 st.rerun()
             else:
                 st.error("Could not end turn")
@@ -338,6 +338,20 @@ def display_turn_controls(is_my_turn):
         if st.button("📖 Rules", key="toggle_rules", use_container_width=True):
             st.session_state.show_rules = not st.session_state.show_rules
             st.rerun()
+    
+    with col4:
+        if st.button("💡 Hint", key="hint", use_container_width=True):
+            hint = game_manager.get_hint(st.session_state.player_id)
+            if hint is None:
+                st.error("Could not find a hint")
+            elif not hint.moves:
+                st.info("💡 Nothing worth playing - draw a card")
+            else:
+                steps = [
+                    f"{move.card} → {move.target}" if move.kind == "play" else f"{move.source} → {move.target}"
+                    for move in hint.moves
+                ]
+                st.info(f"💡 Try: {', '.join(steps)}")
 
 def display_rules():
     """Display game rules using native Streamlit."""
@@ -407,9 +421,7 @@ def main_menu():
                     game_id, player_id = game_manager.create_game(player_name)
                     st.session_state.game_id = game_id
                     st.session_state.player_id = player_id
-                    st.balloons()
-                    st.success(f"Game created! ID: **{game_id[:8]}...**")
-                    time.sleep(1)
+                    flash(f"Game created! ID: **{game_id[:8]}...**", celebrate=True)
                     st.rerun()
                 except Exception as e:
                     st.error(f"Error: {e}")
@@ -423,8 +435,7 @@ def main_menu():
                     if player_id:
                         st.session_state.game_id = game_id_input
                         st.session_state.player_id = player_id
-                        st.success("Joined game!")
-                        time.sleep(1)
+                        flash("Joined game!")
                         st.rerun()
                     else:
                         st.error("Could not join game!")
@@ -452,21 +463,33 @@ def game_lobby(game_state):
         
         st.markdown("### 👥 Players")
         for i, player in enumerate(game_state['players']):
-            emoji = "👑" if player['id'] == st.session_state.player_id else "👤"
+            emoji = "👑" if i == game_state['seat'] else "🤖" if player.get('bot') else "👤"
             host = " (Host)" if i == 0 else ""
-            you = " (You)" if player['id'] == st.session_state.player_id else ""
+            you = " (You)" if i == game_state['seat'] else ""
             st.write(f"{emoji} **{player['name']}**{host}{you}")
         
         player_count = len(game_state['players'])
         st.info(f"Players: {player_count}/4 (minimum 2 to start)")
         
+        if player_count < 4:
+            bot_col, policy_col = st.columns([1, 1])
+            with policy_col:
+                policy = st.selectbox("Bot strategy", sorted(BOT_POLICIES),
+                                      index=sorted(BOT_POLICIES).index("greedy"),
+                                      label_visibility="collapsed")
+            with bot_col:
+                if st.button("🤖 Add Bot", use_container_width=True):
+                    if game_manager.add_bot(st.session_state.game_id, policy):
+                        flash(f"Added a {policy} bot")
+                        st.rerun()
+                    else:
+                        st.error("Could not add a bot")
+        
         if player_count >= 2:
             if st.button("🚀 Start Game", use_container_width=True, type="primary"):
                 try:
                     if game_manager.start_game(st.session_state.game_id, st.session_state.player_id):
-                        st.balloons()
-                        st.success("Game started!")
-                        time.sleep(1)
+                        flash("Game started!", celebrate=True)
                         st.rerun()
                     else:
                         st.error("Could not start game")
@@ -477,12 +500,9 @@ def game_lobby(game_state):
 
 def main_game_interface(game_state):
     """Main game interface."""
-    # Find player data
-    player_data = None
-    for player in game_state['players']:
-        if player['id'] == st.session_state.player_id:
-            player_data = player
-            break
+    # The view only carries our own hand, at our seat
+    seat = game_state['seat']
+    player_data = game_state['players'][seat] if seat is not None else None
     
     # Game status
     is_my_turn = display_game_status(game_state)
@@ -513,19 +533,58 @@ def main_game_interface(game_state):
                 hand_summary.append(get_card_display(card))
             st.info(f"Cards ({len(player_data['hand'])}): {', '.join(hand_summary)}")
 
+# Seconds between checks of the change feed, and between the fallback
+# checks of the store itself for changes the feed cannot see, such as the
+# game expiring: fast right after a change, backing off a little while the
+# game sits idle
+POLL_INTERVAL_MIN = 1.0
+POLL_INTERVAL_MAX = 4.0
+
+@st.cache_resource
+def get_change_feed():
+    """One ChangeFeed per server process, shared by every page."""
+    return ChangeFeed(game_manager)
+
+@st.fragment(run_every=POLL_INTERVAL_MIN)
+def watch_for_updates():
+    """Rerun the page when the game's version moves past the one shown.
+    
+    The change feed is filled by store listeners, so the check is a dict
+    lookup and an idle client holds no script thread between ticks.
+    """
+    latest = get_change_feed().latest_version(st.session_state.game_id)
+    if latest is not None and latest > st.session_state.state_version:
+        st.rerun()
+    if time.monotonic() < st.session_state.next_poll:
+        return
+    version = game_manager.get_version(st.session_state.game_id)
+    if version != st.session_state.state_version:
+        st.rerun()
+    interval = st.session_state.poll_interval = min(
+        st.session_state.poll_interval * 2, POLL_INTERVAL_MAX
+    )
+    st.session_state.next_poll = time.monotonic() + interval
+
+@st.cache_resource
+def get_bot_runner():
+    """One BotRunner per server process, taking every bot's turns."""
+    return BotRunner(game_manager).start()
+
 def main():
     """Main application."""
     init_session_state()
-    
-    # Auto-refresh for multiplayer
-    st_autorefresh(interval=3000, key="main_refresh")
+    get_bot_runner()
+    get_change_feed()
+    show_flash_messages()
     
     # Navigation
     try:
         if not st.session_state.game_id or not st.session_state.player_id:
             main_menu()
         else:
-            game_state = game_manager.get_game_state(st.session_state.game_id)
+            game_state = game_manager.get_player_view(
+                st.session_state.game_id, st.session_state.player_id
+            )
             
             if not game_state:
                 st.error("⚠️ Game not found!")
@@ -536,6 +595,13 @@ def main():
                     st.rerun()
                 return
             
+            # Multiplayer updates: the page is rebuilt only on a new version
+            if game_state['version'] != st.session_state.state_version:
+                st.session_state.poll_interval = POLL_INTERVAL_MIN
+                st.session_state.next_poll = 0.0
+            st.session_state.state_version = game_state['version']
+            watch_for_updates()
+            
             if game_state['game_over']:
                 st.balloons()
                 st.success(f"🎉 **{game_state['winner']}** wins!")
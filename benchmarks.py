@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the rules engine and the session manager.
+
+Each benchmark times one hot path, from single card checks up to whole
+simulated games, and reports the best of several rounds as nanoseconds per
+operation. Results are written as JSON and compared against a stored
+baseline; any benchmark more than --tolerance slower than its baseline is
+reported as a regression and the run exits non-zero, as it does when there
+is no baseline to compare with.
+
+Usage:
+    python benchmarks.py -o results.json                 # run and compare
+    python benchmarks.py --save-baseline                 # record a new baseline
+    python benchmarks.py manager_play_card --rounds 3    # run some benchmarks only
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cards import CARDS, Deck, GamePile
+from codec import decode_game, encode_game, sample_game
+from game_manager import GameSessionManager
+from simulate import play_game
+from storage import InMemoryGameStore
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks_baseline.json")
+DEFAULT_ROUNDS = 10
+# How much slower than the baseline counts as a regression, as a fraction.
+# Timings on a shared machine can swing by half between runs, so by default
+# only a doubling fails; pass a tighter --tolerance on quiet hardware.
+DEFAULT_TOLERANCE = 1.0
+LIVE_GAMES = 2000
+
+# A benchmark builds fresh state, untimed, and returns a callable to time
+# plus the number of operations one call performs
+Benchmark = Callable[[], Tuple[Callable[[], object], int]]
+
+
+def bench_can_play_on():
+    """Card.can_play_on for every pair of cards, on foundations and corners."""
+    pairs = [(card, top) for card in CARDS for top in CARDS]
+
+    def run():
+        for _ in range(20):
+            for card, top in pairs:
+                card.can_play_on(top, "foundation")
+                card.can_play_on(top, "corner")
+    return run, 20 * 2 * len(pairs)
+
+
+def bench_deck_deal():
+    """Shuffle a seeded Deck and deal four 7-card hands."""
+    def run():
+        for seed in range(1000):
+            deck = Deck(seed)
+            for _ in range(4):
+                deck.deal(7)
+    return run, 1000
+
+
+def bench_pile_add_card():
+    """GamePile.add_card building descending piles, each card validated."""
+    # K♥ Q♣ J♥ 10♣ ... A♥, a full legal pile
+    chain = [CARDS[value - 1 + 26 * (value % 2 == 0)] for value in range(13, 0, -1)]
+
+    def run():
+        for _ in range(5000):
+            pile = GamePile("Northeast", "corner")
+            for card in chain:
+                pile.add_card(card)
+    return run, 5000 * len(chain)
+
+
+def bench_move_pile():
+    """GamePile.move_pile_to, moving Q♦ J♠ onto a K♣."""
+    piles = []
+    for _ in range(20000):
+        source, target = GamePile("North"), GamePile("South")
+        source.cards = [CARDS[24], CARDS[49]]  # Q♦ J♠
+        target.cards = [CARDS[38]]  # K♣
+        piles.append((source, target))
+
+    def run():
+        for source, target in piles:
+            source.move_pile_to(target)
+    return run, len(piles)
+
+
+def bench_get_game_state():
+    """get_game_state of a finished 4-player game with warm caches."""
+    game = sample_game()
+    game.get_game_state()
+
+    def run():
+        for _ in range(5000):
+            game.get_game_state()
+    return run, 5000
+
+
+def bench_get_game_state_cold():
+    """get_game_state of freshly restored games, every hand and pile serialized."""
+    data = encode_game(sample_game())
+    games = [decode_game(data) for _ in range(1000)]
+
+    def run():
+        for game in games:
+            game.get_game_state()
+    return run, len(games)
+
+
+def bench_manager_play_card():
+    """GameSessionManager.play_card, one legal play in each of LIVE_GAMES live games."""
+    manager = GameSessionManager(InMemoryGameStore(sweep_interval=None))
+    plays = []
+    while len(plays) < LIVE_GAMES:
+        game_id, host = manager.create_game("Alice")
+        manager.join_game(game_id, "Bob")
+        manager.start_game(game_id, host)
+        game = manager.get_game(game_id)
+        player = game.get_current_player()
+        move = next((move for move in game.legal_moves(player.id) if move.kind == "play"), None)
+        if move is not None:
+            plays.append((player.id, move.card.rank, move.card.suit.value, move.target))
+
+    def run():
+        for player_id, rank, suit_symbol, pile_name in plays:
+            manager.play_card(player_id, rank, suit_symbol, pile_name)
+    return run, len(plays)
+
+
+def bench_simulated_game():
+    """A full 2-player game between greedy players."""
+    def run():
+        for seed in range(20):
+            play_game(seed)
+    return run, 20
+
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    'can_play_on': bench_can_play_on,
+    'deck_deal': bench_deck_deal,
+    'pile_add_card': bench_pile_add_card,
+    'move_pile': bench_move_pile,
+    'get_game_state': bench_get_game_state,
+    'get_game_state_cold': bench_get_game_state_cold,
+    'manager_play_card': bench_manager_play_card,
+    'simulated_game': bench_simulated_game,
+}
+
+
+def run_benchmarks(names: Optional[List[str]] = None, rounds: int = DEFAULT_ROUNDS) -> Dict:
+    """Run benchmarks by name (all by default) and return their results.
+
+    Every round builds fresh state; the fastest round is kept, since
+    slower ones only measure interference.
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        best = float('inf')
+        for _ in range(rounds):
+            run, ops = BENCHMARKS[name]()
+            # Like timeit, keep the collector out of the timings
+            gc.collect()
+            gc.disable()
+            try:
+                started = time.perf_counter()
+                run()
+                best = min(best, (time.perf_counter() - started) / ops)
+            finally:
+                gc.enable()
+        results[name] = {'ns_per_op': round(best * 1e9, 1), 'ops_per_second': round(1 / best, 1)}
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'rounds': rounds,
+        'results': results,
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float = DEFAULT_TOLERANCE) -> List[Tuple[str, float]]:
+    """Return (name, ratio to baseline) for every benchmark slower than allowed.
+
+    Benchmarks missing from either side are skipped.
+    """
+    regressions = []
+    for name, result in results['results'].items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            continue
+        ratio = result['ns_per_op'] / reference['ns_per_op']
+        if ratio > 1 + tolerance:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark the rules engine and session manager.")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS)
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="write the results to the baseline file instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        if not args.save_baseline:
+            parser.error(f"no baseline at {args.baseline}; record one with --save-baseline")
+        baseline = {'results': {}}
+
+    results = run_benchmarks(args.names, args.rounds)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        # Benchmarks that were not run keep their old baseline
+        baseline = {**results, 'results': {**baseline['results'], **results['results']}}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+
+    for name, result in results['results'].items():
+        reference = baseline['results'].get(name)
+        change = f"{result['ns_per_op'] / reference['ns_per_op'] - 1:+7.1%}" if reference else "    new"
+        print(f"{name:<20} {result['ns_per_op']:>14,.1f} ns/op {result['ops_per_second']:>14,.1f} ops/s  {change}")
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, ratio in regressions:
+        print(f"REGRESSION: {name} is {ratio:.2f}x its baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+Bitboard game-state engine for high-speed Kings in the Corner simulation.
+
+Hands are 52-bit integer masks (bit n set means card id n is held) and each
+pile is a (bottom, top, length) tuple. The cards in between are kept as a
+per-card "below" link, so playing a card or moving a whole pile only touches
+a constant number of slots and can be undone in O(1).
+"""
+from typing import List, Optional, Tuple
+
+from cards import ALL_CARDS_MASK, CARDS, KINGS_MASK, PLAYABLE_ON
+from game import KingsCornerGame, Move, Player
+from zobrist import position_hash
+
+# Pile indexes follow KingsCornerGame.piles order: 4 foundations, then corners
+PILE_NAMES = ('north', 'south', 'east', 'west', 'ne', 'nw', 'se', 'sw')
+PILE_INDEX = {name: index for index, name in enumerate(PILE_NAMES)}
+FIRST_CORNER = 4
+
+NO_CARD = -1
+EMPTY_PILE = (NO_CARD, NO_CARD, 0)
+
+# Move kinds: (PLAY, card_id, pile), (MOVE, source, target), (DRAW,), (END,)
+PLAY, MOVE, DRAW, END = 0, 1, 2, 3
+
+
+def iter_cards(mask: int):
+    """Yield the card ids set in a mask, lowest first."""
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+def to_move(move: Tuple) -> Move:
+    """Convert a PLAY or MOVE tuple into the game's Move."""
+    if move[0] == PLAY:
+        return Move("play", PILE_NAMES[move[2]], CARDS[move[1]])
+    return Move("move", PILE_NAMES[move[2]], source=PILE_NAMES[move[1]])
+
+
+class BitboardState:
+    """Compact, mutable game state with O(1) apply and undo.
+
+    Actions validate their own legality and return False without changing
+    anything when refused, mirroring KingsCornerGame. Every accepted action
+    pushes an undo record, so search code can apply, recurse and undo()
+    instead of cloning.
+    """
+    __slots__ = ('game_id', 'seed', 'players', 'hands', 'piles', 'below', 'deck',
+                 'deck_len', 'current', 'turn_actions', 'started', 'winner',
+                 '_undo')
+
+    def __init__(self, game_id: str, players: Tuple[Tuple[str, str, Optional[str]], ...],
+                 hands: List[int], piles: List[Tuple[int, int, int]],
+                 below: List[int], deck: List[int], deck_len: int,
+                 current: int = 0, turn_actions: int = 0,
+                 started: bool = True, winner: Optional[int] = None,
+                 seed: Optional[int] = None):
+        self.game_id = game_id
+        self.seed = seed
+        self.players = players  # ((player_id, name, bot), ...) in seat order
+        self.hands = hands
+        self.piles = piles
+        self.below = below
+        self.deck = deck  # card ids, drawn from deck[deck_len - 1] downwards
+        self.deck_len = deck_len
+        self.current = current
+        self.turn_actions = turn_actions
+        self.started = started
+        self.winner = winner
+        self._undo = []
+
+    @classmethod
+    def from_game(cls, game: KingsCornerGame) -> 'BitboardState':
+        """Pack a KingsCornerGame into a bitboard state.
+
+        Hands become sets, so the order of cards within a hand is not kept;
+        everything else round-trips exactly through to_game().
+        """
+        hands = [player.hand.mask for player in game.players]
+
+        below = [NO_CARD] * 52
+        piles = []
+        for name in PILE_NAMES:
+            cards = game.piles[name].cards
+            if not cards:
+                piles.append(EMPTY_PILE)
+                continue
+            previous = NO_CARD
+            for card in cards:
+                below[card.id] = previous
+                previous = card.id
+            piles.append((cards[0].id, cards[-1].id, len(cards)))
+
+        deck = [card.id for card in game.deck.cards]
+        winner = game.players.index(game.winner) if game.winner else None
+        return cls(
+            game.game_id,
+            tuple((player.id, player.name, player.bot) for player in game.players),
+            hands, piles, below, deck, len(deck),
+            current=game.current_player_index,
+            turn_actions=game.turn_actions_taken,
+            started=game.game_started,
+            winner=winner,
+            seed=game.seed,
+        )
+
+    def to_game(self) -> KingsCornerGame:
+        """Unpack this state into a new KingsCornerGame."""
+        game = KingsCornerGame(self.game_id, seed=self.seed)
+        for (player_id, name, bot), mask in zip(self.players, self.hands):
+            game.players.append(
+                Player(player_id, name, [CARDS[card_id] for card_id in iter_cards(mask)], bot)
+            )
+        for index, name in enumerate(PILE_NAMES):
+            game.piles[name].cards = self.pile_cards(index)
+        game.deck.cards = [CARDS[card_id] for card_id in self.deck[:self.deck_len]]
+        game.current_player_index = self.current
+        game.turn_actions_taken = self.turn_actions
+        game.game_started = self.started
+        game.game_over = self.winner is not None
+        game.winner = game.players[self.winner] if self.winner is not None else None
+        game.position_hash = position_hash(game)
+        return game
+
+    def copy(self) -> 'BitboardState':
+        """Return an independent copy with an empty undo history."""
+        return BitboardState(
+            self.game_id, self.players, self.hands[:], self.piles[:],
+            self.below[:], self.deck, self.deck_len, self.current,
+            self.turn_actions, self.started, self.winner, self.seed,
+        )
+
+    def pile_cards(self, pile: int) -> List:
+        """Return a pile's cards bottom-to-top by walking the below links."""
+        cards = []
+        card_id = self.piles[pile][1]
+        while card_id != NO_CARD:
+            cards.append(CARDS[card_id])
+            card_id = self.below[card_id]
+        cards.reverse()
+        return cards
+
+    def accepted(self, pile: int) -> int:
+        """Return the bitmask of card ids that may be added to a pile."""
+        top = self.piles[pile][1]
+        if top != NO_CARD:
+            return PLAYABLE_ON[top]
+        return KINGS_MASK if pile >= FIRST_CORNER else ALL_CARDS_MASK
+
+    @property
+    def game_over(self) -> bool:
+        return self.winner is not None
+
+    def play_card(self, card_id: int, pile: int) -> bool:
+        """Play a card from the current player's hand onto a pile."""
+        bit = 1 << card_id
+        player = self.current
+        hand = self.hands[player]
+        if (not self.started or self.winner is not None
+                or not hand & bit or not bit & self.accepted(pile)):
+            return False
+
+        previous = self.piles[pile]
+        bottom, top, length = previous
+        self.below[card_id] = top
+        self.piles[pile] = (bottom if length else card_id, card_id, length + 1)
+        self.hands[player] = hand ^ bit
+        self.turn_actions += 1
+        self._undo.append((PLAY, card_id, pile, previous))
+        if hand == bit:
+            self.winner = player
+        return True
+
+    def move_pile(self, source: int, target: int) -> bool:
+        """Move an entire pile onto another pile."""
+        if not self.started or self.winner is not None or source == target:
+            return False
+        moved = self.piles[source]
+        if not moved[2] or not (1 << moved[0]) & self.accepted(target):
+            return False
+
+        previous = self.piles[target]
+        self.below[moved[0]] = previous[1]
+        self.piles[target] = (previous[0] if previous[2] else moved[0],
+                              moved[1], previous[2] + moved[2])
+        self.piles[source] = EMPTY_PILE
+        self.turn_actions += 1
+        self._undo.append((MOVE, source, target, moved, previous))
+        return True
+
+    def draw_card(self) -> bool:
+        """Draw a card into the current player's hand and end the turn."""
+        if not self.started or self.winner is not None or not self.deck_len:
+            return False
+
+        self.deck_len -= 1
+        player = self.current
+        self.hands[player] |= 1 << self.deck[self.deck_len]
+        self._undo.append((DRAW, player, self.turn_actions))
+        self.current = (player + 1) % len(self.players)
+        self.turn_actions = 0
+        return True
+
+    def end_turn(self) -> bool:
+        """End the current player's turn without drawing."""
+        if not self.started or self.winner is not None:
+            return False
+        self._undo.append((END, self.current, self.turn_actions))
+        self.current = (self.current + 1) % len(self.players)
+        self.turn_actions = 0
+        return True
+
+    def apply(self, move: Tuple) -> bool:
+        """Apply a move tuple as produced by legal_moves()."""
+        kind = move[0]
+        if kind == PLAY:
+            return self.play_card(move[1], move[2])
+        if kind == MOVE:
+            return self.move_pile(move[1], move[2])
+        if kind == DRAW:
+            return self.draw_card()
+        return self.end_turn()
+
+    def undo(self):
+        """Revert the most recent accepted action."""
+        record = self._undo.pop()
+        kind = record[0]
+        if kind == PLAY:
+            _, card_id, pile, previous = record
+            self.piles[pile] = previous
+            self.below[card_id] = NO_CARD
+            self.hands[self.current] |= 1 << card_id
+            self.turn_actions -= 1
+            self.winner = None
+        elif kind == MOVE:
+            _, source, target, moved, previous = record
+            self.below[moved[0]] = NO_CARD
+            self.piles[source] = moved
+            self.piles[target] = previous
+            self.turn_actions -= 1
+        else:
+            _, player, turn_actions = record
+            self.current = player
+            self.turn_actions = turn_actions
+            if kind == DRAW:
+                self.hands[player] ^= 1 << self.deck[self.deck_len]
+                self.deck_len += 1
+
+    def legal_moves(self) -> List[Tuple]:
+        """Return every card play and pile move for the current player."""
+        if not self.started or self.winner is not None:
+            return []
+
+        hand = self.hands[self.current]
+        accepted = [self.accepted(pile) for pile in range(8)]
+        moves = []
+        for pile, mask in enumerate(accepted):
+            for card_id in iter_cards(hand & mask):
+                moves.append((PLAY, card_id, pile))
+        for source, (bottom, _, length) in enumerate(self.piles):
+            if not length:
+                continue
+            bit = 1 << bottom
+            for target, mask in enumerate(accepted):
+                if target != source and bit & mask:
+                    moves.append((MOVE, source, target))
+        return moves
+
+    def useful_moves(self) -> List[Tuple]:
+        """Return legal_moves() without pile moves that only relabel a pile.
+
+        Mirrors simulate.useful_moves: moving a pile onto an empty pile is
+        dropped unless it carries a King off a foundation into a corner.
+        """
+        return [
+            move for move in self.legal_moves()
+            if move[0] == PLAY or self.piles[move[2]][2]
+            or (move[2] >= FIRST_CORNER and move[1] < FIRST_CORNER)
+        ]
@@ -0,0 +1,177 @@
+"""
+Server-side bot players for Kings in the Corner.
+
+Bots fill empty seats so a lobby can start without a second human. A
+BotRunner watches a GameSessionManager through its change listener and,
+whenever a bot is to move, takes that bot's turn on a worker thread through
+the same play_card / move_pile / draw_card paths humans use. Decisions are
+made on a private copy of the game, so no game lock is held while a bot
+thinks, and each move has a hard time budget.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Set
+
+from game import KingsCornerGame, Move, Player
+from search import ismcts_policy
+from simulate import MAX_ACTIONS_PER_TURN, greedy_policy, lookahead_policy, random_policy
+from solver import solver_policy
+
+logger = logging.getLogger(__name__)
+
+# (game, player_id, rng, deadline) -> move to make, or None to finish the turn
+BotPolicy = Callable[[KingsCornerGame, str, random.Random, float], Optional[Move]]
+
+
+def _untimed(policy) -> BotPolicy:
+    """Adapt a simulator policy that is always fast enough to ignore the deadline."""
+    return lambda game, player_id, rng, deadline: policy(game, player_id, rng)
+
+
+BOT_POLICIES: Dict[str, BotPolicy] = {
+    'random': _untimed(random_policy),
+    'greedy': _untimed(greedy_policy),
+    'lookahead': lookahead_policy,
+    'ismcts': ismcts_policy,
+    'solver': solver_policy,
+}
+
+DEFAULT_MOVE_BUDGET = 0.25  # seconds a bot may think about one move
+RETRY_DELAY = 5.0  # seconds before retrying a game whose bot turn failed
+
+
+class BotRunner:
+    """Takes bots' turns on a small thread pool whenever one is to move.
+
+    Call start() to begin watching the manager and close() to stop; start()
+    also picks up games already waiting on a bot, such as those reloaded
+    after a restart. Games are scheduled at most once at a time, so a burst
+    of changes to one game never queues duplicate work, and a slow bot only
+    ever occupies its own worker, never a request thread. A bot whose policy
+    fails still finishes its turn, and a turn that fails outright is retried
+    after RETRY_DELAY, so a table is never left waiting on a bot.
+    """
+
+    def __init__(self, manager, workers: int = 2, move_budget: float = DEFAULT_MOVE_BUDGET,
+                 seed: Optional[int] = None):
+        self.manager = manager
+        self.move_budget = move_budget
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bot")
+        self._scheduled: Set[str] = set()
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._closed = False
+
+    def start(self) -> 'BotRunner':
+        self.manager.add_listener(self._on_change)
+        # Listing every game can be slow, so do it on a worker
+        self._executor.submit(self._schedule_waiting)
+        return self
+
+    def close(self, wait: bool = True):
+        self._closed = True
+        self.manager.remove_listener(self._on_change)
+        self._executor.shutdown(wait=wait)
+
+    def _schedule_waiting(self):
+        """Schedule every live game that is waiting on a bot."""
+        try:
+            for game in self.manager.list_active_games():
+                if game['started'] and not game['game_over']:
+                    self.schedule(game['game_id'])
+        except Exception:
+            logger.exception("Could not look for games waiting on bots")
+
+    def _on_change(self, game_id: str, version: int):
+        self.schedule(game_id)
+
+    def schedule(self, game_id: str):
+        """Queue the game's bot turns if a bot is to move and none are queued."""
+        if self._closed or self._bot_to_move(game_id) is None:
+            return
+        with self._lock:
+            if game_id in self._scheduled:
+                return
+            self._scheduled.add(game_id)
+        self._executor.submit(self._run, game_id)
+
+    def _bot_to_move(self, game_id: str) -> Optional[Player]:
+        game = self.manager.get_game(game_id)
+        if not game or not game.game_started or game.game_over:
+            return None
+        player = game.get_current_player()
+        return player if player and player.bot else None
+
+    def _run(self, game_id: str):
+        owned = True  # whether this run holds the game's place in _scheduled
+        try:
+            idle_turns = 0
+            while True:
+                player = self._bot_to_move(game_id)
+                while player is not None:
+                    acted = self._take_turn(game_id, player)
+                    # Bots alone at a table with an empty deck would pass forever
+                    idle_turns = 0 if acted else idle_turns + 1
+                    if idle_turns > 4:
+                        break
+                    player = self._bot_to_move(game_id)
+
+                with self._lock:
+                    self._scheduled.discard(game_id)
+                owned = False
+                # A human may have handed the turn to a bot while we were finishing
+                if idle_turns > 4 or self._bot_to_move(game_id) is None:
+                    return
+                with self._lock:
+                    if game_id in self._scheduled:
+                        return
+                    self._scheduled.add(game_id)
+                owned = True
+        except Exception:
+            # Nothing waits on this future, so report the error here and
+            # try again later, in case no other change reschedules the game
+            logger.exception("Bot turn failed in game %s", game_id)
+            retry = threading.Timer(RETRY_DELAY, self.schedule, args=(game_id,))
+            retry.daemon = True
+            retry.start()
+        finally:
+            if owned:
+                with self._lock:
+                    self._scheduled.discard(game_id)
+
+    def _take_turn(self, game_id: str, player: Player) -> bool:
+        """Play one full turn for a bot; returns whether it played anything."""
+        policy = BOT_POLICIES.get(player.bot, BOT_POLICIES['greedy'])
+        acted = False
+        try:
+            for _ in range(MAX_ACTIONS_PER_TURN):
+                game = self.manager.copy_game(game_id)
+                if game is None or game.game_over or game.get_current_player().id != player.id:
+                    return acted
+                move = policy(game, player.id, self._rng, time.monotonic() + self.move_budget)
+                if move is None:
+                    break
+                if move.kind == "play":
+                    success, _ = self.manager.play_card(
+                        player.id, move.card.rank, move.card.suit.value, move.target
+                    )
+                else:
+                    success, _ = self.manager.move_pile(player.id, move.source, move.target)
+                if not success:
+                    break
+                acted = True
+        except Exception:
+            # Finish the turn anyway, or the table would wait on this bot forever
+            logger.exception("Bot %s failed to choose a move in game %s", player.name, game_id)
+
+        game = self.manager.get_game(game_id)
+        if game is None or game.game_over or game.get_current_player().id != player.id:
+            return acted
+        if game.deck.is_empty():
+            self.manager.end_turn(player.id)
+        else:
+            self.manager.draw_card(player.id)
+        return acted
@@ -2,8 +2,7 @@
 Card and Deck classes for Kings in the Corner game.
 """
 import random
-from typing import List, Optional
-from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
 from enum import Enum
 
 
@@ -19,16 +18,41 @@ class Color(Enum):
     BLACK = "black"
 
 
-@dataclass
+SUITS = tuple(Suit)
+RANKS = ("A", "2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K")
+VALUES = (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13)
+
+
 class Card:
-    """Represents a playing card."""
-    suit: Suit
-    rank: str
-    value: int
-    
-    def __post_init__(self):
-        self.color = Color.RED if self.suit in [Suit.HEARTS, Suit.DIAMONDS] else Color.BLACK
-    
+    """Represents a playing card.
+
+    Cards are interned flyweights: there are exactly 52 instances, one per
+    card id (``suit_index * 13 + value - 1``), and ``Card(suit, rank, value)``
+    returns the shared instance instead of allocating a new one.
+    """
+    __slots__ = ('id', 'suit', 'rank', 'value', 'color', 'bit')
+
+    def __new__(cls, suit: Suit, rank: str, value: Optional[int] = None) -> 'Card':
+        card = _CARD_BY_SUIT_RANK.get((suit, rank))
+        if card is None:
+            raise ValueError(f"Invalid card: {rank} of {suit}")
+        if value is not None and value != card.value:
+            raise ValueError(f"Invalid value {value} for rank {rank}")
+        return card
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Card is immutable")
+
+    def __reduce__(self):
+        # Unpickle to the shared instance so multiprocessing keeps cards interned
+        return card_from_id, (self.id,)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
     @property
     def display_name(self):
         """Return the display name of the card."""
@@ -40,39 +64,110 @@ class Card:
             # Empty pile rules depend on pile type
             if pile_type == "corner":
                 # Corner piles can only start with Kings
-                return self.rank == "K"
+                return self.value == 13
             else:
                 # Foundation piles can start with any card
                 return True
         
         # Must be descending order and alternating colors
-        return (self.value == other.value - 1 and 
-                self.color != other.color)
+        return bool(PLAYABLE_ON[other.id] & self.bit)
     
+    def __repr__(self):
+        return f"Card(suit={self.suit!r}, rank={self.rank!r}, value={self.value})"
+
     def __str__(self):
         return self.display_name
 
 
+def _build_card(card_id: int) -> Card:
+    """Allocate the interned card for a card id."""
+    card = object.__new__(Card)
+    suit = SUITS[card_id // 13]
+    for name, value in (
+        ('id', card_id),
+        ('suit', suit),
+        ('rank', RANKS[card_id % 13]),
+        ('value', VALUES[card_id % 13]),
+        ('color', Color.RED if suit in (Suit.HEARTS, Suit.DIAMONDS) else Color.BLACK),
+        ('bit', 1 << card_id),
+    ):
+        object.__setattr__(card, name, value)
+    return card
+
+
+# The 52 interned cards, indexed by card id
+CARDS = tuple(_build_card(card_id) for card_id in range(52))
+
+# Per-card lookup tables, indexed by card id
+CARD_VALUES = tuple(card.value for card in CARDS)
+CARD_COLORS = tuple(card.color for card in CARDS)
+
+# Bitmask of the cards that may be played on each card (one lower, opposite
+# color), indexed by the card id of the pile top
+PLAYABLE_ON = tuple(
+    sum(card.bit for card in CARDS
+        if card.value == top.value - 1 and card.color is not top.color)
+    for top in CARDS
+)
+ALL_CARDS_MASK = (1 << 52) - 1
+KINGS_MASK = sum(card.bit for card in CARDS if card.value == 13)
+
+# Serialized form of each card, shared by every game state; do not modify
+CARD_DICTS = tuple(
+    {'rank': card.rank, 'suit': card.suit.value, 'color': card.color.value}
+    for card in CARDS
+)
+
+_CARD_BY_SUIT_RANK = {(card.suit, card.rank): card for card in CARDS}
+
+# Decode tables for the (rank, suit symbol) pairs used by the UI
+SUIT_BY_SYMBOL = {suit.value: suit for suit in Suit}
+CARD_BY_SYMBOLS = {(card.rank, card.suit.value): card for card in CARDS}
+
+
+def card_from_id(card_id: int) -> Card:
+    """Return the interned card for a card id (0..51)."""
+    return CARDS[card_id]
+
+
+def card_from_symbols(rank: str, suit_symbol: str) -> Optional[Card]:
+    """Return the card for a rank and suit symbol such as ("10", "♥")."""
+    return CARD_BY_SYMBOLS.get((rank, suit_symbol))
+
+
 class Deck:
-    """Represents a deck of playing cards."""
+    """Represents a deck of playing cards.
+    
+    Shuffling draws from the deck's own RNG: pass a seed for a reproducible
+    deal, or a random.Random instance to share an existing generator. Pass
+    `cards` (top card last) to restore a dealt deck without shuffling.
+    """
     
-    def __init__(self):
+    def __init__(self, seed: Optional[int] = None, rng: Optional[random.Random] = None,
+                 cards: Optional[List[Card]] = None):
+        self._seed = seed
+        self._rng = rng
         self.cards: List[Card] = []
-        self._create_deck()
-        self.shuffle()
+        if cards is None:
+            self._create_deck()
+            self.shuffle()
+        else:
+            self.cards = list(cards)
+    
+    @property
+    def rng(self) -> random.Random:
+        # Created on first use, so restored decks skip seeding a generator
+        if self._rng is None:
+            self._rng = random.Random(self._seed)
+        return self._rng
     
     def _create_deck(self):
-        """Create a standard 52-card deck."""
-        ranks = ["A", "2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K"]
-        values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13]
-        
-        for suit in Suit:
-            for rank, value in zip(ranks, values):
-                self.cards.append(Card(suit, rank, value))
+        """Create a standard 52-card deck from the interned cards."""
+        self.cards = list(CARDS)
     
     def shuffle(self):
         """Shuffle the deck."""
-        random.shuffle(self.cards)
+        self.rng.shuffle(self.cards)
     
     def deal(self, num_cards: int) -> List[Card]:
         """Deal a specified number of cards from the deck."""
@@ -94,6 +189,60 @@ class Deck:
         return len(self.cards)
 
 
+class Hand:
+    """A player's cards, in the order they were received.
+    
+    Backed by an insertion-ordered dict keyed by the interned cards plus a
+    bitmask of card ids, so membership, append and remove are O(1)
+    whatever the hand size.
+    """
+    __slots__ = ('_cards', 'mask', '_state')
+    
+    def __init__(self, cards: Iterable[Card] = ()):
+        self._cards: Dict[Card, None] = dict.fromkeys(cards)
+        self.mask = 0
+        for card in self._cards:
+            self.mask |= card.bit
+        self._state: Optional[List[Dict]] = None
+    
+    def append(self, card: Card):
+        """Add a card to the hand."""
+        self._cards[card] = None
+        self.mask |= card.bit
+        self._state = None
+    
+    def remove(self, card: Card):
+        """Remove a card, raising ValueError if it is not in the hand."""
+        if not self.mask & card.bit:
+            raise ValueError(f"{card} not in hand")
+        del self._cards[card]
+        self.mask ^= card.bit
+        self._state = None
+    
+    def to_state(self) -> List[Dict]:
+        """Serialize the hand for get_game_state, cached until it changes."""
+        if self._state is None:
+            self._state = [CARD_DICTS[card.id] for card in self._cards]
+        return self._state
+    
+    def __contains__(self, card) -> bool:
+        return bool(self.mask & card.bit)
+    
+    def __iter__(self):
+        return iter(self._cards)
+    
+    def __len__(self):
+        return len(self._cards)
+    
+    def __eq__(self, other):
+        if isinstance(other, (Hand, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+    
+    def __repr__(self):
+        return f"Hand({list(self._cards)!r})"
+
+
 class GamePile:
     """Represents a pile of cards in the game."""
     
@@ -101,6 +250,8 @@ class GamePile:
         self.name = name
         self.pile_type = pile_type  # "foundation" or "corner"
         self.cards: List[Card] = []
+        # include_cards -> (cards list, length, serialized pile)
+        self._state_cache: Dict[bool, tuple] = {}
     
     def add_card(self, card: Card, force: bool = False) -> bool:
         """Add a card to the pile if valid or forced."""
@@ -118,6 +269,16 @@ class GamePile:
         """Get the top card of the pile."""
         return self.cards[-1] if self.cards else None
     
+    def get_bottom_card(self) -> Optional[Card]:
+        """Get the bottom card of the pile (the one that moves with it)."""
+        return self.cards[0] if self.cards else None
+    
+    def accepted_mask(self) -> int:
+        """Return the bitmask of card ids that may be added to this pile."""
+        if self.cards:
+            return PLAYABLE_ON[self.cards[-1].id]
+        return KINGS_MASK if self.pile_type == "corner" else ALL_CARDS_MASK
+    
     def is_empty(self) -> bool:
         """Check if the pile is empty."""
         return len(self.cards) == 0
@@ -136,6 +297,27 @@ class GamePile:
             return True
         return False
     
+    def to_state(self, include_cards: bool = True) -> Dict:
+        """Serialize the pile for get_game_state.
+        
+        Piles only grow by appending or are replaced wholesale when moved,
+        so the cached result stays valid while the same list has the same
+        length. With include_cards=False only the ends and size are sent.
+        """
+        cards = self.cards
+        cached = self._state_cache.get(include_cards)
+        if cached and cached[0] is cards and cached[1] == len(cards):
+            return cached[2]
+        
+        state = {}
+        if include_cards:
+            state['cards'] = [CARD_DICTS[card.id] for card in cards]
+        state['top_card'] = CARD_DICTS[cards[-1].id] if cards else None
+        state['bottom_card'] = CARD_DICTS[cards[0].id] if cards else None
+        state['size'] = len(cards)
+        self._state_cache[include_cards] = (cards, len(cards), state)
+        return state
+    
     def __len__(self):
         return len(self.cards)
     
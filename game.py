@@ -1,10 +1,31 @@
 """
 Main game logic for Kings in the Corner.
 """
+import random
+import secrets
 import uuid
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, NamedTuple, Optional, Tuple
 from dataclasses import dataclass, field
-from cards import Card, Deck, GamePile
+from cards import CARD_DICTS, CARDS, Card, Deck, GamePile, Hand
+from zobrist import ZOBRIST_HAND, ZOBRIST_TURN, link_key, position_hash
+
+# Take a snapshot every this many logged events, bounding replay cost
+SNAPSHOT_INTERVAL = 32
+
+# Clients further behind than this many events get a full state, not a diff
+MAX_DIFF_EVENTS = 64
+
+# Top-level state fields every diff carries; they are small and may all move
+DIFF_FIELDS = ('version', 'current_player', 'current_player_name', 'deck_size',
+               'game_over', 'winner', 'turn_actions_taken')
+
+
+class Move(NamedTuple):
+    """A legal action: play a card onto a pile, or move a whole pile."""
+    kind: str  # "play" or "move"
+    target: str
+    card: Optional[Card] = None
+    source: Optional[str] = None
 
 
 @dataclass
@@ -12,7 +33,14 @@ class Player:
     """Represents a player in the game."""
     id: str
     name: str
-    hand: List[Card] = field(default_factory=list)
+    hand: Hand = field(default_factory=Hand)
+    bot: Optional[str] = None  # policy name for server-side bots, None for humans
+    
+    def __setattr__(self, name, value):
+        # Accept any iterable of cards for the hand, stored as a Hand
+        if name == 'hand' and not isinstance(value, Hand):
+            value = Hand(value)
+        super().__setattr__(name, value)
     
     def add_card(self, card: Card):
         """Add a card to the player's hand."""
@@ -25,6 +53,10 @@ class Player:
             return True
         return False
     
+    def hand_state(self) -> List[Dict]:
+        """Serialize the hand for get_game_state, cached until it changes."""
+        return self.hand.to_state()
+    
     def has_won(self) -> bool:
         """Check if the player has won (empty hand)."""
         return len(self.hand) == 0
@@ -37,11 +69,21 @@ class Player:
 class KingsCornerGame:
     """Main game class for Kings in the Corner."""
     
-    def __init__(self, game_id: str = None):
+    def __init__(self, game_id: str = None, seed: Optional[int] = None,
+                 rng: Optional[random.Random] = None, deck: Optional[List[Card]] = None):
         self.game_id = game_id or str(uuid.uuid4())
+        
+        # The seed alone determines the deal; it is None only when the caller
+        # supplies its own RNG instance. `deck` restores the undealt cards of
+        # an existing game (top last) instead of shuffling a new deck.
+        if seed is None and rng is None and deck is None:
+            seed = secrets.randbits(63)
+        self.seed = seed
+        
         self.players: List[Player] = []
+        self._player_index: tuple = (None, 0, {})  # see get_player
         self.current_player_index = 0
-        self.deck = Deck()
+        self.deck = Deck(seed, rng, deck)
         
         # Foundation piles (4 main piles)
         self.foundation_piles = {
@@ -59,24 +101,48 @@ class KingsCornerGame:
             'sw': GamePile('Southwest', 'corner')
         }
         
+        # All eight piles by name, in board order
+        self.piles = {**self.foundation_piles, **self.corner_piles}
+        
         self.game_started = False
         self.game_over = False
         self.winner = None
         self.turn_actions_taken = 0
         self.max_actions_per_turn = 10  # Allow multiple actions per turn
         self.must_draw_to_end_turn = True  # Must draw a card to end turn
+        
+        # Append-only log of accepted actions, as compact tuples:
+        #   ("join", player_id, name[, bot])   ("start",)
+        #   ("play", player_id, card_id, pile_name)
+        #   ("plays", player_id, ((card_id, pile_name), ...))
+        #   ("move", player_id, from_pile, to_pile)
+        #   ("draw", player_id)         ("end", player_id)
+        # event_base counts the events that precede events[0], which is
+        # non-zero for games restored from a snapshot.
+        self.events: List[tuple] = []
+        self.event_base = 0
+        self.last_snapshot: Optional[Dict] = None
+        
+        # Monotonically increasing; bumped by every accepted mutation
+        self.version = 0
+        
+        # 64-bit Zobrist hash of the position (see zobrist.py), kept up to
+        # date by every action
+        self.position_hash = ZOBRIST_TURN[0]
     
-    def add_player(self, player_name: str) -> str:
-        """Add a player to the game."""
+    def add_player(self, player_name: str, player_id: Optional[str] = None,
+                   bot: Optional[str] = None) -> str:
+        """Add a player to the game; `bot` names the policy of a bot player."""
         if len(self.players) >= 4:
             raise ValueError("Game is full (max 4 players)")
         
         if self.game_started:
             raise ValueError("Game has already started")
         
-        player_id = str(uuid.uuid4())
-        player = Player(player_id, player_name)
+        player_id = player_id or str(uuid.uuid4())
+        player = Player(player_id, player_name, bot=bot)
         self.players.append(player)
+        self._record(("join", player_id, player_name) + ((bot,) if bot else ()))
         return player_id
     
     def start_game(self):
@@ -98,6 +164,19 @@ class KingsCornerGame:
         
         self.game_started = True
         self.current_player_index = 0
+        self.position_hash = position_hash(self)
+        self._record(("start",))
+    
+    def get_player(self, player_id: str) -> Optional[Player]:
+        """Get a player by id in O(1)."""
+        # Players are only ever appended or replaced as a whole list, so the
+        # index stays valid while the same list has the same length
+        cached = self._player_index
+        if cached[0] is not self.players or cached[1] != len(self.players):
+            cached = self._player_index = (
+                self.players, len(self.players), {p.id: p for p in self.players}
+            )
+        return cached[2].get(player_id)
     
     def get_current_player(self) -> Optional[Player]:
         """Get the current player."""
@@ -107,6 +186,50 @@ class KingsCornerGame:
     
     def play_card(self, player_id: str, card: Card, pile_name: str) -> Tuple[bool, str]:
         """Play a card from a player's hand to a pile."""
+        success, message = self._play(player_id, card, pile_name)
+        if success:
+            self._record(("play", player_id, card.id, pile_name))
+        return success, message
+    
+    def apply_moves(self, player_id: str, moves: List[Tuple[Card, str]]) -> Tuple[bool, List[Tuple[bool, str]]]:
+        """Play several (card, pile_name) moves as one atomic action.
+        
+        Moves are applied in order; if any is refused, everything is rolled
+        back. Returns (all applied, per-move results up to the first
+        refusal). A successful batch is logged as one event, so it costs a
+        single version bump.
+        """
+        player = self.get_player(player_id)
+        if player is None or not moves:
+            return False, [(False, "Player not found" if player is None else "No moves")]
+        
+        hand_before = list(player.hand)
+        turn_actions_before = self.turn_actions_taken
+        hash_before = self.position_hash
+        pile_sizes = {}
+        results = []
+        for card, pile_name in moves:
+            if pile_name in self.piles:
+                pile_sizes.setdefault(pile_name, len(self.piles[pile_name]))
+            result = self._play(player_id, card, pile_name)
+            results.append(result)
+            if not result[0]:
+                # Roll back: piles only grew, so truncate them to their old size
+                player.hand = hand_before
+                for name, size in pile_sizes.items():
+                    pile = self.piles[name]
+                    pile.cards = pile.cards[:size]
+                self.turn_actions_taken = turn_actions_before
+                self.position_hash = hash_before
+                self.game_over = False
+                self.winner = None
+                return False, results
+        
+        self._record(("plays", player_id, tuple((card.id, pile_name) for card, pile_name in moves)))
+        return True, results
+    
+    def _play(self, player_id: str, card: Card, pile_name: str) -> Tuple[bool, str]:
+        """Validate and apply a card play without logging it."""
         if not self.game_started or self.game_over:
             return False, "Game not in progress"
         
@@ -119,13 +242,9 @@ class KingsCornerGame:
         #     return False, "No more actions allowed this turn"
         
         # Find the target pile
-        target_pile = None
-        if pile_name in self.foundation_piles:
-            target_pile = self.foundation_piles[pile_name]
-        elif pile_name in self.corner_piles:
-            target_pile = self.corner_piles[pile_name]
+        target_pile = self._get_pile(pile_name)
         
-        if not target_pile:
+        if target_pile is None:
             return False, "Invalid pile"
         
         # Check if the move is valid
@@ -133,9 +252,12 @@ class KingsCornerGame:
             return False, "Invalid move"
         
         # Make the move
+        below = target_pile.get_top_card()
         current_player.remove_card(card)
         target_pile.add_card(card)
         self.turn_actions_taken += 1
+        self.position_hash ^= (ZOBRIST_HAND[self.current_player_index][card.id]
+                               ^ link_key(pile_name, card, below))
         
         # Check for win condition
         if current_player.has_won():
@@ -162,15 +284,18 @@ class KingsCornerGame:
         source = self._get_pile(from_pile)
         destination = self._get_pile(to_pile)
         
-        if not source or not destination:
+        if source is None or destination is None:
             return False, "Invalid pile names"
         
         if source.is_empty():
             return False, "Source pile is empty"
         
         # Attempt the move
+        bottom, below = source.get_bottom_card(), destination.get_top_card()
         if source.move_pile_to(destination):
             self.turn_actions_taken += 1
+            self.position_hash ^= link_key(from_pile, bottom, None) ^ link_key(to_pile, bottom, below)
+            self._record(("move", player_id, from_pile, to_pile))
             return True, "Pile moved successfully"
         else:
             return False, "Invalid pile move"
@@ -190,56 +315,188 @@ class KingsCornerGame:
         # Draw a card and end turn
         card = self.deck.deal(1)[0]
         current_player.add_card(card)
-        self.end_turn()
+        self.position_hash ^= ZOBRIST_HAND[self.current_player_index][card.id]
+        self._advance_turn()
+        self._record(("draw", player_id))
         return True, f"Drew {card.display_name}"
     
     def end_turn(self):
         """End the current player's turn."""
+        player_id = self.get_current_player().id
+        self._advance_turn()
+        self._record(("end", player_id))
+    
+    def _advance_turn(self):
+        """Pass play to the next player."""
         self.turn_actions_taken = 0
+        self.position_hash ^= ZOBRIST_TURN[self.current_player_index]
         self.current_player_index = (self.current_player_index + 1) % len(self.players)
+        self.position_hash ^= ZOBRIST_TURN[self.current_player_index]
+    
+    def _record(self, event: tuple):
+        """Append an accepted action to the log, snapshotting periodically."""
+        self.events.append(event)
+        self.version += 1
+        if (self.event_base + len(self.events)) % SNAPSHOT_INTERVAL == 0:
+            self.last_snapshot = self.snapshot()
+    
+    def snapshot(self) -> Dict:
+        """Capture the full position as plain data (card ids, names, indexes)."""
+        return {
+            'game_id': self.game_id,
+            'seed': self.seed,
+            'event_count': self.event_base + len(self.events),
+            'version': self.version,
+            'players': [(p.id, p.name, [c.id for c in p.hand], p.bot) for p in self.players],
+            'piles': {name: [c.id for c in pile.cards] for name, pile in self.piles.items()},
+            'deck': [c.id for c in self.deck.cards],
+            'current_player': self.current_player_index,
+            'game_started': self.game_started,
+            'game_over': self.game_over,
+            'winner': self.players.index(self.winner) if self.winner else None,
+            'turn_actions_taken': self.turn_actions_taken,
+        }
+    
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict) -> 'KingsCornerGame':
+        """Rebuild a game from snapshot(); its log starts after the snapshot."""
+        game = cls(snapshot['game_id'], seed=snapshot['seed'],
+                   deck=[CARDS[card_id] for card_id in snapshot['deck']])
+        game.players = [
+            Player(player_id, name, [CARDS[card_id] for card_id in hand], bot)
+            for player_id, name, hand, bot in snapshot['players']
+        ]
+        for name, card_ids in snapshot['piles'].items():
+            game.piles[name].cards = [CARDS[card_id] for card_id in card_ids]
+        game.current_player_index = snapshot['current_player']
+        game.game_started = snapshot['game_started']
+        game.game_over = snapshot['game_over']
+        if snapshot['winner'] is not None:
+            game.winner = game.players[snapshot['winner']]
+        game.turn_actions_taken = snapshot['turn_actions_taken']
+        game.event_base = snapshot['event_count']
+        game.version = snapshot['version']
+        game.position_hash = position_hash(game)
+        game.last_snapshot = snapshot
+        return game
+    
+    @classmethod
+    def replay(cls, seed: Optional[int], events: List[tuple], game_id: str = None,
+               snapshot: Optional[Dict] = None) -> 'KingsCornerGame':
+        """Reconstruct a game from its seed and action log.
+        
+        With a snapshot, only the events logged after it are replayed, so
+        recovery costs O(events since the last snapshot).
+        """
+        if snapshot is not None:
+            game = cls.from_snapshot(snapshot)
+        else:
+            game = cls(game_id, seed=seed)
+        for event in events:
+            game.apply_event(event)
+        return game
+    
+    def apply_event(self, event: tuple):
+        """Re-apply one logged action, raising ValueError if it is refused."""
+        kind = event[0]
+        if kind == "join":
+            self.add_player(event[2], player_id=event[1], bot=event[3] if len(event) > 3 else None)
+            return
+        if kind == "start":
+            self.start_game()
+            return
+        
+        if kind == "play":
+            success, message = self.play_card(event[1], CARDS[event[2]], event[3])
+        elif kind == "plays":
+            success, results = self.apply_moves(
+                event[1], [(CARDS[card_id], pile_name) for card_id, pile_name in event[2]]
+            )
+            message = results[-1][1]
+        elif kind == "move":
+            success, message = self.move_pile(event[1], event[2], event[3])
+        elif kind == "draw":
+            success, message = self.draw_card(event[1])
+        elif kind == "end":
+            success, message = self.get_current_player().id == event[1], "Not your turn"
+            if success:
+                self.end_turn()
+        else:
+            success, message = False, "Unknown event"
+        
+        if not success:
+            raise ValueError(f"Cannot replay {event!r}: {message}")
     
     def _get_pile(self, pile_name: str) -> Optional[GamePile]:
         """Get a pile by name."""
-        if pile_name in self.foundation_piles:
-            return self.foundation_piles[pile_name]
-        elif pile_name in self.corner_piles:
-            return self.corner_piles[pile_name]
-        return None
-    
-    def get_game_state(self) -> Dict:
-        """Get the current game state."""
+        return self.piles.get(pile_name)
+    
+    def legal_moves(self, player_id: str) -> List[Move]:
+        """Return every valid card play and pile move for a player.
+        
+        Empty if it is not the player's turn. Legality is checked against
+        each pile's accepted-card bitmask, so one pass over the hand and
+        the eight piles covers every (card, pile) and (pile, pile) pair.
+        """
+        if not self.game_started or self.game_over:
+            return []
+        
+        current_player = self.get_current_player()
+        if not current_player or current_player.id != player_id:
+            return []
+        
+        hand_mask = current_player.hand.mask
+        accepted = {name: pile.accepted_mask() for name, pile in self.piles.items()}
+        moves = []
+        
+        for name, mask in accepted.items():
+            playable = hand_mask & mask
+            while playable:
+                lowest = playable & -playable
+                moves.append(Move("play", name, card=CARDS[lowest.bit_length() - 1]))
+                playable ^= lowest
+        
+        for source, pile in self.piles.items():
+            if not pile.cards:
+                continue
+            bottom_bit = pile.cards[0].bit
+            for target, mask in accepted.items():
+                if target != source and bottom_bit & mask:
+                    moves.append(Move("move", target, source=source))
+        
+        return moves
+    
+    def get_game_state(self, include_pile_cards: bool = True) -> Dict:
+        """Get the current game state.
+        
+        Hands and piles are serialized from per-hand and per-pile caches, so
+        only what changed since the last call is rebuilt. With
+        include_pile_cards=False each pile carries only its top card, bottom
+        card and size. The returned fragments are shared; do not modify them.
+        """
+        current_player = self.get_current_player()
         return {
             'game_id': self.game_id,
+            'seed': self.seed,
+            'version': self.version,
             'players': [
                 {
                     'id': p.id,
                     'name': p.name,
                     'hand_size': len(p.hand),
-                    'hand': [{'rank': c.rank, 'suit': c.suit.value, 'color': c.color.value} 
-                            for c in p.hand]
+                    'hand': p.hand_state(),
+                    'bot': p.bot
                 } for p in self.players
             ],
             'current_player': self.current_player_index,
-            'current_player_name': self.get_current_player().name if self.get_current_player() else None,
+            'current_player_name': current_player.name if current_player else None,
             'foundation_piles': {
-                name: {
-                    'cards': [{'rank': c.rank, 'suit': c.suit.value, 'color': c.color.value} 
-                             for c in pile.cards],
-                    'top_card': {'rank': pile.get_top_card().rank, 
-                               'suit': pile.get_top_card().suit.value,
-                               'color': pile.get_top_card().color.value} if pile.get_top_card() else None,
-                    'size': len(pile)
-                } for name, pile in self.foundation_piles.items()
+                name: pile.to_state(include_pile_cards)
+                for name, pile in self.foundation_piles.items()
             },
             'corner_piles': {
-                name: {
-                    'cards': [{'rank': c.rank, 'suit': c.suit.value, 'color': c.color.value} 
-                             for c in pile.cards],
-                    'top_card': {'rank': pile.get_top_card().rank, 
-                               'suit': pile.get_top_card().suit.value,
-                               'color': pile.get_top_card().color.value} if pile.get_top_card() else None,
-                    'size': len(pile)
-                } for name, pile in self.corner_piles.items()
+                name: pile.to_state(include_pile_cards)
+                for name, pile in self.corner_piles.items()
             },
             'deck_size': self.deck.cards_remaining(),
             'game_started': self.game_started,
@@ -248,3 +505,138 @@ class KingsCornerGame:
             'turn_actions_taken': self.turn_actions_taken,
             'max_actions_per_turn': self.max_actions_per_turn
         }
+    
+    def get_player_view(self, player_id: str, include_pile_cards: bool = True) -> Dict:
+        """Get the game state as one seat is allowed to see it.
+        
+        Only the viewer's own hand is included; opponents show just their
+        names and hand sizes. Their ids, which are what authenticates a
+        player, and the seed (which determines every hand) are withheld.
+        'seat' is the viewer's index in 'players', or None for spectators.
+        """
+        state = self.get_game_state(include_pile_cards)
+        view = {key: value for key, value in state.items() if key != 'seed'}
+        view['seat'] = None
+        view['players'] = []
+        for seat, player in enumerate(state['players']):
+            if player['id'] == player_id:
+                view['seat'] = seat
+                view['players'].append(player)
+            else:
+                view['players'].append({
+                    'name': player['name'],
+                    'hand_size': player['hand_size'],
+                    'bot': player['bot']
+                })
+        return view
+    
+    def get_state_diff(self, since_version: int, player_id: Optional[str] = None) -> Optional[Dict]:
+        """Describe what changed since since_version, built from the action log.
+        
+        The diff lists pile operations in order ("play" appends a card,
+        "move" stacks one pile onto another), the hands that changed and the
+        DIFF_FIELDS. Hands are only included for player_id (or for every
+        seat when player_id is None, matching get_game_state). Returns None
+        when the log cannot bridge the gap (too far behind, seats joined or
+        the deal happened since); callers then send a full state instead.
+        Apply with apply_state_diff().
+        """
+        behind = self.version - since_version
+        start = len(self.events) - behind
+        if behind < 0 or behind > MAX_DIFF_EVENTS or start < 0:
+            return None
+        
+        seats = {player.id: seat for seat, player in enumerate(self.players)}
+        ops = []
+        changed_hands = set()
+        for event in self.events[start:]:
+            kind = event[0]
+            if kind == "play":
+                ops.append({'op': 'play', 'pile': event[3], 'card': CARD_DICTS[event[2]]})
+            elif kind == "plays":
+                ops.extend({'op': 'play', 'pile': pile_name, 'card': CARD_DICTS[card_id]}
+                           for card_id, pile_name in event[2])
+            elif kind == "move":
+                ops.append({'op': 'move', 'from': event[2], 'to': event[3]})
+            elif kind in ("draw", "end"):
+                ops.append({'op': kind, 'seat': seats[event[1]]})
+            else:
+                # Joins and the deal reshape the whole state
+                return None
+            if kind in ("play", "plays", "draw"):
+                changed_hands.add(seats[event[1]])
+        
+        current_player = self.get_current_player()
+        diff = {
+            'since': since_version,
+            'version': self.version,
+            'current_player': self.current_player_index,
+            'current_player_name': current_player.name if current_player else None,
+            'deck_size': self.deck.cards_remaining(),
+            'game_over': self.game_over,
+            'winner': self.winner.name if self.winner else None,
+            'turn_actions_taken': self.turn_actions_taken,
+            'ops': ops,
+            'players': [],
+        }
+        for seat in sorted(changed_hands):
+            player = self.players[seat]
+            entry = {'seat': seat, 'hand_size': len(player.hand)}
+            if player_id is None or player.id == player_id:
+                entry['hand'] = player.hand_state()
+            diff['players'].append(entry)
+        return diff
+
+
+def apply_state_diff(state: Dict, diff: Dict) -> Dict:
+    """Return a new state (or player view) with a get_state_diff() applied.
+    
+    The input state is left untouched, so shared states stay safe to use.
+    Works on states with or without pile card lists.
+    """
+    if state['version'] != diff['since']:
+        raise ValueError(f"Diff applies to version {diff['since']}, not {state['version']}")
+    
+    new_state = dict(state)
+    for field_name in DIFF_FIELDS:
+        new_state[field_name] = diff[field_name]
+    groups = {
+        'foundation_piles': dict(state['foundation_piles']),
+        'corner_piles': dict(state['corner_piles']),
+    }
+    new_state.update(groups)
+    group_of = {name: group for group in groups.values() for name in group}
+    
+    for op in diff['ops']:
+        kind = op['op']
+        if kind == 'play':
+            pile = group_of[op['pile']][op['pile']]
+            card = op['card']
+            updated = {'top_card': card, 'bottom_card': pile['bottom_card'] or card,
+                       'size': pile['size'] + 1}
+            if 'cards' in pile:
+                updated['cards'] = pile['cards'] + [card]
+            group_of[op['pile']][op['pile']] = updated
+        elif kind == 'move':
+            source = group_of[op['from']][op['from']]
+            target = group_of[op['to']][op['to']]
+            updated = {'top_card': source['top_card'],
+                       'bottom_card': target['bottom_card'] or source['bottom_card'],
+                       'size': target['size'] + source['size']}
+            emptied = {'top_card': None, 'bottom_card': None, 'size': 0}
+            if 'cards' in source:
+                updated['cards'] = target['cards'] + source['cards']
+                emptied['cards'] = []
+            group_of[op['to']][op['to']] = updated
+            group_of[op['from']][op['from']] = emptied
+    
+    if diff['players']:
+        players = list(state['players'])
+        for entry in diff['players']:
+            player = dict(players[entry['seat']])
+            player['hand_size'] = entry['hand_size']
+            if 'hand' in entry:
+                player['hand'] = entry['hand']
+            players[entry['seat']] = player
+        new_state['players'] = players
+    return new_state
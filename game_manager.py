@@ -2,198 +2,310 @@
 Game session management for multiplayer Kings in the Corner.
 This module handles game state persistence and multiplayer session management.
 """
-import json
-import time
-from typing import Dict, Optional, List
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, List
+from bots import BOT_POLICIES
+from codec import decode_game, encode_game
 from game import KingsCornerGame
-from cards import Card, Suit
+from search import DEFAULT_BUDGET_MS, SearchResult, search
+from cards import SUIT_BY_SYMBOL, card_from_symbols
+from storage import GameStore, InMemoryGameStore, RedisGameStore, SqliteGameStore
 
 
 class GameSessionManager:
     """Manages game sessions for multiplayer gameplay."""
     
-    def __init__(self):
-        # In-memory storage for game sessions
-        # In production, this would be replaced with Redis or a database
-        self._games: Dict[str, KingsCornerGame] = {}
-        self._player_sessions: Dict[str, str] = {}  # player_id -> game_id
-        self._last_activity: Dict[str, float] = {}  # game_id -> timestamp
-        self.session_timeout = 3600  # 1 hour timeout
+    def __init__(self, store: Optional[GameStore] = None):
+        # Games live in a pluggable store: in-memory by default, or
+        # RedisGameStore to share games between app processes
+        self._store = store or InMemoryGameStore(session_timeout=3600)  # 1 hour timeout
+    
+    @property
+    def session_timeout(self) -> float:
+        return self._store.session_timeout
+    
+    @session_timeout.setter
+    def session_timeout(self, value: float):
+        self._store.session_timeout = value
     
     def create_game(self, creator_name: str) -> tuple[str, str]:
         """Create a new game and return (game_id, player_id)."""
         game = KingsCornerGame()
         player_id = game.add_player(creator_name)
         
-        self._games[game.game_id] = game
-        self._player_sessions[player_id] = game.game_id
-        self._last_activity[game.game_id] = time.time()
+        self._store.add_game(game)
+        self._store.bind_player(player_id, game.game_id)
         
         return game.game_id, player_id
     
     def join_game(self, game_id: str, player_name: str) -> Optional[str]:
         """Join an existing game and return player_id."""
-        game = self._games.get(game_id)
-        if not game:
+        def join(game: KingsCornerGame) -> Optional[str]:
+            try:
+                return game.add_player(player_name)
+            except ValueError:
+                return None
+        
+        found, player_id = self._store.update(game_id, join)
+        if not found or not player_id:
             return None
         
-        try:
-            player_id = game.add_player(player_name)
-            self._player_sessions[player_id] = game_id
-            self._last_activity[game_id] = time.time()
-            return player_id
-        except ValueError:
+        self._store.bind_player(player_id, game_id)
+        return player_id
+    
+    def add_bot(self, game_id: str, policy: str = "greedy", name: Optional[str] = None) -> Optional[str]:
+        """Seat a server-side bot in a game's lobby and return its player_id.
+        
+        A bots.BotRunner watching this manager takes the bot's turns.
+        """
+        if policy not in BOT_POLICIES:
             return None
+        
+        def join(game: KingsCornerGame) -> Optional[str]:
+            try:
+                return game.add_player(name or f"{policy.title()} Bot", bot=policy)
+            except ValueError:
+                return None
+        
+        found, player_id = self._store.update(game_id, join)
+        if not found or not player_id:
+            return None
+        
+        self._store.bind_player(player_id, game_id)
+        return player_id
+    
+    def copy_game(self, game_id: str) -> Optional[KingsCornerGame]:
+        """Get a private copy of a game, safe to inspect and mutate without locks."""
+        found, data = self._store.update(game_id, encode_game)
+        return decode_game(data) if found else None
     
     def get_game(self, game_id: str) -> Optional[KingsCornerGame]:
         """Get a game by ID."""
-        self._cleanup_expired_games()
-        game = self._games.get(game_id)
-        if game:
-            self._last_activity[game_id] = time.time()
-        return game
+        return self._store.get_game(game_id)
+    
+    def get_player_game_id(self, player_id: str) -> Optional[str]:
+        """Get the id of the game a player is in."""
+        return self._store.get_player_game_id(player_id)
     
     def get_player_game(self, player_id: str) -> Optional[KingsCornerGame]:
         """Get the game a player is in."""
-        game_id = self._player_sessions.get(player_id)
+        game_id = self._store.get_player_game_id(player_id)
         if game_id:
             return self.get_game(game_id)
         return None
     
     def start_game(self, game_id: str, player_id: str) -> bool:
-        """Start a game."""
-        game = self.get_game(game_id)
-        if not game:
-            return False
+        """Start a game; only one of its players may."""
+        def start(game: KingsCornerGame) -> bool:
+            if game.get_player(player_id) is None:
+                return False
+            try:
+                game.start_game()
+                return True
+            except ValueError:
+                return False
         
-        try:
-            game.start_game()
-            self._last_activity[game_id] = time.time()
-            return True
-        except ValueError:
-            return False
+        found, started = self._store.update(game_id, start)
+        return found and started
+    
+    def _update_player_game(self, player_id: str, action, not_found=(False, "Game not found")):
+        """Run an action on the game a player is in."""
+        game_id = self._store.get_player_game_id(player_id)
+        if not game_id:
+            return not_found
+        found, result = self._store.update(game_id, action)
+        return result if found else not_found
     
     def play_card(self, player_id: str, rank: str, suit_symbol: str, pile_name: str) -> tuple[bool, str]:
         """Play a card."""
-        game = self.get_player_game(player_id)
-        if not game:
-            return False, "Game not found"
-        
-        # Convert suit symbol back to Suit enum
-        suit_map = {"♥": Suit.HEARTS, "♦": Suit.DIAMONDS, "♣": Suit.CLUBS, "♠": Suit.SPADES}
-        suit = suit_map.get(suit_symbol)
-        if not suit:
+        if suit_symbol not in SUIT_BY_SYMBOL:
             return False, "Invalid suit"
+        card = card_from_symbols(rank, suit_symbol)
         
-        # Find the card in player's hand
-        player = None
-        for p in game.players:
-            if p.id == player_id:
-                player = p
-                break
-        
-        if not player:
-            return False, "Player not found"
+        def play(game: KingsCornerGame) -> tuple[bool, str]:
+            player = game.get_player(player_id)
+            if not player:
+                return False, "Player not found"
+            
+            if card is None or card not in player.hand:
+                return False, "Card not in hand"
+            
+            return game.play_card(player_id, card, pile_name)
         
-        # Find the specific card
-        target_card = None
-        for card in player.hand:
-            if card.rank == rank and card.suit == suit:
-                target_card = card
-                break
+        return self._update_player_game(player_id, play)
+    
+    def play_cards(self, player_id: str, plays: List[tuple[str, str, str]]) -> tuple[bool, List[tuple[bool, str]]]:
+        """Play several (rank, suit_symbol, pile_name) cards atomically.
         
-        if not target_card:
-            return False, "Card not in hand"
+        Either every card is played or none is; returns (all played,
+        per-card results up to the first refusal).
+        """
+        moves = []
+        for rank, suit_symbol, pile_name in plays:
+            card = card_from_symbols(rank, suit_symbol) if suit_symbol in SUIT_BY_SYMBOL else None
+            if card is None:
+                return False, [(False, "Invalid card")]
+            moves.append((card, pile_name))
         
-        success, message = game.play_card(player_id, target_card, pile_name)
-        if success:
-            self._last_activity[game.game_id] = time.time()
+        def play(game: KingsCornerGame) -> tuple[bool, List[tuple[bool, str]]]:
+            player = game.get_player(player_id)
+            if not player:
+                return False, [(False, "Player not found")]
+            return game.apply_moves(player_id, moves)
         
-        return success, message
+        return self._update_player_game(player_id, play, not_found=(False, [(False, "Game not found")]))
     
     def draw_card(self, player_id: str) -> tuple[bool, str]:
         """Draw a card."""
-        game = self.get_player_game(player_id)
-        if not game:
-            return False, "Game not found"
-        
-        success, message = game.draw_card(player_id)
-        if success:
-            self._last_activity[game.game_id] = time.time()
-        
-        return success, message
+        return self._update_player_game(player_id, lambda game: game.draw_card(player_id))
     
     def end_turn(self, player_id: str) -> bool:
         """End a player's turn."""
-        game = self.get_player_game(player_id)
-        if not game:
+        def end(game: KingsCornerGame) -> bool:
+            current_player = game.get_current_player()
+            if current_player and current_player.id == player_id:
+                game.end_turn()
+                return True
             return False
         
-        current_player = game.get_current_player()
-        if current_player and current_player.id == player_id:
-            game.end_turn()
-            self._last_activity[game.game_id] = time.time()
-            return True
-        
-        return False
+        return self._update_player_game(player_id, end, not_found=False)
     
     def move_pile(self, player_id: str, from_pile: str, to_pile: str) -> tuple[bool, str]:
         """Move an entire pile to another pile."""
-        game = self.get_player_game(player_id)
-        if not game:
-            return False, "Game not found"
+        return self._update_player_game(
+            player_id, lambda game: game.move_pile(player_id, from_pile, to_pile)
+        )
+    
+    def get_hint(self, player_id: str, budget_ms: float = DEFAULT_BUDGET_MS) -> Optional[SearchResult]:
+        """Search for the best plays of a player's turn; None if it is not their turn.
         
-        success, message = game.move_pile(player_id, from_pile, to_pile)
-        if success:
-            self._last_activity[game.game_id] = time.time()
+        Runs on a private copy of the game, so other players are not held up.
+        """
+        game_id = self._store.get_player_game_id(player_id)
+        game = self.copy_game(game_id) if game_id else None
+        if game is None:
+            return None
+        try:
+            return search(game, player_id, budget_ms)
+        except ValueError:
+            return None
+    
+    def get_game_state(self, game_id: str, include_pile_cards: bool = True) -> Optional[Dict]:
+        """Get the current game state (shared between callers; do not modify).
         
-        return success, message
+        With include_pile_cards=False piles carry only their top card,
+        bottom card and size.
+        """
+        return self._store.get_game_state(game_id, include_pile_cards)
     
-    def get_game_state(self, game_id: str) -> Optional[Dict]:
-        """Get the current game state."""
-        game = self.get_game(game_id)
-        if game:
-            return game.get_game_state()
-        return None
+    def get_player_view(self, game_id: str, player_id: str,
+                        include_pile_cards: bool = True) -> Optional[Dict]:
+        """Get what one player may see: their own hand and opponents' hand sizes.
+        
+        Built once per (game, version, seat) and shared; do not modify.
+        """
+        return self._store.get_player_view(game_id, player_id, include_pile_cards)
+    
+    def get_state_diff(self, game_id: str, since_version: int, player_id: Optional[str] = None,
+                       include_pile_cards: bool = True) -> Optional[Dict]:
+        """Get what changed since since_version, for clients holding that version.
+        
+        Returns {'type': 'diff', 'diff': ...} to pass to apply_state_diff(),
+        or {'type': 'full', 'state': ...} when the client is too far behind;
+        None if the game is gone. Shared; do not modify.
+        """
+        return self._store.get_state_diff(game_id, since_version, player_id, include_pile_cards)
+    
+    def get_version(self, game_id: str) -> Optional[int]:
+        """Return a game's version without building its state, or None if it is gone."""
+        return self._store.get_version(game_id)
+    
+    def get_game_state_if_changed(self, game_id: str, since_version: Optional[int]) -> tuple[bool, Optional[Dict]]:
+        """Get the game state only if its version has moved past since_version.
+        
+        Returns (False, None) when nothing changed, so callers can skip
+        rebuilding and re-rendering; (True, None) if the game is gone.
+        """
+        version = self._store.get_version(game_id)
+        if version is not None and version == since_version:
+            return False, None
+        return True, self._store.get_game_state(game_id)
+    
+    def wait_for_change(self, game_id: str, since_version: Optional[int], timeout: float = 10.0) -> Optional[int]:
+        """Block until the game moves past since_version, or timeout seconds pass.
+        
+        Returns the current version, or None if the game is gone.
+        """
+        return self._store.wait_for_change(game_id, since_version, timeout)
+    
+    def add_listener(self, listener: Callable[[str, int], None], remote: bool = False):
+        """Call listener(game_id, version) after every change made through this manager.
+        
+        With remote=True it also hears changes other processes make to a
+        shared store.
+        """
+        self._store.add_listener(listener, remote)
+    
+    def remove_listener(self, listener: Callable[[str, int], None]):
+        self._store.remove_listener(listener)
     
     def list_active_games(self) -> List[Dict]:
         """List all active games."""
-        self._cleanup_expired_games()
+        self._store.cleanup_expired()
         games = []
-        for game_id, game in self._games.items():
+        for game in self._store.games():
             games.append({
-                'game_id': game_id,
+                'game_id': game.game_id,
                 'players': len(game.players),
                 'max_players': 4,
                 'started': game.game_started,
                 'game_over': game.game_over
             })
         return games
+
+
+class ChangeFeed:
+    """The latest version of every game that changed, fed by a manager's listeners.
     
-    def _cleanup_expired_games(self):
-        """Remove expired games."""
-        current_time = time.time()
-        expired_games = []
-        
-        for game_id, last_activity in self._last_activity.items():
-            if current_time - last_activity > self.session_timeout:
-                expired_games.append(game_id)
-        
-        for game_id in expired_games:
-            self._remove_game(game_id)
-    
-    def _remove_game(self, game_id: str):
-        """Remove a game and clean up associated data."""
-        if game_id in self._games:
-            game = self._games[game_id]
-            # Remove player sessions
-            for player in game.players:
-                if player.id in self._player_sessions:
-                    del self._player_sessions[player.id]
-            
-            del self._games[game_id]
-            del self._last_activity[game_id]
+    Listening with remote=True also catches changes made by other app
+    processes sharing a Redis store. Reading the feed is a dict lookup, so
+    pages can check for other players' moves every second without touching
+    the store or parking a thread on each game.
+    """
+    
+    MAX_GAMES = 10000
+    
+    def __init__(self, manager: GameSessionManager):
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        manager.add_listener(self._on_change, remote=True)
+    
+    def _on_change(self, game_id: str, version: int):
+        with self._lock:
+            self._versions[game_id] = version
+            self._versions.move_to_end(game_id)
+            # Games that went quiet longest drop out first
+            while len(self._versions) > self.MAX_GAMES:
+                self._versions.popitem(last=False)
+    
+    def latest_version(self, game_id: str) -> Optional[int]:
+        """Return the last version heard for a game, or None if none was."""
+        return self._versions.get(game_id)
+
+
+def _default_store() -> GameStore:
+    """Use Redis when REDIS_URL is set, so several app processes can share games,
+    or SQLite when GAME_DB_PATH is set, so games survive restarts."""
+    redis_url = os.environ.get("REDIS_URL")
+    if redis_url:
+        return RedisGameStore(redis_url)
+    db_path = os.environ.get("GAME_DB_PATH")
+    if db_path:
+        return SqliteGameStore(db_path)
+    return InMemoryGameStore()
 
 
 # Global game manager instance
-game_manager = GameSessionManager()
+game_manager = GameSessionManager(_default_store())
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Information-set Monte Carlo tree search (ISMCTS) for Kings in the Corner.
+
+The searching player sees their own hand and the piles, but not the
+opponents' hands or the order of the deck. Every iteration therefore
+starts from a determinization: the hidden cards are shuffled and redealt
+to the opponents and the deck, keeping every hand and the deck at their
+real sizes. The tree is built over the searcher's own turn, the sequence
+of card plays and pile moves up to the final draw or end of turn, which is
+the same whatever was redealt. Each iteration then plays on for up to
+ROLLOUT_TURNS turns with a fast greedy rollout on a BitboardState and backs
+up a win, a loss, or a partial score based on hand sizes. Short rollouts
+score the turn's real consequences with far less noise than playing every
+game out, and buy more of them per budget.
+
+search() returns the most visited line of play within a millisecond
+budget. With workers > 1 each process grows its own tree from a different
+seed and the trees' statistics are merged before the line is chosen (root
+parallelization). Run this module for a rollouts-per-second benchmark.
+"""
+import argparse
+import math
+import random
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from bitboard import FIRST_CORNER, MOVE, BitboardState, iter_cards, to_move
+from game import KingsCornerGame, Move
+
+DEFAULT_BUDGET_MS = 200
+EXPLORATION = 0.7  # UCB1 exploration constant; rewards are in [0, 1]
+ROLLOUT_TURNS = 8
+ROLLOUT_EPSILON = 0.1  # chance a rollout plays a random move instead of the greedy one
+MAX_ROLLOUT_ACTIONS = 200
+
+# Finish the turn: draw a card, or end the turn if the deck is empty. Compared
+# with ==, since lines of play are pickled between processes
+STOP = (None,)
+
+
+class SearchResult(NamedTuple):
+    """The outcome of a search for one player's turn."""
+    moves: List[Move]  # plays and pile moves to make, in order, before drawing
+    value: float  # mean rollout score of playing them, from 0 (lost) to 1 (won)
+    rollouts: int
+    elapsed: float  # seconds
+
+    @property
+    def rollouts_per_second(self) -> float:
+        return self.rollouts / self.elapsed if self.elapsed else 0.0
+
+
+class _Node:
+    __slots__ = ('move', 'parent', 'children', 'untried', 'visits', 'reward')
+
+    def __init__(self, move: Tuple, parent: Optional['_Node'], untried: List[Tuple]):
+        self.move = move
+        self.parent = parent
+        self.children: List['_Node'] = []
+        self.untried = untried
+        self.visits = 0
+        self.reward = 0.0
+
+
+def _choices(state: BitboardState) -> List[Tuple]:
+    """The actions available at a tree node: every useful move, or stopping."""
+    if state.winner is not None:
+        return []
+    return state.useful_moves() + [STOP]
+
+
+def _apply(state: BitboardState, move: Tuple):
+    if move == STOP:
+        if not state.draw_card():
+            state.end_turn()
+    else:
+        state.apply(move)
+
+
+def _hand_size(state: BitboardState, seat: int) -> int:
+    return bin(state.hands[seat]).count("1")
+
+
+def determinize(state: BitboardState, seat: int, rng: random.Random) -> BitboardState:
+    """Copy a state, redealing every card `seat` cannot see at random."""
+    hidden = state.deck[:state.deck_len]
+    for other, hand in enumerate(state.hands):
+        if other != seat:
+            hidden.extend(iter_cards(hand))
+    rng.shuffle(hidden)
+
+    sample = state.copy()
+    dealt = 0
+    for other, hand in enumerate(state.hands):
+        if other != seat:
+            count = _hand_size(state, other)
+            mask = 0
+            for card_id in hidden[dealt:dealt + count]:
+                mask |= 1 << card_id
+            sample.hands[other] = mask
+            dealt += count
+    sample.deck = hidden[dealt:]
+    return sample
+
+
+def _rollout_move(moves: List[Tuple], rng: random.Random) -> Tuple:
+    """The greedy simulator policy on bitboard moves, with a little noise."""
+    if rng.random() < ROLLOUT_EPSILON:
+        return rng.choice(moves)
+    best_move, best_score = moves[0], -1
+    for move in moves:
+        if move[0] == MOVE:
+            score = 20
+        elif move[2] >= FIRST_CORNER:
+            score = 15
+        else:
+            score = move[1] % 13 + 1
+        if score > best_score:
+            best_move, best_score = move, score
+    return best_move
+
+
+def _rollout(state: BitboardState, seat: int, rng: random.Random) -> float:
+    """Play on from `state` and score the result for `seat` in [0, 1]."""
+    idle_turns = 0
+    for _ in range(ROLLOUT_TURNS):
+        if state.winner is not None:
+            break
+        acted = False
+        for _ in range(MAX_ROLLOUT_ACTIONS):
+            moves = state.useful_moves()
+            if not moves:
+                break
+            state.apply(_rollout_move(moves, rng))
+            acted = True
+            if state.winner is not None:
+                break
+        if state.winner is not None:
+            break
+        if not state.draw_card():
+            state.end_turn()
+            # Nobody can draw, so a full round without plays is a dead end
+            idle_turns = 0 if acted else idle_turns + 1
+            if idle_turns >= len(state.players):
+                break
+
+    if state.winner is not None:
+        return 1.0 if state.winner == seat else 0.0
+    mine = _hand_size(state, seat)
+    fewest = min(_hand_size(state, other) for other in range(len(state.players)) if other != seat)
+    return 0.5 + 0.5 * (fewest - mine) / (fewest + mine)
+
+
+def _grow_tree(state: BitboardState, deadline: float, seed: Optional[int],
+               exploration: float) -> Tuple[Dict[Tuple, List[float]], int]:
+    """Run iterations until `deadline`; returns per-line statistics and the count.
+
+    Statistics map each line of play (a tuple of moves from the root) to
+    [visits, total reward], so trees grown in different processes can be
+    merged by adding them up.
+    """
+    rng = random.Random(seed)
+    seat = state.current
+    root = _Node(None, None, _choices(state))
+    iterations = 0
+    while True:
+        sample = determinize(state, seat, rng)
+        node = root
+
+        # Selection: descend through fully expanded nodes by UCB1
+        while not node.untried and node.children:
+            log_visits = math.log(node.visits)
+            node = max(node.children, key=lambda child: child.reward / child.visits
+                       + exploration * math.sqrt(log_visits / child.visits))
+            _apply(sample, node.move)
+
+        # Expansion: add one untried action
+        if node.untried:
+            move = node.untried.pop(rng.randrange(len(node.untried)))
+            _apply(sample, move)
+            child = _Node(move, node, [] if move == STOP else _choices(sample))
+            node.children.append(child)
+            node = child
+
+        reward = _rollout(sample, seat, rng)
+        while node is not None:
+            node.visits += 1
+            node.reward += reward
+            node = node.parent
+
+        iterations += 1
+        if time.monotonic() >= deadline:
+            break
+
+    stats = {}
+    stack = [((), root)]
+    while stack:
+        line, node = stack.pop()
+        stats[line] = [node.visits, node.reward]
+        stack.extend((line + (child.move,), child) for child in node.children)
+    return stats, iterations
+
+
+def _grow_tree_worker(args: tuple) -> Tuple[Dict[Tuple, List[float]], int]:
+    """Process pool entry point for _grow_tree."""
+    return _grow_tree(*args)
+
+
+def best_line(stats: Dict[Tuple, List[float]]) -> Tuple[List[Tuple], float]:
+    """Follow the most visited actions from the root until the turn ends.
+
+    Returns the line and the mean reward of its first action, the estimate
+    backed by the most visits.
+    """
+    children: Dict[Tuple, List[Tuple]] = {}
+    for line in stats:
+        if line:
+            children.setdefault(line[:-1], []).append(line)
+
+    line: Tuple = ()
+    while line in children:
+        line = max(children[line], key=lambda candidate: stats[candidate][0])
+        if line[-1] == STOP:
+            break
+    visits, reward = stats[line[:1]]
+    if line and line[-1] == STOP:
+        line = line[:-1]
+    return list(line), reward / visits if visits else 0.0
+
+
+def search(game: KingsCornerGame, player_id: str, budget_ms: float = DEFAULT_BUDGET_MS,
+           workers: int = 1, seed: Optional[int] = None, executor: Optional[Executor] = None,
+           exploration: float = EXPLORATION) -> SearchResult:
+    """Find the best plays for a player's turn within `budget_ms` milliseconds.
+
+    Only the player's own hand and the piles are used: hidden cards are
+    resampled on every iteration. With workers > 1 the search is spread
+    over a process pool, `executor` if given (reusing one saves process
+    startup, which otherwise comes out of the budget). Raises ValueError if
+    it is not the player's turn.
+    """
+    started = time.monotonic()
+    player = game.get_current_player()
+    if not game.game_started or game.game_over or player is None or player.id != player_id:
+        raise ValueError("Not this player's turn")
+
+    state = BitboardState.from_game(game)
+    if not state.useful_moves():
+        return SearchResult([], 0.0, 0, time.monotonic() - started)
+    # CLOCK_MONOTONIC is system-wide, so worker processes share the deadline
+    deadline = started + budget_ms / 1000
+
+    if workers <= 1:
+        stats, rollouts = _grow_tree(state, deadline, seed, exploration)
+    else:
+        seeds = [None if seed is None else seed + index for index in range(workers)]
+        jobs = [(state, deadline, worker_seed, exploration) for worker_seed in seeds]
+        pool = executor or ProcessPoolExecutor(max_workers=workers)
+        try:
+            results = list(pool.map(_grow_tree_worker, jobs))
+        finally:
+            if executor is None:
+                pool.shutdown()
+        stats, rollouts = {}, 0
+        for tree, iterations in results:
+            rollouts += iterations
+            for line, (visits, reward) in tree.items():
+                total = stats.setdefault(line, [0, 0.0])
+                total[0] += visits
+                total[1] += reward
+
+    line, value = best_line(stats)
+    return SearchResult([to_move(move) for move in line], value, rollouts,
+                        time.monotonic() - started)
+
+
+def ismcts_policy(game: KingsCornerGame, player_id: str, rng: random.Random,
+                  deadline: Optional[float] = None) -> Optional[Move]:
+    """Bot policy: search until `deadline` and make the first move of the best line."""
+    budget_ms = DEFAULT_BUDGET_MS if deadline is None else (deadline - time.monotonic()) * 1000
+    try:
+        result = search(game, player_id, max(budget_ms, 1.0), seed=rng.getrandbits(32))
+    except ValueError:
+        return None
+    return result.moves[0] if result.moves else None
+
+
+def benchmark(budget_ms: float = 1000, workers: int = 1, seed: int = 1) -> SearchResult:
+    """Search an opening position of a 4-player game, for rollouts per second."""
+    game = KingsCornerGame(seed=seed)
+    for seat in range(4):
+        game.add_player(f"Player {seat + 1}")
+    game.start_game()
+    return search(game, game.get_current_player().id, budget_ms, workers, seed)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark the ISMCTS move search.")
+    parser.add_argument("--budget-ms", type=float, default=1000)
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    result = benchmark(args.budget_ms, args.workers, args.seed)
+    print(f"{result.rollouts} rollouts in {result.elapsed * 1000:.0f} ms "
+          f"({result.rollouts_per_second:.0f} rollouts/s, {args.workers} worker(s))")
+    print(f"Best line (score {result.value:.2f}): "
+          f"{', '.join(str(move.card or move.source) + '->' + move.target for move in result.moves) or 'draw'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
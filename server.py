@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+Standalone JSON/WebSocket API server for Kings in the Corner.
+
+Exposes GameSessionManager over plain HTTP/1.1 and WebSockets using only
+asyncio from the standard library, so lightweight clients can play without
+Streamlit. One process holds thousands of idle connections cheaply; every
+socket watching a game is woken by the manager's change listener and sent
+its seat's view only when the game's version moves.
+
+A player's id is their credential: it is only ever sent to the player who
+created or joined with it, and views of a game leave out the other seats'
+ids.
+
+HTTP routes (JSON request and response bodies):
+    GET  /games                          list active games
+    POST /games            {name}        create a game -> {game_id, player_id}
+    POST /games/<id>/join  {name}        -> {player_id}
+    POST /games/<id>/bots  {policy?, name?}  seat a bot -> {ok}
+    POST /games/<id>/start {player_id}
+    POST /games/<id>/play  {player_id, pile, cards: [[rank, suit], ...]}
+    POST /games/<id>/move  {player_id, from, to}
+    POST /games/<id>/draw  {player_id}
+    POST /games/<id>/end   {player_id}
+    GET  /games/<id>/state?player_id=<player_id>
+    GET  /games/<id>/ws?player_id=<player_id>   WebSocket upgrade
+
+Over a WebSocket the server first sends {"type": "full", "state": view},
+then pushes {"type": "diff", "diff": ...} on every change (see
+game.apply_state_diff), or another "full" message if the socket fell too
+far behind. It accepts {"action": "play" | "move" | "draw" | "end" |
+"start", ...} messages with the same fields as the HTTP routes, answering
+each with {"type": "result", "action": ..., ...}.
+
+Usage:
+    python server.py --host 0.0.0.0 --port 8765
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, NamedTuple, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from bots import BotRunner
+from game_manager import GameSessionManager
+
+logger = logging.getLogger(__name__)
+
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONTINUATION, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+MAX_BODY_SIZE = 64 * 1024
+MAX_FRAME_SIZE = 1024 * 1024
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+           405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]  # lower-cased names
+    body: bytes
+
+
+class ApiError(Exception):
+    """Raised by handlers to answer with an HTTP error status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """Read one HTTP/1.1 request, or return None when the client hung up."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise ApiError(413, "Headers too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise ApiError(400, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0) or 0)
+    except ValueError:
+        raise ApiError(400, "Invalid Content-Length")
+    if length < 0:
+        raise ApiError(400, "Invalid Content-Length")
+    if length > MAX_BODY_SIZE:
+        raise ApiError(413, "Body too large")
+    body = await reader.readexactly(length) if length else b""
+
+    url = urlsplit(target)
+    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+    return Request(method.upper(), url.path, query, headers, body)
+
+
+def encode_response(status: int, payload: Any, keep_alive: bool = True) -> bytes:
+    """Build an HTTP/1.1 response carrying a JSON body."""
+    body = json.dumps(payload, ensure_ascii=False).encode()
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+
+def websocket_accept(key: str) -> str:
+    """Return the Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key."""
+    digest = hashlib.sha1(key.encode() + WEBSOCKET_GUID).digest()
+    return base64.b64encode(digest).decode()
+
+
+def _apply_mask(data: bytes, mask: bytes) -> bytes:
+    # XOR the whole payload at once as one big integer
+    repeated = (mask * (len(data) // 4 + 1))[:len(data)]
+    value = int.from_bytes(data, "big") ^ int.from_bytes(repeated, "big")
+    return value.to_bytes(len(data), "big")
+
+
+def encode_frame(payload: bytes, opcode: int = OP_TEXT, mask: bool = False) -> bytes:
+    """Build a single, final WebSocket frame (clients must set mask=True)."""
+    length = len(payload)
+    if length < 126:
+        header = bytes((0x80 | opcode, length))
+    elif length < 1 << 16:
+        header = bytes((0x80 | opcode, 126)) + length.to_bytes(2, "big")
+    else:
+        header = bytes((0x80 | opcode, 127)) + length.to_bytes(8, "big")
+    if not mask:
+        return header + payload
+    key = os.urandom(4)
+    return header[:1] + bytes((header[1] | 0x80,)) + header[2:] + key + _apply_mask(payload, key)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """Read one WebSocket message, joining fragments; returns (opcode, payload)."""
+    opcode, parts = None, []
+    while True:
+        first, second = await reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length = int.from_bytes(await reader.readexactly(2), "big")
+        elif length == 127:
+            length = int.from_bytes(await reader.readexactly(8), "big")
+        if length > MAX_FRAME_SIZE:
+            raise ConnectionError("WebSocket frame too large")
+        key = await reader.readexactly(4) if second & 0x80 else None
+        payload = await reader.readexactly(length)
+        if key:
+            payload = _apply_mask(payload, key)
+
+        frame_opcode = first & 0x0F
+        if frame_opcode >= OP_CLOSE:
+            # Control frames may arrive between the fragments of a message
+            return frame_opcode, payload
+        if frame_opcode != OP_CONTINUATION:
+            opcode = frame_opcode
+        parts.append(payload)
+        if first & 0x80:
+            return opcode, b"".join(parts)
+
+
+class GameServer:
+    """Serves one GameSessionManager over HTTP and WebSockets."""
+
+    def __init__(self, manager: Optional[GameSessionManager] = None):
+        if manager is None:
+            from game_manager import game_manager as manager
+        self.manager = manager
+        # game_id -> events of the sockets watching it, set on every change
+        self._watchers: Dict[str, Set[asyncio.Event]] = {}
+        # game_id -> {(player_id, since_version): (version, encoded frame)},
+        # so a seat watched from many sockets is serialized once per change
+        self._frames: Dict[str, Dict[Tuple, Tuple[int, bytes]]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._actions = {
+            "start": self._start, "play": self._play, "move": self._move,
+            "draw": self._draw, "end": self._end,
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> asyncio.AbstractServer:
+        """Start listening; returns the asyncio server (port 0 picks a free one)."""
+        self._loop = asyncio.get_running_loop()
+        # Sockets must see moves made through any process sharing the store
+        self.manager.add_listener(self._on_change, remote=True)
+        return await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+
+    def close(self):
+        self.manager.remove_listener(self._on_change)
+
+    def _on_change(self, game_id: str, version: int):
+        # Called from whichever thread changed the game
+        if game_id in self._watchers and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake, game_id)
+
+    def _wake(self, game_id: str):
+        for event in self._watchers.get(game_id, ()):
+            event.set()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = None
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    if request.headers.get("upgrade", "").lower() == "websocket":
+                        await self._websocket(request, reader, writer)
+                        break
+                    status, payload = await self._blocking(self.dispatch, request)
+                except ApiError as error:
+                    status, payload = error.status, {"error": str(error)}
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception:
+                    # Answer instead of dropping the connection, without
+                    # telling the client anything about the failure
+                    logger.exception("Request for %s failed", request.path if request else "?")
+                    status, payload = 500, {"error": "Internal server error"}
+
+                # A request that could not be parsed leaves the stream unusable
+                keep_alive = request is not None and request.headers.get("connection", "").lower() != "close"
+                writer.write(encode_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _blocking(self, function, *args):
+        """Run a manager call on the default thread pool, off the event loop.
+
+        Stores may read a database or make a network round trip, which
+        would otherwise stall every connection on the process.
+        """
+        return await self._loop.run_in_executor(None, function, *args)
+
+    def dispatch(self, request: Request) -> Tuple[int, Any]:
+        """Route an HTTP request to a manager operation; returns (status, payload)."""
+        parts = [part for part in request.path.split("/") if part]
+        if not parts or parts[0] != "games" or len(parts) > 3:
+            raise ApiError(404, "Not found")
+
+        if len(parts) == 1:
+            if request.method == "GET":
+                return 200, {"games": self.manager.list_active_games()}
+            if request.method == "POST":
+                name = self._field(self._json(request), "name")
+                game_id, player_id = self.manager.create_game(name)
+                return 201, {"game_id": game_id, "player_id": player_id}
+            raise ApiError(405, "Method not allowed")
+
+        game_id = parts[1]
+        action = parts[2] if len(parts) == 3 else "state"
+        if action == "state":
+            if request.method != "GET":
+                raise ApiError(405, "Method not allowed")
+            player_id = self._field(request.query, "player_id")
+            view = self.manager.get_player_view(game_id, player_id)
+            if view is None:
+                raise ApiError(404, "Game not found")
+            return 200, view
+
+        if request.method != "POST":
+            raise ApiError(405, "Method not allowed")
+        body = self._json(request)
+        if action == "join":
+            player_id = self.manager.join_game(game_id, self._field(body, "name"))
+            if not player_id:
+                raise ApiError(409, "Could not join game")
+            return 200, {"player_id": player_id}
+        if action == "bots":
+            # The bot's id would let the caller play its seat, so keep it
+            policy = self._optional_field(body, "policy") or "greedy"
+            if not self.manager.add_bot(game_id, policy, self._optional_field(body, "name")):
+                raise ApiError(409, "Could not add bot")
+            return 200, {"ok": True}
+        handler = self._actions.get(action)
+        if handler is None:
+            raise ApiError(404, "Not found")
+        player_id = self._field(body, "player_id")
+        self._check_seat(game_id, player_id)
+        return 200, handler(game_id, player_id, body)
+
+    @staticmethod
+    def _json(request: Request) -> Dict:
+        try:
+            body = json.loads(request.body or b"{}")
+        except ValueError:
+            raise ApiError(400, "Invalid JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Expected a JSON object")
+        return body
+
+    def _check_seat(self, game_id: str, player_id: str):
+        """Refuse actions by anyone who is not playing in this game."""
+        if self.manager.get_player_game_id(player_id) != game_id:
+            raise ApiError(403, "Not a player in this game")
+
+    @staticmethod
+    def _field(body: Dict, name: str) -> str:
+        value = body.get(name)
+        if not value:
+            raise ApiError(400, f"Missing '{name}'")
+        if not isinstance(value, str):
+            raise ApiError(400, f"Expected '{name}' to be a string")
+        return value
+
+    @staticmethod
+    def _optional_field(body: Dict, name: str) -> Optional[str]:
+        value = body.get(name)
+        if value is not None and not isinstance(value, str):
+            raise ApiError(400, f"Expected '{name}' to be a string")
+        return value
+
+    def _start(self, game_id: str, player_id: str, body: Dict) -> Dict:
+        return {"ok": self.manager.start_game(game_id, player_id)}
+
+    def _play(self, game_id: str, player_id: str, body: Dict) -> Dict:
+        pile = self._field(body, "pile")
+        cards = body.get("cards")
+        if not cards or not isinstance(cards, list) or not all(
+            isinstance(card, list) and len(card) == 2 and all(isinstance(part, str) for part in card)
+            for card in cards
+        ):
+            raise ApiError(400, "Expected cards as [[rank, suit], ...]")
+        plays = [(rank, suit, pile) for rank, suit in cards]
+        ok, results = self.manager.play_cards(player_id, plays)
+        return {"ok": ok, "results": results}
+
+    def _move(self, game_id: str, player_id: str, body: Dict) -> Dict:
+        ok, message = self.manager.move_pile(player_id, self._field(body, "from"), self._field(body, "to"))
+        return {"ok": ok, "message": message}
+
+    def _draw(self, game_id: str, player_id: str, body: Dict) -> Dict:
+        ok, message = self.manager.draw_card(player_id)
+        return {"ok": ok, "message": message}
+
+    def _end(self, game_id: str, player_id: str, body: Dict) -> Dict:
+        return {"ok": self.manager.end_turn(player_id)}
+
+    async def _websocket(self, request: Request, reader: asyncio.StreamReader,
+                         writer: asyncio.StreamWriter):
+        parts = [part for part in request.path.split("/") if part]
+        key = request.headers.get("sec-websocket-key")
+        if len(parts) != 3 or parts[0] != "games" or parts[2] != "ws" or not key:
+            raise ApiError(400, "Bad WebSocket request")
+        game_id = parts[1]
+        player_id = self._field(request.query, "player_id")
+        if await self._blocking(self.manager.get_player_view, game_id, player_id) is None:
+            raise ApiError(404, "Game not found")
+
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {websocket_accept(key)}\r\n\r\n"
+        ).encode())
+
+        changed = asyncio.Event()
+        changed.set()  # send the current view straight away
+        self._watchers.setdefault(game_id, set()).add(changed)
+        sent_version = None
+        incoming = asyncio.ensure_future(read_frame(reader))
+        waiting = asyncio.ensure_future(changed.wait())
+        try:
+            while True:
+                await writer.drain()
+                done, _ = await asyncio.wait({incoming, waiting}, return_when=asyncio.FIRST_COMPLETED)
+
+                if waiting in done:
+                    changed.clear()
+                    if sent_version is None:
+                        view = await self._blocking(self.manager.get_player_view, game_id, player_id)
+                        update = {"type": "full", "state": view} if view else None
+                    else:
+                        update = await self._blocking(self.manager.get_state_diff, game_id,
+                                                      sent_version, player_id)
+                    if update is None:
+                        writer.write(encode_frame(b"", OP_CLOSE))
+                        break
+                    version = (update.get("diff") or update.get("state"))['version']
+                    if version != sent_version:
+                        writer.write(self._update_frame(game_id, player_id, sent_version, version, update))
+                        sent_version = version
+                    waiting = asyncio.ensure_future(changed.wait())
+
+                if incoming in done:
+                    opcode, payload = incoming.result()
+                    if opcode == OP_CLOSE:
+                        writer.write(encode_frame(payload[:2], OP_CLOSE))
+                        break
+                    if opcode == OP_PING:
+                        writer.write(encode_frame(payload, OP_PONG))
+                    elif opcode == OP_TEXT:
+                        self._send(writer, await self._blocking(self._websocket_action,
+                                                                game_id, player_id, payload))
+                    incoming = asyncio.ensure_future(read_frame(reader))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except Exception:
+            # The socket is no longer HTTP, so close it as a WebSocket would
+            logger.exception("WebSocket for game %s failed", game_id)
+            writer.write(encode_frame((1011).to_bytes(2, "big"), OP_CLOSE))
+        finally:
+            incoming.cancel()
+            waiting.cancel()
+            watchers = self._watchers.get(game_id)
+            if watchers is not None:
+                watchers.discard(changed)
+                if not watchers:
+                    del self._watchers[game_id]
+                    self._frames.pop(game_id, None)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    def _update_frame(self, game_id: str, player_id: str, since_version: Optional[int],
+                      version: int, update: Dict) -> bytes:
+        frames = self._frames.setdefault(game_id, {})
+        key = (player_id, since_version)
+        cached = frames.get(key)
+        if cached is None or cached[0] != version:
+            if len(frames) > 64:
+                frames.clear()  # stale since_versions pile up between changes
+            cached = frames[key] = (version, encode_frame(json.dumps(update, ensure_ascii=False).encode()))
+        return cached[1]
+
+    def _websocket_action(self, game_id: str, player_id: str, payload: bytes) -> Dict:
+        try:
+            message = json.loads(payload)
+            action = message.get("action")
+            handler = self._actions.get(action)
+            if handler is None:
+                raise ApiError(400, f"Unknown action {action!r}")
+            self._check_seat(game_id, player_id)
+            result = handler(game_id, player_id, message)
+        except ApiError as error:
+            return {"type": "error", "error": str(error)}
+        except (ValueError, AttributeError):
+            return {"type": "error", "error": "Invalid JSON"}
+        except Exception:
+            logger.exception("WebSocket action failed in game %s", game_id)
+            return {"type": "error", "error": "Internal server error"}
+        return {"type": "result", "action": action, **result}
+
+    @staticmethod
+    def _send(writer: asyncio.StreamWriter, message: Dict):
+        writer.write(encode_frame(json.dumps(message, ensure_ascii=False).encode()))
+
+
+# Minimal local client, for tests, bots and load generators
+
+async def request_json(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                       method: str, path: str, body: Optional[Dict] = None) -> Tuple[int, Any]:
+    """Send one request on a keep-alive connection; returns (status, JSON body)."""
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                  f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n").encode() + data)
+    await writer.drain()
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    status = int(head[0].split(" ")[1])
+    length = next(int(line.split(":", 1)[1]) for line in head if line.lower().startswith("content-length:"))
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def connect_websocket(host: str, port: int, path: str) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Open a WebSocket; send with encode_frame(..., mask=True), receive with read_frame."""
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((f"GET {path} HTTP/1.1\r\nHost: {host}\r\nUpgrade: websocket\r\n"
+                  f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+                  f"Sec-WebSocket-Version: 13\r\n\r\n").encode())
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+    if " 101 " not in head.split("\r\n")[0] or websocket_accept(key) not in head:
+        writer.close()
+        raise ConnectionError(f"WebSocket handshake failed: {head.splitlines()[0]}")
+    return reader, writer
+
+
+async def serve(host: str, port: int):
+    server = GameServer()
+    listener = await server.start(host, port)
+    bots = BotRunner(server.manager).start()
+    print(f"Serving Kings in the Corner API on http://{host}:{port}", file=sys.stderr)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        bots.close(wait=False)
+
+
+def main(argv=None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Serve the Kings in the Corner JSON/WebSocket API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
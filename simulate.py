@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Headless batch simulator for Kings in the Corner.
+
+Plays complete games of KingsCornerGame without Streamlit, using pluggable
+player policies, and streams one JSON line per game. Work is sharded across
+a process pool so throughput scales with the number of cores.
+
+Usage:
+    python simulate.py --games 10000 --players 2 --policy greedy -o results.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
+
+from bitboard import FIRST_CORNER, BitboardState, to_move
+from game import KingsCornerGame, Move
+
+# A policy picks the next action for the current player, or None to finish
+# the turn (the simulator then draws, or ends the turn if the deck is empty)
+Policy = Callable[[KingsCornerGame, str, random.Random], Optional[Move]]
+
+MAX_ACTIONS_PER_TURN = 200
+DEFAULT_MAX_TURNS = 1000
+LOOKAHEAD_DEPTH = 4
+
+
+def useful_moves(game: KingsCornerGame, player_id: str) -> List[Move]:
+    """Return the legal moves that change the position.
+
+    Moving a pile onto an empty pile only relabels it, unless it carries a
+    King off a foundation into a corner, so such moves are dropped; this
+    also guarantees a turn cannot loop forever.
+    """
+    return [
+        move for move in game.legal_moves(player_id)
+        if move.kind == "play"
+        or game.piles[move.target].cards
+        or (move.target in game.corner_piles and move.source in game.foundation_piles)
+    ]
+
+
+def random_policy(game: KingsCornerGame, player_id: str, rng: random.Random) -> Optional[Move]:
+    """Play a uniformly random useful move."""
+    moves = useful_moves(game, player_id)
+    return rng.choice(moves) if moves else None
+
+
+def greedy_policy(game: KingsCornerGame, player_id: str, rng: random.Random) -> Optional[Move]:
+    """Free up piles first, then shed the highest card available."""
+    best_move = None
+    best_score = 0
+    for move in useful_moves(game, player_id):
+        if move.kind == "move":
+            score = 20
+        elif move.target in game.corner_piles:
+            score = 15
+        else:
+            score = move.card.value
+        if score > best_score:
+            best_move, best_score = move, score
+    return best_move
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+def lookahead_policy(game: KingsCornerGame, player_id: str, rng: random.Random,
+                     deadline: Optional[float] = None) -> Optional[Move]:
+    """Search this turn's move sequences and start the one that sheds most.
+
+    Positions are scored by cards left in hand, then Kings in the corners.
+    The search deepens one ply at a time up to LOOKAHEAD_DEPTH; if
+    time.monotonic() passes `deadline` it answers from the deepest search
+    that finished (or plays greedily if none did).
+    """
+    state = BitboardState.from_game(game)
+    player = state.current
+    if state.players[player][0] != player_id:
+        return None
+
+    def score() -> int:
+        corners = sum(1 for pile in state.piles[FIRST_CORNER:] if pile[2])
+        return -16 * bin(state.hands[player]).count("1") + corners
+
+    def search(depth: int) -> int:
+        if deadline is not None and time.monotonic() > deadline:
+            raise _OutOfTime
+        best = score()
+        if depth and state.winner is None:
+            for move in state.useful_moves():
+                state.apply(move)
+                best = max(best, search(depth - 1))
+                state.undo()
+        return best
+
+    baseline = score()
+    moves = state.useful_moves()
+    best_move = None
+    try:
+        for depth in range(LOOKAHEAD_DEPTH):
+            best_score, best_at_depth = baseline, None
+            for move in moves:
+                state.apply(move)
+                value = search(depth)
+                state.undo()
+                if value > best_score:
+                    best_score, best_at_depth = value, move
+            best_move = best_at_depth
+    except _OutOfTime:
+        if best_move is None:
+            return greedy_policy(game, player_id, rng)
+
+    return to_move(best_move) if best_move is not None else None
+
+
+POLICIES: Dict[str, Policy] = {
+    'random': random_policy,
+    'greedy': greedy_policy,
+    'lookahead': lookahead_policy,
+}
+
+
+def _apply(game: KingsCornerGame, player_id: str, move: Move) -> bool:
+    """Apply a Move through the normal game entry points."""
+    if move.kind == "play":
+        success, _ = game.play_card(player_id, move.card, move.target)
+    else:
+        success, _ = game.move_pile(player_id, move.source, move.target)
+    return success
+
+
+def play_game(seed: int, num_players: int = 2, policy: str = 'greedy',
+              max_turns: int = DEFAULT_MAX_TURNS) -> Dict:
+    """Play one full game and return its summary."""
+    choose = POLICIES[policy]
+    rng = random.Random(seed)
+
+    game = KingsCornerGame(seed=seed)
+    for seat in range(num_players):
+        game.add_player(f"Player {seat + 1}")
+    game.start_game()
+
+    turns = 0
+    actions = 0
+    cards_drawn = 0
+    idle_turns = 0
+    stalemate = False
+
+    while not game.game_over and turns < max_turns:
+        player = game.get_current_player()
+        acted = False
+        for _ in range(MAX_ACTIONS_PER_TURN):
+            move = choose(game, player.id, rng)
+            if move is None or not _apply(game, player.id, move):
+                break
+            acted = True
+            actions += 1
+            if game.game_over:
+                break
+
+        turns += 1
+        if game.game_over:
+            break
+
+        if game.deck.is_empty():
+            game.end_turn()
+            # Nobody can draw, so a full round without plays is a dead end
+            idle_turns = 0 if acted else idle_turns + 1
+            if idle_turns >= num_players:
+                stalemate = True
+                break
+        else:
+            game.draw_card(player.id)
+            cards_drawn += 1
+
+    winner = game.players.index(game.winner) if game.winner else None
+    return {
+        'seed': seed,
+        'players': num_players,
+        'policy': policy,
+        'winner': winner,
+        'turns': turns,
+        'actions': actions,
+        'cards_drawn': cards_drawn,
+        'deck_exhausted': game.deck.is_empty(),
+        'stalemate': stalemate,
+    }
+
+
+def _play_shard(shard: tuple) -> List[Dict]:
+    """Worker entry point: play a contiguous range of seeds."""
+    first_seed, count, num_players, policy, max_turns = shard
+    return [
+        play_game(seed, num_players, policy, max_turns)
+        for seed in range(first_seed, first_seed + count)
+    ]
+
+
+def run_simulations(games: int, num_players: int = 2, policy: str = 'greedy',
+                    seed: int = 0, workers: Optional[int] = None,
+                    chunk_size: int = 64,
+                    max_turns: int = DEFAULT_MAX_TURNS) -> Iterator[Dict]:
+    """Play `games` games with seeds seed..seed+games-1 and yield results in order.
+
+    With workers=1 games run in-process; otherwise shards of `chunk_size`
+    games are fanned out to a ProcessPoolExecutor (one worker per core by
+    default) and results are yielded as each shard completes.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy: {policy}")
+
+    shards = [
+        (seed + start, min(chunk_size, games - start), num_players, policy, max_turns)
+        for start in range(0, games, chunk_size)
+    ]
+
+    if workers == 1:
+        for shard in shards:
+            yield from _play_shard(shard)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for results in executor.map(_play_shard, shards):
+            yield from results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Simulate Kings in the Corner games headlessly.")
+    parser.add_argument("-n", "--games", type=int, default=1000, help="number of games to play")
+    parser.add_argument("-p", "--players", type=int, default=2, choices=[2, 3, 4])
+    parser.add_argument("--policy", default="greedy", choices=sorted(POLICIES))
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="games per work unit")
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS)
+    parser.add_argument("-o", "--output", default="-", help="JSONL output file ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    wins: Dict[Optional[int], int] = {}
+    started = time.perf_counter()
+    try:
+        for result in run_simulations(args.games, args.players, args.policy, args.seed,
+                                      args.workers, args.chunk_size, args.max_turns):
+            out.write(json.dumps(result) + "\n")
+            wins[result['winner']] = wins.get(result['winner'], 0) + 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"{args.games} games in {elapsed:.2f}s ({args.games / elapsed:.0f} games/s); "
+          f"wins by seat: {dict(sorted(wins.items(), key=lambda item: str(item[0])))}",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
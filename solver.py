@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Exact solver for a single turn of Kings in the Corner.
+
+Within a turn a player may chain any number of card plays and pile moves
+before drawing, so "shed as many cards as possible" is a search over
+action sequences. solve_turn() runs a depth-first search on a
+BitboardState with apply/undo and memoizes the best number of cards still
+playable from every position it reaches, keyed on a Zobrist hash.
+
+Only what decides future moves goes into the key, and only up to
+symmetry. The two cards of a rank and colour (say 7♥ and 7♦) go on the
+same piles and take the same cards on top of them, so within a turn they
+are interchangeable: the key holds how many of each such pair are in hand,
+and each pile's pair at the bottom and at the top (a pile's bottom says
+where it can be moved, its top what it accepts; the cards in between
+never matter again this turn). Pile keys depend on the pile's kind,
+foundation or corner, but not on which one it is. The search in turn
+tries only one card of a pair, and only the first empty foundation and
+the first empty corner as targets.
+
+Most positions also have a forced action, one that is never worse than
+any alternative (see forced_move), and where there is one the search plays
+it without branching. Every action either sheds a card or reduces the
+number of piles in play, so the search space is acyclic and the memoized
+values are exact.
+"""
+import math
+import random
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from bitboard import FIRST_CORNER, MOVE, PLAY, BitboardState, iter_cards, to_move
+from cards import CARDS, KINGS_MASK, PLAYABLE_ON, Color
+from game import KingsCornerGame, Move
+from zobrist import position_hash
+
+DEFAULT_TIME_LIMIT_MS = 50
+
+# The two cards of a rank and colour are a pair, numbered 0-25. Card ids
+# run suit by suit (♥ ♦ ♣ ♠), so a card's twin is 13 ids away and the
+# lower card of every pair is in LOWER: red ranks at bits 0-12 and black
+# ranks at bits 26-38.
+PAIR = tuple((card.value - 1) * 2 + (card.color == Color.RED) for card in CARDS)
+TWIN = tuple(card.id + 13 if card.id % 26 < 13 else card.id - 13 for card in CARDS)
+RANKS = (1 << 13) - 1
+LOWER = RANKS | RANKS << 26
+NOT_KINGS = LOWER & ~KINGS_MASK
+
+
+def _twins(mask: int) -> int:
+    """The twins of every card in a mask."""
+    return (mask & LOWER) << 13 | (mask >> 13) & LOWER
+
+
+def _held(mask: int) -> Tuple[int, int]:
+    """Pairs with at least one and with two cards in a mask, as LOWER bits."""
+    low, high = mask & LOWER, (mask >> 13) & LOWER
+    return low | high, low & high
+
+
+def _children(pairs: int) -> int:
+    """The pairs that go on the given pairs (LOWER bits): a rank down, other colour."""
+    return (pairs >> 27) & RANKS | (pairs << 25) & (RANKS << 26)
+
+
+def _parents(pairs: int) -> int:
+    """The pairs the given pairs (LOWER bits) go on: a rank up, other colour."""
+    return (pairs << 27) & (RANKS << 26) | (pairs >> 25) & RANKS
+
+
+def _dump_count(state: BitboardState) -> int:
+    """Cards that can still be dropped onto empty foundations to end the turn."""
+    empty = sum(1 for _, _, length in state.piles[:FIRST_CORNER] if not length)
+    return min(empty, bin(state.hands[state.current]).count("1"))
+
+_keys = random.Random(0x4B43)
+# [pair][copies in hand]
+ZOBRIST_HAND = tuple((0, _keys.getrandbits(64), _keys.getrandbits(64)) for _ in range(26))
+# [foundation or corner][bottom pair * 26 + top pair]
+ZOBRIST_PILE = tuple(tuple(_keys.getrandbits(64) for _ in range(26 * 26)) for _ in range(2))
+del _keys
+
+
+class TurnSolution(NamedTuple):
+    """The best sequence of actions for one turn."""
+    moves: List[Move]  # plays and pile moves, in order; then draw or end the turn
+    cards_played: int
+    positions: int  # distinct positions searched
+    complete: bool  # False if the time limit cut the search short
+    elapsed: float  # seconds
+
+
+def _pile_key(pile: int, span: Tuple[int, int, int]) -> int:
+    bottom, top, length = span
+    return ZOBRIST_PILE[pile >= FIRST_CORNER][PAIR[bottom] * 26 + PAIR[top]] if length else 0
+
+
+def position_key(state: BitboardState) -> int:
+    """Hash the current player's hand and every pile's bottom and top pair."""
+    hand = state.hands[state.current]
+    key = 0
+    for card_id in iter_cards(hand):
+        if card_id < TWIN[card_id] or not hand & (1 << TWIN[card_id]):
+            key ^= ZOBRIST_HAND[PAIR[card_id]][1 + bool(hand & (1 << TWIN[card_id]))]
+    for pile, span in enumerate(state.piles):
+        key ^= _pile_key(pile, span)
+    return key
+
+
+def turn_moves(state: BitboardState) -> List[Tuple]:
+    """The current player's plays and pile moves, up to symmetry.
+
+    Only the lower card of a pair held in hand is played. Empty
+    foundations are interchangeable, as are empty corners, so only the
+    first of each is offered as a target, and moving a pile onto an empty
+    foundation (which only relabels it) is left out.
+
+    Starting a foundation is only offered for a card that something in
+    hand or a pile could follow onto it. Anything else can just as well be
+    dropped on an empty foundation at the end of the turn, which the
+    search always counts as an option (see _dump_count). Nor is a card
+    that a pile accepts started on a foundation, unless its twin (in hand
+    or at the bottom of a pile) might need that spot: on the pile it keeps
+    the foundation free and loses nothing, since a foundation started with
+    it could only ever be moved onto that pile.
+    """
+    hand = state.hands[state.current]
+    piles = state.piles
+    empty_foundation = empty_corner = None
+    accepted = []
+    on_piles = bottoms = 0
+    for pile, (bottom, top, length) in enumerate(piles):
+        if length:
+            accepted.append(PLAYABLE_ON[top])
+            on_piles |= PLAYABLE_ON[top]
+            bottoms |= 1 << bottom
+        elif pile < FIRST_CORNER and empty_foundation is None:
+            empty_foundation = pile
+            accepted.append(0)
+        elif pile >= FIRST_CORNER and empty_corner is None:
+            empty_corner = pile
+            accepted.append(KINGS_MASK)
+        else:
+            accepted.append(0)
+
+    unique = hand & ~(_held(hand)[1] << 13)
+    if empty_foundation is not None:
+        fathers = _parents(_held(hand | bottoms)[0])
+        accepted[empty_foundation] = (unique & ~(on_piles & ~_twins(hand | bottoms))
+                                      & (fathers | fathers << 13))
+
+    moves = []
+    for pile, mask in enumerate(accepted):
+        for card_id in iter_cards(unique & mask):
+            moves.append((PLAY, card_id, pile))
+    for source, (bottom, _, length) in enumerate(piles):
+        if not length:
+            continue
+        bit = 1 << bottom
+        for target, mask in enumerate(accepted):
+            if target == source or not piles[target][2] and target < FIRST_CORNER:
+                continue
+            if bit & mask and (piles[target][2] or source < FIRST_CORNER):
+                moves.append((MOVE, source, target))
+    return moves
+
+
+def forced_move(state: BitboardState) -> Optional[Tuple]:
+    """Return an action that some best sequence starts with, if one is obvious.
+
+    A card that exactly one pile accepts can go there straight away when
+    no pile has its twin at the bottom, since only the pair could ever use
+    that spot; a pile can be moved onto the only pile that accepts its
+    bottom card when the twin is neither in the hand nor at the bottom of
+    another pile, freeing a foundation. Kings can go into empty corners,
+    from the hand or off a foundation, while there are corners for every
+    King that wants one.
+    """
+    hand = state.hands[state.current]
+    piles = state.piles
+    bottoms = once = twice = 0
+    empty_corner = None
+    empty_corners = 0
+    for pile, (bottom, top, length) in enumerate(piles):
+        if length:
+            bottoms |= 1 << bottom
+            accepted = PLAYABLE_ON[top]
+            twice |= once & accepted
+            once |= accepted
+        elif pile >= FIRST_CORNER:
+            empty_corners += 1
+            if empty_corner is None:
+                empty_corner = pile
+    single = once & ~twice & ~KINGS_MASK
+
+    def target(card_id: int) -> int:
+        bit = 1 << card_id
+        return next(pile for pile, (_, top, length) in enumerate(piles)
+                    if length and PLAYABLE_ON[top] & bit)
+
+    plays = hand & single & ~_twins(bottoms)
+    if plays:
+        card_id = (plays & -plays).bit_length() - 1
+        return (PLAY, card_id, target(card_id))
+    moves = bottoms & single & ~_twins(hand | bottoms)
+    kings = bin(hand & KINGS_MASK).count("1")
+    for source in range(FIRST_CORNER):
+        bottom, _, length = piles[source]
+        if length and (1 << bottom) & moves:
+            return (MOVE, source, target(bottom))
+        if length and (1 << bottom) & KINGS_MASK:
+            kings += 1
+    if empty_corner is not None and empty_corners >= kings:
+        for source in range(FIRST_CORNER):
+            bottom, _, length = piles[source]
+            if length and (1 << bottom) & KINGS_MASK:
+                return (MOVE, source, empty_corner)
+        if hand & KINGS_MASK:
+            kings = hand & KINGS_MASK
+            return (PLAY, (kings & -kings).bit_length() - 1, empty_corner)
+    return None
+
+
+def _candidates(state: BitboardState) -> List[Tuple]:
+    forced = forced_move(state)
+    return [forced] if forced is not None else turn_moves(state)
+
+
+def _child_key(state: BitboardState, key: int, move: Tuple) -> int:
+    """The key after `move`, computed before applying it."""
+    piles = state.piles
+    if move[0] == PLAY:
+        _, card_id, pile = move
+        bottom, top, length = piles[pile]
+        after = (bottom if length else card_id, card_id, length + 1)
+        copies = ZOBRIST_HAND[PAIR[card_id]]
+        held = 2 if state.hands[state.current] & (1 << TWIN[card_id]) else 1
+        return (key ^ copies[held] ^ copies[held - 1]
+                ^ _pile_key(pile, piles[pile]) ^ _pile_key(pile, after))
+    _, source, target = move
+    moved, previous = piles[source], piles[target]
+    after = (previous[0] if previous[2] else moved[0], moved[1], previous[2] + moved[2])
+    return (key ^ _pile_key(source, moved) ^ _pile_key(target, previous)
+            ^ _pile_key(target, after))
+
+
+def upper_bound(state: BitboardState) -> int:
+    """The most cards the current player could possibly play from here.
+
+    A card can only go on a card of its parent pair (one rank up, the
+    other colour) that is a pile top now or is in the hand, and each such
+    card takes one card or pile. Kings go into empty corners. Whatever is
+    left over has to start a foundation pile of its own and stays there,
+    so there can be no more of those than empty foundations plus the
+    foundation piles that could be moved off onto a spot nothing in hand
+    needs.
+    """
+    hand = state.hands[state.current]
+    tops = empty_corners = 0
+    for _, top, length in state.piles:
+        if length:
+            tops |= 1 << top
+    for _, _, length in state.piles[FIRST_CORNER:]:
+        if not length:
+            empty_corners += 1
+
+    need_one, need_two = _held(hand)
+    have_one, have_two = _held(hand | tops)
+    have_one, have_two = _children(have_one), _children(have_two)
+    homeless = (bin(need_one & ~have_one & NOT_KINGS).count("1")
+                + bin(need_two & ~have_two & NOT_KINGS).count("1"))
+    spare_corners = empty_corners - bin(hand & KINGS_MASK).count("1")
+    if spare_corners < 0:
+        homeless -= spare_corners
+
+    # Slots no hand card could use: first the ones nobody needs at all, then
+    # the second of a pair where the hand needs only one
+    spare_one = have_one & ~need_one
+    spare_two = have_two & ~need_two
+    free_foundations = 0
+    for bottom, _, length in state.piles[:FIRST_CORNER]:
+        if not length:
+            free_foundations += 1
+            continue
+        pair = 1 << (bottom if bottom % 26 < 13 else bottom - 13)
+        if pair & KINGS_MASK:
+            if spare_corners > 0:
+                spare_corners -= 1
+                free_foundations += 1
+        elif pair & spare_one:
+            spare_one ^= pair
+            free_foundations += 1
+        elif pair & spare_two:
+            spare_two ^= pair
+            free_foundations += 1
+    unplayable = homeless - free_foundations
+    return bin(hand).count("1") - (unplayable if unplayable > 0 else 0)
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+class _TurnSearch:
+    """One solve: the transposition table, the deadline and the best line so far."""
+
+    def __init__(self, state: BitboardState, deadline: float):
+        self.state = state
+        self.table: Dict[int, Tuple[int, bool]] = {}
+        self.deadline = deadline
+        self.path: List[Tuple] = []
+        # The line to the position with the most cards played so far plus
+        # still to come, in case the deadline cuts the search short
+        self.best_total = -1
+        self.best_path: Tuple = ()
+
+    def best(self, key: int, floor: int, played: int) -> Tuple[int, bool]:
+        """The most cards the current player can still play from this position.
+
+        Returns (value, exact). Positions that cannot beat `floor` are cut
+        off early; for those the value is only an upper bound, no more than
+        floor.
+        """
+        if time.monotonic() > self.deadline:
+            raise _OutOfTime
+        state, table = self.state, self.table
+        entry = table.get(key)
+        if entry is not None and (entry[1] or entry[0] <= floor):
+            if entry[1]:
+                self._note(played + entry[0])
+            return entry
+        bound = upper_bound(state)
+        if bound <= floor:
+            table[key] = (bound, False)
+            return bound, False
+
+        best = _dump_count(state)
+        self._note(played + best)
+        cut_off = 0  # the highest upper bound among children that were cut off
+        if bound > best:
+            for move in _candidates(state):
+                gain = move[0] == PLAY
+                child = _child_key(state, key, move)
+                state.apply(move)
+                self.path.append(move)
+                value, exact = self.best(child, max(best, floor) - gain, played + gain)
+                self.path.pop()
+                state.undo()
+                value += gain
+                if not exact:
+                    cut_off = max(cut_off, value)
+                elif value > best:
+                    best = value
+                    if best == bound:
+                        break  # nothing can beat that
+        entry = (best, True) if cut_off <= best else (cut_off, False)
+        table[key] = entry
+        return entry
+
+    def _note(self, total: int):
+        if total > self.best_total:
+            self.best_total = total
+            self.best_path = tuple(self.path)
+
+
+def solve_turn(game: KingsCornerGame, player_id: Optional[str] = None,
+               time_limit_ms: Optional[float] = DEFAULT_TIME_LIMIT_MS) -> TurnSolution:
+    """Find the action sequence that plays the most cards this turn.
+
+    Solves for the current player; raises ValueError if `player_id` is
+    given and it is not their turn. If the search runs past
+    `time_limit_ms` (None for no limit) the best sequence found so far is
+    returned, marked incomplete. A sequence never ends with a pile move
+    that does not lead to a play.
+    """
+    started = time.monotonic()
+    player = game.get_current_player()
+    if (not game.game_started or game.game_over or player is None
+            or (player_id is not None and player.id != player_id)):
+        raise ValueError("Not this player's turn")
+
+    state = BitboardState.from_game(game)
+    key = position_key(state)
+    deadline = math.inf if time_limit_ms is None else started + time_limit_ms / 1000
+    search = _TurnSearch(state, deadline)
+    try:
+        search.best(key, -1, 0)
+        complete = True
+    except _OutOfTime:
+        complete = False
+    # Replay the best line found up to a position that was solved exactly;
+    # after a complete search that is just the root
+    state = BitboardState.from_game(game)
+    line = list(search.best_path)
+    for move in line:
+        key = _child_key(state, key, move)
+        state.apply(move)
+
+    # Walk the table back down, each time to the child solved exactly with
+    # the most cards to come (or drop cards on empty foundations, if that
+    # is as good). Children are looked up by key, since a stored move
+    # could belong to a symmetric twin of the position.
+    table = search.table
+    while True:
+        best_move, best = None, _dump_count(state)
+        for move in _candidates(state):
+            gain = move[0] == PLAY
+            entry = table.get(_child_key(state, key, move))
+            if entry is not None and entry[1] and gain + entry[0] > best:
+                best_move, best = move, gain + entry[0]
+        if best_move is None:
+            break
+        key = _child_key(state, key, best_move)
+        state.apply(best_move)
+        line.append(best_move)
+
+    # Out of time before anything below was solved: finish greedily, with
+    # plays and forced moves only
+    while not complete:
+        move = forced_move(state) or next(
+            (move for move in turn_moves(state) if move[0] == PLAY), None)
+        if move is None:
+            break
+        state.apply(move)
+        line.append(move)
+
+    empty_foundations = [pile for pile in range(FIRST_CORNER) if not state.piles[pile][2]]
+    best = _dump_count(state)
+    for card_id, pile in zip(iter_cards(state.hands[state.current]), empty_foundations[:best]):
+        line.append((PLAY, card_id, pile))
+
+    return TurnSolution([to_move(move) for move in line],
+                        sum(move[0] == PLAY for move in line),
+                        len(table), complete, time.monotonic() - started)
+
+
+def solver_policy(game: KingsCornerGame, player_id: str, rng: random.Random,
+                  deadline: Optional[float] = None) -> Optional[Move]:
+    """Bot policy: make the first action of the best sequence for this turn."""
+    time_limit_ms = None if deadline is None else max((deadline - time.monotonic()) * 1000, 1.0)
+    try:
+        solution = solve_turn(game, player_id, time_limit_ms or DEFAULT_TIME_LIMIT_MS)
+    except ValueError:
+        return None
+    return solution.moves[0] if solution.moves else None
+
+
+def sample_position(seed: int, hand_size: int = 20, num_players: int = 2) -> KingsCornerGame:
+    """A freshly dealt game whose current player holds `hand_size` cards.
+
+    Hands smaller than the deal are trimmed, the extra cards going back on
+    top of the deck; larger ones are topped up from the deck.
+    """
+    game = KingsCornerGame(seed=seed)
+    for seat in range(num_players):
+        game.add_player(f"Player {seat + 1}")
+    game.start_game()
+    player = game.get_current_player()
+    while len(player.hand) > hand_size:
+        card = list(player.hand)[-1]
+        player.hand.remove(card)
+        game.deck.cards.append(card)
+    while len(player.hand) < hand_size and not game.deck.is_empty():
+        player.hand.append(game.deck.cards.pop())
+    game.position_hash = position_hash(game)
+    return game
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Solve a batch of dealt positions without a time limit and report solve times."""
+    hand_size = int(argv[0]) if argv else 20
+    times = []
+    for seed in range(200):
+        solution = solve_turn(sample_position(seed, hand_size), time_limit_ms=None)
+        times.append(solution.elapsed * 1000)
+    times.sort()
+    slow = sum(1 for elapsed in times if elapsed > DEFAULT_TIME_LIMIT_MS)
+    print(f"{len(times)} positions with {hand_size}-card hands: median {times[len(times) // 2]:.2f} ms, "
+          f"p99 {times[int(len(times) * 0.99)]:.2f} ms, max {times[-1]:.2f} ms; "
+          f"{slow} over the {DEFAULT_TIME_LIMIT_MS} ms default limit")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,773 @@
+"""
+Storage backends for game sessions.
+
+GameSessionManager keeps its games and player bindings in a GameStore.
+InMemoryGameStore is the single-process default; SqliteGameStore adds
+durability across restarts; RedisGameStore shares games between any number
+of app processes behind a load balancer.
+"""
+import atexit
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from codec import decode_game, encode_game
+from game import KingsCornerGame
+
+try:
+    import redis
+except ImportError:  # Only needed for RedisGameStore
+    redis = None
+
+
+def _state_update(game: KingsCornerGame, since_version: int, player_id: Optional[str],
+                  include_pile_cards: bool) -> Dict:
+    diff = game.get_state_diff(since_version, player_id)
+    if diff is not None:
+        return {'type': 'diff', 'diff': diff}
+    if player_id is None:
+        return {'type': 'full', 'state': game.get_game_state(include_pile_cards)}
+    return {'type': 'full', 'state': game.get_player_view(player_id, include_pile_cards)}
+
+
+def _seat_of(game: KingsCornerGame, player_id: str) -> Optional[int]:
+    """A player's seat index, or None for anyone not playing in the game."""
+    player = game.get_player(player_id)
+    return game.players.index(player) if player else None
+
+
+class GameStore(ABC):
+    """Interface for keeping games and player→game bindings."""
+
+    def __init__(self, session_timeout: float = 3600):
+        self.session_timeout = session_timeout
+        self._listeners: List[Callable[[str, int], None]] = []
+
+    def add_listener(self, listener: Callable[[str, int], None], remote: bool = False):
+        """Call listener(game_id, version) after every change made through this store.
+
+        With remote=True, stores shared between processes also report
+        changes that other processes make.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str, int], None]):
+        self._listeners.remove(listener)
+
+    def _notify(self, game_id: str, version: int):
+        for listener in list(self._listeners):
+            listener(game_id, version)
+
+    @abstractmethod
+    def add_game(self, game: KingsCornerGame):
+        """Store a newly created game."""
+
+    @abstractmethod
+    def get_game(self, game_id: str) -> Optional[KingsCornerGame]:
+        """Return a game and mark it active, or None if missing or expired."""
+
+    @abstractmethod
+    def update(self, game_id: str, action: Callable[[KingsCornerGame], Any]) -> Tuple[bool, Any]:
+        """Run `action` on a game as one read-modify-write.
+
+        Returns (found, action result). Changes made by the action are
+        persisted if it bumped the game's version.
+        """
+
+    def get_version(self, game_id: str) -> Optional[int]:
+        """Return a game's version without building its state, or None if missing."""
+        game = self.get_game(game_id)
+        return game.version if game else None
+
+    def wait_for_change(self, game_id: str, since_version: Optional[int],
+                        timeout: float) -> Optional[int]:
+        """Block until a game's version differs from since_version.
+
+        Returns the current version (still since_version if `timeout`
+        seconds passed first), or None if the game is missing. This
+        fallback polls; subclasses wake waiters as soon as a change lands.
+        """
+        deadline = time.monotonic() + timeout
+        version = self.get_version(game_id)
+        while version is not None and version == since_version:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 0.05))
+            version = self.get_version(game_id)
+        return version
+
+    def get_game_state(self, game_id: str, include_pile_cards: bool = True) -> Optional[Dict]:
+        """Return a game's get_game_state() dict, or None if missing."""
+        game = self.get_game(game_id)
+        return game.get_game_state(include_pile_cards) if game else None
+
+    def get_player_view(self, game_id: str, player_id: str,
+                        include_pile_cards: bool = True) -> Optional[Dict]:
+        """Return a game's get_player_view() for one seat, or None if missing."""
+        game = self.get_game(game_id)
+        return game.get_player_view(player_id, include_pile_cards) if game else None
+
+    def get_state_diff(self, game_id: str, since_version: int, player_id: Optional[str] = None,
+                       include_pile_cards: bool = True) -> Optional[Dict]:
+        """Return {'type': 'diff', 'diff': ...} since since_version, or None if missing.
+
+        Falls back to {'type': 'full', 'state': ...} (the player view, or
+        the full state when player_id is None) when no diff is possible.
+        """
+        game = self.get_game(game_id)
+        return _state_update(game, since_version, player_id, include_pile_cards) if game else None
+
+    @abstractmethod
+    def bind_player(self, player_id: str, game_id: str):
+        """Record which game a player is in."""
+
+    @abstractmethod
+    def get_player_game_id(self, player_id: str) -> Optional[str]:
+        """Return the id of the game a player is in."""
+
+    @abstractmethod
+    def games(self) -> Iterator[KingsCornerGame]:
+        """Iterate over all live games."""
+
+    def cleanup_expired(self):
+        """Drop games that have been idle longer than session_timeout."""
+
+
+class InMemoryGameStore(GameStore):
+    """Process-local store backed by plain dicts, safe to share across threads.
+
+    _last_activity is kept in least-recently-active order, so touching a
+    game is O(1) and expired games are always at the front. Reads only
+    check the game they return; a background sweeper removes the rest
+    every `sweep_interval` seconds (None disables it).
+
+    The registry dicts have their own lock, held only for O(1) lookups.
+    Game mutations run under a per-game lock picked from `lock_stripes`
+    striped locks, so actions in different games rarely contend. States
+    for readers are built once per change and published; readers take
+    the published dict without locking. Each lock stripe has a condition
+    that wait_for_change() sleeps on until an update notifies it.
+    """
+
+    def __init__(self, session_timeout: float = 3600, sweep_interval: Optional[float] = 60,
+                 lock_stripes: int = 64):
+        super().__init__(session_timeout)
+        self._games: Dict[str, KingsCornerGame] = {}
+        self._player_sessions: Dict[str, str] = {}  # player_id -> game_id
+        # game_id -> monotonic timestamp, oldest first
+        self._last_activity: 'OrderedDict[str, float]' = OrderedDict()
+        # game_id -> {include_pile_cards or (player_id, include_pile_cards):
+        # latest state or player view}; dropped on every change, read-only
+        self._published: Dict[str, Dict[Any, Dict]] = {}
+        # Guards the registry dicts above (also against the sweeper thread)
+        self._lock = threading.RLock()
+        self._game_locks = tuple(threading.RLock() for _ in range(lock_stripes))
+        self._game_changed = tuple(threading.Condition(lock) for lock in self._game_locks)
+
+        self._stop_sweeper = threading.Event()
+        if sweep_interval:
+            threading.Thread(
+                target=self._sweep, args=(sweep_interval,),
+                name="game-store-sweeper", daemon=True,
+            ).start()
+
+    def close(self):
+        """Stop the background sweeper."""
+        self._stop_sweeper.set()
+
+    def _sweep(self, interval: float):
+        while not self._stop_sweeper.wait(interval):
+            self.cleanup_expired()
+
+    def add_game(self, game: KingsCornerGame):
+        with self._lock:
+            self._games[game.game_id] = game
+            self._last_activity[game.game_id] = time.monotonic()
+
+    def get_game(self, game_id: str) -> Optional[KingsCornerGame]:
+        now = time.monotonic()
+        with self._lock:
+            game = self._games.get(game_id)
+            if game is None:
+                return None
+            if now - self._last_activity[game_id] > self.session_timeout:
+                self._remove_game(game_id)
+                return None
+            self._last_activity[game_id] = now
+            self._last_activity.move_to_end(game_id)
+        return game
+
+    def lock_for(self, game_id: str) -> threading.RLock:
+        """Return the lock that serializes mutations of a game."""
+        return self._game_locks[hash(game_id) % len(self._game_locks)]
+
+    def _changed_for(self, game_id: str) -> threading.Condition:
+        """Return the condition notified when a game changes (wraps lock_for)."""
+        return self._game_changed[hash(game_id) % len(self._game_changed)]
+
+    def update(self, game_id: str, action: Callable[[KingsCornerGame], Any]) -> Tuple[bool, Any]:
+        game = self.get_game(game_id)
+        if not game:
+            return False, None
+        changed = self._changed_for(game_id)
+        with changed:
+            version = game.version
+            result = action(game)
+            new_version = game.version
+            if new_version != version:
+                self._published.pop(game_id, None)
+                changed.notify_all()
+        if new_version != version:
+            self._notify(game_id, new_version)
+        return True, result
+
+    def wait_for_change(self, game_id: str, since_version: Optional[int],
+                        timeout: float) -> Optional[int]:
+        game = self.get_game(game_id)
+        if not game:
+            return None
+        # Stripes are shared, so wake-ups for other games just re-check
+        changed = self._changed_for(game_id)
+        with changed:
+            changed.wait_for(lambda: game.version != since_version, timeout)
+            return game.version
+
+    def _get_published(self, game_id: str, key_for: Callable[[KingsCornerGame], Any],
+                       build: Callable[[KingsCornerGame], Dict]) -> Optional[Dict]:
+        """Return the published result for key_for(game), building it once per change."""
+        game = self.get_game(game_id)
+        if not game:
+            return None
+        key = key_for(game)
+        state = self._published.get(game_id, {}).get(key)
+        if state is None:
+            # Build under the game lock so the state is never torn mid-action
+            with self.lock_for(game_id):
+                published = self._published.setdefault(game_id, {})
+                state = published.get(key)
+                if state is None:
+                    state = published[key] = build(game)
+        return state
+
+    def get_game_state(self, game_id: str, include_pile_cards: bool = True) -> Optional[Dict]:
+        return self._get_published(
+            game_id, lambda game: include_pile_cards,
+            lambda game: game.get_game_state(include_pile_cards)
+        )
+
+    def get_player_view(self, game_id: str, player_id: str,
+                        include_pile_cards: bool = True) -> Optional[Dict]:
+        # Keyed by seat, so spectators and unknown ids share a single view
+        return self._get_published(
+            game_id, lambda game: ('view', _seat_of(game, player_id), include_pile_cards),
+            lambda game: game.get_player_view(player_id, include_pile_cards)
+        )
+
+    def get_state_diff(self, game_id: str, since_version: int, player_id: Optional[str] = None,
+                       include_pile_cards: bool = True) -> Optional[Dict]:
+        # Most watchers are one version behind, so they share one diff; a
+        # None player_id sees every hand, so it gets its own
+        return self._get_published(
+            game_id,
+            lambda game: ('diff', since_version,
+                          'all' if player_id is None else _seat_of(game, player_id), include_pile_cards),
+            lambda game: _state_update(game, since_version, player_id, include_pile_cards)
+        )
+
+    def bind_player(self, player_id: str, game_id: str):
+        with self._lock:
+            self._player_sessions[player_id] = game_id
+
+    def get_player_game_id(self, player_id: str) -> Optional[str]:
+        return self._player_sessions.get(player_id)
+
+    def games(self) -> Iterator[KingsCornerGame]:
+        with self._lock:
+            return iter(list(self._games.values()))
+
+    def cleanup_expired(self):
+        # Oldest first, so stop at the first game that is still live
+        cutoff = time.monotonic() - self.session_timeout
+        with self._lock:
+            while self._last_activity:
+                game_id, last_activity = next(iter(self._last_activity.items()))
+                if last_activity >= cutoff:
+                    break
+                self._remove_game(game_id)
+
+    def _remove_game(self, game_id: str):
+        """Remove a game and clean up associated data."""
+        if game_id in self._games:
+            game = self._games[game_id]
+            # Remove player sessions
+            for player in game.players:
+                if player.id in self._player_sessions:
+                    del self._player_sessions[player.id]
+
+            del self._games[game_id]
+            del self._last_activity[game_id]
+            self._published.pop(game_id, None)
+
+
+class SqliteGameStore(InMemoryGameStore):
+    """In-memory store that persists games to SQLite, write-behind.
+
+    Games are served from memory exactly as by InMemoryGameStore. Changed
+    games are only marked dirty; a background thread writes them every
+    `flush_interval` seconds (None disables it; call flush() yourself) in
+    one transaction, so no request waits on the disk. Several changes to a
+    game between flushes cost a single write of its codec bytes (position
+    and action log). The database runs in WAL mode with synchronous=NORMAL:
+    a crash loses at most the last flush interval, never a torn game.
+
+    After a restart games and player bindings load lazily on first use.
+    Finished games move to a compressed `finished_games` table (cold
+    storage) that never expires; live games idle longer than
+    session_timeout are purged by cleanup_expired().
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS games ("
+        " game_id TEXT PRIMARY KEY, version INTEGER NOT NULL,"
+        " updated REAL NOT NULL, data BLOB NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS finished_games ("
+        " game_id TEXT PRIMARY KEY, finished REAL NOT NULL, data BLOB NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS players ("
+        " player_id TEXT PRIMARY KEY, game_id TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS games_updated ON games (updated)",
+    )
+
+    def __init__(self, path: str = "games.db", session_timeout: float = 3600,
+                 sweep_interval: Optional[float] = 60, flush_interval: Optional[float] = 0.5,
+                 lock_stripes: int = 64):
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            self._db.execute(statement)
+        # Serializes use of the connection between request and flush threads
+        self._db_lock = threading.Lock()
+        # Loads of the same game must not race into two copies
+        self._load_lock = threading.Lock()
+        super().__init__(session_timeout, sweep_interval, lock_stripes)
+
+        # Waiting to be written, guarded by self._lock
+        self._dirty: Dict[str, KingsCornerGame] = {}
+        self._pending_players: Dict[str, str] = {}
+
+        self._flush_wakeup = threading.Event()
+        self._closed = False
+        if flush_interval:
+            threading.Thread(
+                target=self._flush_loop, args=(flush_interval,),
+                name="game-store-flusher", daemon=True,
+            ).start()
+        atexit.register(self.close)
+
+    def close(self):
+        """Stop the background threads, write everything pending, close the database."""
+        if self._closed:
+            return
+        self._closed = True
+        super().close()
+        self._flush_wakeup.set()
+        self.flush()
+        with self._db_lock:
+            self._db.close()
+
+    def _flush_loop(self, interval: float):
+        while not self._closed:
+            self._flush_wakeup.wait(interval)
+            self._flush_wakeup.clear()
+            if self._closed:
+                break
+            try:
+                self.flush()
+            except sqlite3.Error:
+                pass  # pending writes were re-queued; retry on the next tick
+
+    def flush(self):
+        """Write every dirty game and binding in one transaction."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            players, self._pending_players = self._pending_players, {}
+        if not dirty and not players:
+            return
+
+        now = time.time()
+        live, finished = [], []
+        for game_id, game in dirty.items():
+            # Encode under the game lock, so no half-applied action is written
+            with self.lock_for(game_id):
+                data = encode_game(game)
+                if game.game_over:
+                    finished.append((game_id, now, zlib.compress(data)))
+                else:
+                    live.append((game_id, game.version, now, data))
+        try:
+            self._write([
+                ("INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?)", live),
+                ("INSERT OR REPLACE INTO finished_games VALUES (?, ?, ?)", finished),
+                ("DELETE FROM games WHERE game_id = ?", [(row[0],) for row in finished]),
+                ("INSERT OR REPLACE INTO players VALUES (?, ?)", list(players.items())),
+            ])
+        except sqlite3.Error:
+            # Re-queue, without clobbering anything that changed meanwhile
+            with self._lock:
+                for game_id, game in dirty.items():
+                    self._dirty.setdefault(game_id, game)
+                for player_id, game_id in players.items():
+                    self._pending_players.setdefault(player_id, game_id)
+            raise
+
+    def _write(self, batches: List[Tuple[str, List[tuple]]]):
+        """Run (statement, rows) batches in one transaction."""
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            try:
+                for statement, rows in batches:
+                    if rows:
+                        self._db.executemany(statement, rows)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _mark_dirty(self, game: KingsCornerGame):
+        with self._lock:
+            self._dirty[game.game_id] = game
+
+    def add_game(self, game: KingsCornerGame):
+        super().add_game(game)
+        self._mark_dirty(game)
+
+    def get_game(self, game_id: str) -> Optional[KingsCornerGame]:
+        game = super().get_game(game_id)
+        if game is None:
+            game = self._load(game_id)
+        return game
+
+    def _load(self, game_id: str) -> Optional[KingsCornerGame]:
+        """Bring a game back into memory from the database, if it is still live."""
+        if game_id in self._dirty:
+            self.flush()  # evicted before its last write landed
+        with self._load_lock:
+            with self._lock:
+                game = self._games.get(game_id)
+            if game is not None:
+                return game
+
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT data, updated FROM games WHERE game_id = ?", (game_id,)
+                ).fetchone()
+                compressed = None
+                if row is None:
+                    compressed = self._db.execute(
+                        "SELECT data FROM finished_games WHERE game_id = ?", (game_id,)
+                    ).fetchone()
+            if row is not None:
+                if time.time() - row[1] > self.session_timeout:
+                    return None
+                game = decode_game(row[0])
+            elif compressed is not None:
+                game = decode_game(zlib.decompress(compressed[0]))
+            else:
+                return None
+            super().add_game(game)
+            with self._lock:
+                for player in game.players:
+                    self._player_sessions.setdefault(player.id, game_id)
+            return game
+
+    def update(self, game_id: str, action: Callable[[KingsCornerGame], Any]) -> Tuple[bool, Any]:
+        def tracked(game: KingsCornerGame) -> Any:
+            version = game.version
+            result = action(game)
+            if game.version != version:
+                self._mark_dirty(game)
+            return result
+
+        return super().update(game_id, tracked)
+
+    def bind_player(self, player_id: str, game_id: str):
+        with self._lock:
+            self._player_sessions[player_id] = game_id
+            self._pending_players[player_id] = game_id
+
+    def get_player_game_id(self, player_id: str) -> Optional[str]:
+        game_id = super().get_player_game_id(player_id)
+        if game_id is None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT game_id FROM players WHERE player_id = ?", (player_id,)
+                ).fetchone()
+            if row is not None:
+                game_id = row[0]
+                with self._lock:
+                    self._player_sessions.setdefault(player_id, game_id)
+        return game_id
+
+    def games(self) -> Iterator[KingsCornerGame]:
+        # Live games in the database that have not been loaded since a restart
+        cutoff = time.time() - self.session_timeout
+        with self._db_lock:
+            stored = [game_id for game_id, in self._db.execute(
+                "SELECT game_id FROM games WHERE updated >= ?", (cutoff,))]
+        for game_id in stored:
+            if game_id not in self._games:
+                self._load(game_id)
+        return super().games()
+
+    def cleanup_expired(self):
+        super().cleanup_expired()
+        # Games still in memory may only have been read lately; keep them
+        cutoff = time.time() - self.session_timeout
+        with self._db_lock:
+            expired = [game_id for game_id, in self._db.execute(
+                "SELECT game_id FROM games WHERE updated < ?", (cutoff,))]
+        expired = [(game_id,) for game_id in expired
+                   if game_id not in self._games and game_id not in self._dirty]
+        if expired:
+            self._write([
+                ("DELETE FROM games WHERE game_id = ?", expired),
+                ("DELETE FROM players WHERE game_id = ?", expired),
+            ])
+
+
+_pools: Dict[str, Any] = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(url: str):
+    """Return the process-wide Redis connection pool for a URL."""
+    with _pools_lock:
+        pool = _pools.get(url)
+        if pool is None:
+            pool = _pools[url] = redis.ConnectionPool.from_url(url)
+        return pool
+
+
+class RedisGameStore(GameStore):
+    """Redis-backed store shared by every app process.
+
+    Games are stored in the codec module's binary format under `<prefix>game:<id>`,
+    their version under `<prefix>version:<id>` and player bindings under
+    `<prefix>player:<id>`. Expiry uses native key
+    TTLs; every read or update of a game refreshes all of its keys in the
+    same round trip, so no sweep is needed. Player ids are learned from the
+    games this process decodes, and a player that joined elsewhere has
+    their binding refreshed here once the new version is read. Updates use WATCH/MULTI and retry if another process wrote the
+    game in between. Every change publishes the new version on
+    `<prefix>changes:<id>`, which wait_for_change() subscribes to. While
+    any remote listener is registered, a background thread subscribes to
+    every game's channel and passes them changes made by other processes
+    too (so they may hear changes made here twice).
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", client=None,
+                 session_timeout: float = 3600, prefix: str = "kc:"):
+        super().__init__(session_timeout)
+        if client is None:
+            if redis is None:
+                raise RuntimeError("RedisGameStore requires the 'redis' package")
+            client = redis.Redis(connection_pool=get_connection_pool(url))
+        self._redis = client
+        self._prefix = prefix
+        # (game_id, version, player_id, include_pile_cards) -> view, LRU order
+        self._views: 'OrderedDict[tuple, Dict]' = OrderedDict()
+        self._views_lock = threading.Lock()
+        self.view_cache_size = 1024
+        # game_id -> its player ids, for refreshing their bindings' TTLs
+        # without decoding the game; LRU order, bounded like the views
+        self._player_ids: 'OrderedDict[str, Tuple[str, ...]]' = OrderedDict()
+        # Pattern subscription thread feeding every process's changes to
+        # the remote listeners
+        self._remote_listeners: List[Callable[[str, int], None]] = []
+        self._subscriber = None
+        self._subscriber_lock = threading.Lock()
+
+    @property
+    def _ttl(self) -> int:
+        return int(self.session_timeout)
+
+    def _game_key(self, game_id: str) -> str:
+        return f"{self._prefix}game:{game_id}"
+
+    def _player_key(self, player_id: str) -> str:
+        return f"{self._prefix}player:{player_id}"
+
+    def _version_key(self, game_id: str) -> str:
+        return f"{self._prefix}version:{game_id}"
+
+    def _changes_channel(self, game_id: str) -> str:
+        return f"{self._prefix}changes:{game_id}"
+
+    def _refresh_ttls(self, pipe, game_id: str):
+        """Queue TTL refreshes for a game's keys and its known players' bindings."""
+        pipe.expire(self._game_key(game_id), self._ttl)
+        pipe.expire(self._version_key(game_id), self._ttl)
+        for player_id in self._player_ids.get(game_id, ()):
+            pipe.expire(self._player_key(player_id), self._ttl)
+
+    def _learn_players(self, game: KingsCornerGame) -> Tuple[str, ...]:
+        """Record a game's player ids; return those not known before."""
+        player_ids = tuple(player.id for player in game.players)
+        with self._views_lock:
+            known = self._player_ids.get(game.game_id, ())
+            self._player_ids[game.game_id] = player_ids
+            self._player_ids.move_to_end(game.game_id)
+            while len(self._player_ids) > self.view_cache_size:
+                self._player_ids.popitem(last=False)
+        return tuple(player_id for player_id in player_ids if player_id not in known)
+
+    def add_listener(self, listener: Callable[[str, int], None], remote: bool = False):
+        super().add_listener(listener)
+        if not remote:
+            return
+        with self._subscriber_lock:
+            self._remote_listeners.append(listener)
+            if self._subscriber is None:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(**{self._changes_channel("*"): self._on_published})
+                self._subscriber = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def remove_listener(self, listener: Callable[[str, int], None]):
+        super().remove_listener(listener)
+        with self._subscriber_lock:
+            if listener in self._remote_listeners:
+                self._remote_listeners.remove(listener)
+            if not self._remote_listeners and self._subscriber is not None:
+                self._subscriber.stop()
+                self._subscriber = None
+
+    def _on_published(self, message: Dict):
+        channel = message['channel']
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        game_id = channel[len(self._changes_channel("")):]
+        for listener in list(self._remote_listeners):
+            listener(game_id, int(message['data']))
+
+    def add_game(self, game: KingsCornerGame):
+        pipe = self._redis.pipeline()
+        pipe.set(self._game_key(game.game_id), encode_game(game), ex=self._ttl)
+        pipe.set(self._version_key(game.game_id), game.version, ex=self._ttl)
+        pipe.execute()
+        self._learn_players(game)
+
+    def get_version(self, game_id: str) -> Optional[int]:
+        # A separate small key, so polling never transfers the whole game
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.get(self._version_key(game_id))
+        self._refresh_ttls(pipe, game_id)
+        version = pipe.execute()[0]
+        return int(version) if version is not None else None
+
+    def get_game(self, game_id: str) -> Optional[KingsCornerGame]:
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.get(self._game_key(game_id))
+        self._refresh_ttls(pipe, game_id)
+        data = pipe.execute()[0]
+        if data is None:
+            return None
+        game = decode_game(data)
+        joined = self._learn_players(game)
+        if joined:
+            # Players this process had not seen yet missed the refresh above
+            pipe = self._redis.pipeline(transaction=False)
+            for player_id in joined:
+                pipe.expire(self._player_key(player_id), self._ttl)
+            pipe.execute()
+        return game
+
+    def update(self, game_id: str, action: Callable[[KingsCornerGame], Any]) -> Tuple[bool, Any]:
+        key = self._game_key(game_id)
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    data = pipe.get(key)
+                    if data is None:
+                        return False, None
+
+                    game = decode_game(data)
+                    version = game.version
+                    result = action(game)
+
+                    pipe.multi()
+                    changed = game.version != version
+                    if changed:
+                        pipe.set(key, encode_game(game), ex=self._ttl)
+                        pipe.set(self._version_key(game_id), game.version, ex=self._ttl)
+                        pipe.publish(self._changes_channel(game_id), game.version)
+                    self._learn_players(game)
+                    self._refresh_ttls(pipe, game_id)
+                    pipe.execute()
+                    if changed:
+                        self._notify(game_id, game.version)
+                    return True, result
+                except redis.WatchError:
+                    # Another process changed the game; re-read and retry
+                    continue
+
+    def wait_for_change(self, game_id: str, since_version: Optional[int],
+                        timeout: float) -> Optional[int]:
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            # Subscribe before reading the version, so no change is missed
+            pubsub.subscribe(self._changes_channel(game_id))
+            deadline = time.monotonic() + timeout
+            version = self.get_version(game_id)
+            while version is not None and version == since_version:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                message = pubsub.get_message(timeout=remaining)
+                if message is not None:
+                    version = int(message['data'])
+            return version
+        finally:
+            pubsub.close()
+
+    def get_player_view(self, game_id: str, player_id: str,
+                        include_pile_cards: bool = True) -> Optional[Dict]:
+        # Views are immutable per version, so a cache hit costs one small
+        # GET, pipelined with the TTL refreshes
+        version = self.get_version(game_id)
+        if version is None:
+            return None
+        key = (game_id, version, player_id, include_pile_cards)
+        with self._views_lock:
+            view = self._views.get(key)
+            if view is not None:
+                self._views.move_to_end(key)
+                return view
+
+        game = self.get_game(game_id)
+        if not game:
+            return None
+        view = game.get_player_view(player_id, include_pile_cards)
+        with self._views_lock:
+            self._views[(game_id, game.version, player_id, include_pile_cards)] = view
+            while len(self._views) > self.view_cache_size:
+                self._views.popitem(last=False)
+        return view
+
+    def bind_player(self, player_id: str, game_id: str):
+        self._redis.set(self._player_key(player_id), game_id, ex=self._ttl)
+
+    def get_player_game_id(self, player_id: str) -> Optional[str]:
+        game_id = self._redis.get(self._player_key(player_id))
+        return game_id.decode() if game_id is not None else None
+
+    def games(self) -> Iterator[KingsCornerGame]:
+        for key in self._redis.scan_iter(match=self._game_key("*"), count=500):
+            data = self._redis.get(key)
+            if data is not None:
+                yield decode_game(data)
@@ -3,7 +3,11 @@
 Simple test script to verify the Kings in the Corner game logic works correctly.
 """
 
-from cards import Card, Deck, Suit, GamePile
+import pickle
+
+import pytest
+
+from cards import Card, Deck, Suit, GamePile, CARDS, card_from_id
 from game import KingsCornerGame
 
 def test_card_creation():
@@ -21,6 +25,49 @@ def test_card_creation():
     print(f"Can King of Spades play on Queen of Clubs? {king_spades.can_play_on(queen_clubs)}")
     print()
 
+def test_card_interning():
+    """Test that cards are shared flyweights indexed by card id."""
+    print("Testing card interning...")
+    ace_hearts = Card(Suit.HEARTS, "A", 1)
+    assert ace_hearts is Card(Suit.HEARTS, "A")
+    assert ace_hearts is card_from_id(ace_hearts.id)
+    assert pickle.loads(pickle.dumps(ace_hearts)) is ace_hearts
+    assert len({card.id for card in CARDS}) == 52
+    assert all(card is CARDS[card.id] for card in Deck().cards)
+    
+    try:
+        Card(Suit.HEARTS, "A", 2)
+        assert False, "mismatched value should be rejected"
+    except ValueError:
+        pass
+    
+    try:
+        ace_hearts.value = 5
+        assert False, "cards should be immutable"
+    except AttributeError:
+        pass
+    print(f"{len(CARDS)} interned cards, {ace_hearts!r} has id {ace_hearts.id}")
+    print()
+
+def test_hand_index():
+    """Test O(1) hand membership, removal and ordering."""
+    from cards import Hand, card_from_symbols
+    from game import Player
+    print("Testing indexed hands...")
+    cards = [card_from_symbols(rank, "♣") for rank in ("2", "9", "K")]
+    player = Player("p1", "Alice", cards)
+    assert isinstance(player.hand, Hand) and player.hand == cards
+    assert player.hand.mask == sum(card.bit for card in cards)
+    
+    assert player.remove_card(cards[1]) and not player.remove_card(cards[1])
+    player.add_card(cards[1])
+    assert list(player.hand) == [cards[0], cards[2], cards[1]]
+    assert [c['rank'] for c in player.hand_state()] == ["2", "K", "9"]
+    assert card_from_symbols("10", "♥") is Card(Suit.HEARTS, "10", 10)
+    assert card_from_symbols("1", "♥") is None
+    print(f"Hand after remove/add: {[str(card) for card in player.hand]}")
+    print()
+
 def test_deck():
     """Test deck creation and dealing."""
     print("Testing deck...")
@@ -33,6 +80,27 @@ def test_deck():
     print(f"Cards remaining: {deck.cards_remaining()}")
     print()
 
+def test_seeded_deal():
+    """Test that a seed reproduces the deal without touching global state."""
+    import random
+    print("Testing seeded deals...")
+    assert [c.id for c in Deck(seed=7).cards] == [c.id for c in Deck(rng=random.Random(7)).cards]
+    assert [c.id for c in Deck(seed=7).cards] != [c.id for c in Deck(seed=8).cards]
+    
+    deals = []
+    for _ in range(2):
+        random.seed()  # global RNG must not influence the deal
+        game = KingsCornerGame(seed=1234)
+        game.add_player("Alice")
+        game.add_player("Bob")
+        game.start_game()
+        deals.append(game.get_game_state())
+    assert deals[0]['players'][0]['hand'] == deals[1]['players'][0]['hand']
+    assert deals[0]['seed'] == 1234
+    assert KingsCornerGame().seed is not None
+    print(f"Seed 1234 deals Alice: {[c['rank'] + c['suit'] for c in deals[0]['players'][0]['hand']]}")
+    print()
+
 def test_game_creation():
     """Test game creation and basic functionality."""
     print("Testing game creation...")
@@ -55,6 +123,377 @@ def test_game_creation():
     print(f"Player hands: Alice={len(state['players'][0]['hand'])}, Bob={len(state['players'][1]['hand'])}")
     print()
 
+def test_legal_moves():
+    """Test the legal-move generator against a brute-force scan."""
+    print("Testing legal move generation...")
+    game = KingsCornerGame()
+    alice = game.add_player("Alice")
+    bob = game.add_player("Bob")
+    game.start_game()
+    
+    # Seed a corner king and an empty foundation so every rule is exercised
+    game.foundation_piles['north'].cards = []
+    game.corner_piles['ne'].cards = [Card(Suit.SPADES, "K", 13)]
+    
+    expected = set()
+    player = game.get_current_player()
+    for name, pile in game.piles.items():
+        for card in player.hand:
+            if card.can_play_on(pile.get_top_card(), pile.pile_type):
+                expected.add(("play", name, card, None))
+        for source, other in game.piles.items():
+            if source != name and other.cards and \
+                    other.cards[0].can_play_on(pile.get_top_card(), pile.pile_type):
+                expected.add(("move", name, None, source))
+    
+    moves = game.legal_moves(alice)
+    assert set(moves) == expected and len(moves) == len(expected)
+    assert game.legal_moves(bob) == []
+    print(f"{len(moves)} legal moves for {player.name}")
+    print()
+
+def test_bitboard_state():
+    """Test bitboard conversion, move generation and apply/undo."""
+    import random
+    from bitboard import BitboardState, DRAW, PILE_NAMES
+    print("Testing bitboard state engine...")
+    game = KingsCornerGame()
+    alice = game.add_player("Alice")
+    game.add_player("Bob")
+    game.start_game()
+    
+    state = BitboardState.from_game(game)
+    assert len(state.legal_moves()) == len(game.legal_moves(alice))
+    
+    restored = state.to_game()
+    assert restored.get_game_state()['foundation_piles'] == game.get_game_state()['foundation_piles']
+    assert [c.id for c in restored.deck.cards] == [c.id for c in game.deck.cards]
+    assert [sorted(c.id for c in p.hand) for p in restored.players] == \
+        [sorted(c.id for c in p.hand) for p in game.players]
+    
+    def fingerprint(s):
+        return (s.hands[:], s.piles[:], s.below[:], s.deck_len, s.current,
+                s.turn_actions, s.winner)
+    
+    rng = random.Random(7)
+    initial = fingerprint(state)
+    applied = 0
+    for _ in range(200):
+        move = rng.choice(state.legal_moves() + [(DRAW,)])
+        if state.apply(move):
+            applied += 1
+        if state.game_over:
+            break
+    unpacked = state.to_game()
+    for index, name in enumerate(PILE_NAMES):
+        assert unpacked.piles[name].cards == state.pile_cards(index)
+    for _ in range(applied):
+        state.undo()
+    assert fingerprint(state) == initial
+    print(f"Applied and undid {applied} actions")
+    print()
+
+def test_empty_pile_targets():
+    """Test that Kings can be played and moved into empty corners."""
+    print("Testing empty pile targets...")
+    game = KingsCornerGame()
+    alice = game.add_player("Alice")
+    game.add_player("Bob")
+    game.start_game()
+    
+    king = Card(Suit.HEARTS, "K", 13)
+    queen = Card(Suit.CLUBS, "Q", 12)
+    for pile in game.piles.values():
+        pile.cards = []
+    game.players[0].hand = [king, queen]
+    game.foundation_piles['north'].cards = [Card(Suit.SPADES, "K", 13)]
+    
+    assert game.play_card(alice, king, 'ne') == (True, "Card played successfully")
+    assert game.move_pile(alice, 'north', 'nw') == (True, "Pile moved successfully")
+    assert game.play_card(alice, queen, 'ne')[0]
+    print(f"Corners: ne={len(game.corner_piles['ne'])}, nw={len(game.corner_piles['nw'])}")
+    print()
+
+def test_simulator():
+    """Test headless batch simulation."""
+    from simulate import run_simulations
+    print("Testing batch simulator...")
+    serial = list(run_simulations(8, num_players=3, policy='random', seed=42, workers=1))
+    pooled = list(run_simulations(8, num_players=3, policy='random', seed=42, workers=2,
+                                  chunk_size=3))
+    assert serial == pooled
+    assert all(result['winner'] is not None or result['stalemate'] for result in serial)
+    print(f"Winners by seed: {[result['winner'] for result in serial]}")
+    print()
+
+def play_out(game, turns=200):
+    """Play a started game with the greedy policy for up to `turns` turns."""
+    import random
+    from simulate import greedy_policy
+    rng = random.Random(0)
+    for _ in range(turns):
+        if game.game_over:
+            break
+        player = game.get_current_player()
+        move = greedy_policy(game, player.id, rng)
+        while move and not game.game_over:
+            if move.kind == "play":
+                game.play_card(player.id, move.card, move.target)
+            else:
+                game.move_pile(player.id, move.source, move.target)
+            move = greedy_policy(game, player.id, rng)
+        if game.game_over:
+            break
+        if game.deck.is_empty():
+            game.end_turn()
+        else:
+            game.draw_card(player.id)
+    return game
+
+def test_event_replay():
+    """Test rebuilding a game from its seed and action log."""
+    print("Testing event log replay...")
+    game = KingsCornerGame(seed=99)
+    game.add_player("Alice")
+    game.add_player("Bob")
+    game.start_game()
+    play_out(game)
+    
+    replayed = KingsCornerGame.replay(game.seed, game.events, game_id=game.game_id)
+    assert replayed.get_game_state() == game.get_game_state()
+    assert replayed.events == game.events
+    
+    snapshot = game.last_snapshot
+    assert snapshot is not None
+    since = game.events[snapshot['event_count']:]
+    recovered = KingsCornerGame.replay(game.seed, since, snapshot=snapshot)
+    assert recovered.get_game_state() == game.get_game_state()
+    assert recovered.event_base + len(recovered.events) == len(game.events)
+    
+    try:
+        KingsCornerGame.replay(game.seed, [("start",)])
+        assert False, "replaying an invalid log should fail"
+    except ValueError:
+        pass
+    print(f"Replayed {len(game.events)} events; {len(since)} since last snapshot")
+    print()
+
+def test_batch_plays():
+    """Test that a batch of plays applies atomically with one version bump."""
+    print("Testing atomic batch plays...")
+    game = KingsCornerGame(seed=2)
+    alice = game.add_player("Alice")
+    game.add_player("Bob")
+    game.start_game()
+    
+    # Find two plays that are legal one after the other
+    probe = KingsCornerGame.replay(game.seed, game.events, game.game_id)
+    first = next(m for m in probe.legal_moves(alice) if m.kind == "play")
+    probe.play_card(alice, first.card, first.target)
+    second = next(m for m in probe.legal_moves(alice) if m.kind == "play")
+    probe.play_card(alice, second.card, second.target)
+    moves = [(first.card, first.target), (second.card, second.target)]
+    
+    before = game.get_game_state()
+    version = game.version
+    ok, results = game.apply_moves(alice, moves + [(second.card, 'north')])
+    assert not ok and len(results) == 3 and not results[-1][0]
+    assert game.version == version
+    assert game.get_game_state() == before
+    
+    ok, results = game.apply_moves(alice, moves)
+    assert ok and all(success for success, _ in results)
+    assert game.version == version + 1
+    assert game.events[-1][0] == "plays"
+    assert game.get_game_state() | {'version': 0} == probe.get_game_state() | {'version': 0}
+    
+    replayed = KingsCornerGame.replay(game.seed, game.events, game.game_id)
+    assert replayed.get_game_state() == game.get_game_state()
+    print(f"Batch of {len(moves)} plays logged as one event")
+    print()
+
+def test_position_hash():
+    """Test that the incremental Zobrist hash matches a full rehash and spots transpositions."""
+    import random
+    from bitboard import BitboardState
+    from codec import decode_game, encode_game
+    from zobrist import position_hash
+    print("Testing Zobrist position hashes...")
+    
+    game = KingsCornerGame(seed=5)
+    alice = game.add_player("Alice")
+    game.add_player("Bob")
+    assert game.position_hash == position_hash(game)
+    game.start_game()
+    rng = random.Random(5)
+    seen = {}
+    moved_piles = 0
+    while not game.game_over and len(game.events) < 300:
+        player = game.get_current_player()
+        moves = game.legal_moves(player.id)
+        if moves and rng.random() < 0.8:
+            move = rng.choice(moves)
+            if move.kind == "play":
+                assert game.play_card(player.id, move.card, move.target)[0]
+            else:
+                assert game.move_pile(player.id, move.source, move.target)[0]
+                moved_piles += 1
+        elif game.deck.is_empty():
+            game.end_turn()
+        else:
+            game.draw_card(player.id)
+        assert game.position_hash == position_hash(game), game.events[-1]
+        # Equal hashes only for equal positions
+        position = (tuple(frozenset(p.hand) for p in game.players),
+                    tuple(tuple(pile.cards) for pile in game.piles.values()),
+                    game.current_player_index)
+        assert seen.setdefault(game.position_hash, position) == position
+    assert moved_piles > 0
+    assert KingsCornerGame.from_snapshot(game.snapshot()).position_hash == game.position_hash
+    
+    for restored in (KingsCornerGame.replay(game.seed, game.events, game.game_id),
+                     decode_game(encode_game(game)),
+                     BitboardState.from_game(game).to_game()):
+        assert restored.position_hash == game.position_hash
+    
+    # The same plays in either order reach the same position
+    game = KingsCornerGame(seed=2)
+    alice = game.add_player("Alice")
+    game.add_player("Bob")
+    game.start_game()
+    start = game.position_hash
+    plays = [(m.card, m.target) for m in game.legal_moves(alice) if m.kind == "play"]
+    first, second = next((a, b) for a in plays for b in plays
+                         if a[0] != b[0] and a[1] != b[1])
+    one = KingsCornerGame.replay(game.seed, game.events, game.game_id)
+    two = KingsCornerGame.replay(game.seed, game.events, game.game_id)
+    assert one.apply_moves(alice, [first, second])[0]
+    assert two.apply_moves(alice, [second, first])[0]
+    assert one.position_hash == two.position_hash != start
+    
+    # A refused batch leaves the hash as it was
+    assert not game.apply_moves(alice, [first, first])[0]
+    assert game.position_hash == start
+    print(f"Checked {len(seen)} positions")
+    print()
+
+def test_state_diffs():
+    """Test that diffs from the action log rebuild the latest state."""
+    import json
+    from game import MAX_DIFF_EVENTS, apply_state_diff
+    print("Testing state diffs...")
+    game = KingsCornerGame(seed=21)
+    alice = game.add_player("Alice")
+    game.add_player("Bob")
+    game.start_game()
+    play_out(game, turns=30)
+    
+    # Rebuild every intermediate view by replaying the log one event at a time
+    step = KingsCornerGame(game.game_id, seed=game.seed)
+    views, states = {}, {}
+    for event in game.events:
+        step.apply_event(event)
+        views[step.version] = step.get_player_view(alice)
+        states[step.version] = step.get_game_state(include_pile_cards=False)
+    
+    latest = game.get_player_view(alice)
+    oldest = max(3, game.version - MAX_DIFF_EVENTS)
+    for version in range(oldest, game.version + 1):
+        assert apply_state_diff(views[version], game.get_state_diff(version, alice)) == latest
+        full = apply_state_diff(states[version], game.get_state_diff(version))
+        assert full == game.get_game_state(include_pile_cards=False)
+    
+    assert game.get_state_diff(2, alice) is None  # the deal is not diffable
+    assert game.get_state_diff(game.version - MAX_DIFF_EVENTS - 1, alice) is None
+    try:
+        apply_state_diff(views[oldest], game.get_state_diff(oldest + 1, alice))
+        assert False, "a diff must not apply to the wrong version"
+    except ValueError:
+        pass
+    
+    diff_size = len(json.dumps(game.get_state_diff(game.version - 1, alice)))
+    full_size = len(json.dumps(latest))
+    assert diff_size < full_size
+    print(f"Diff of one event: {diff_size} bytes vs {full_size} bytes full")
+    print()
+
+def test_codec():
+    """Test that the binary game format round-trips exactly."""
+    import random
+    from codec import decode_game, encode_game, encode_json
+    print("Testing binary game codec...")
+    
+    def assert_round_trip(game):
+        restored = decode_game(encode_game(game))
+        assert restored.get_game_state() == game.get_game_state()
+        assert restored.events == game.events and restored.event_base == game.event_base
+        assert [c.id for c in restored.deck.cards] == [c.id for c in game.deck.cards]
+        assert encode_game(restored) == encode_game(game)
+        return restored
+    
+    assert_round_trip(KingsCornerGame(seed=-12345))
+    assert_round_trip(KingsCornerGame(seed=2 ** 62 + 7))
+    lobby = KingsCornerGame(rng=random.Random(3))
+    lobby.add_player("Alice")
+    assert assert_round_trip(lobby).seed is None
+    
+    game = KingsCornerGame(seed=99)
+    alice = game.add_player("Älice")
+    game.add_player("Bob")
+    game.start_game()
+    move = next(m for m in game.legal_moves(alice) if m.kind == "play")
+    assert game.apply_moves(alice, [(move.card, move.target)])[0]
+    assert_round_trip(game)
+    play_out(game)
+    assert_round_trip(game)
+    
+    restored = KingsCornerGame.replay(game.seed, game.events[game.last_snapshot['event_count']:],
+                                      snapshot=game.last_snapshot)
+    assert restored.event_base > 0
+    assert_round_trip(restored)
+    
+    data = encode_game(game)
+    for corrupt in (data[:-1], data + b"\0", b"XX" + data[2:], data[:2] + b"\x09" + data[3:], b""):
+        try:
+            decode_game(corrupt)
+            assert False, "corrupt data must be rejected"
+        except ValueError:
+            pass
+    assert len(data) * 4 < len(encode_json(game))
+    print(f"{len(game.events)} events in {len(data)} bytes ({len(encode_json(game))} as JSON)")
+    print()
+
+def test_cached_state():
+    """Test that serialized piles and hands are reused until they change."""
+    print("Testing cached state serialization...")
+    game = KingsCornerGame(seed=5)
+    alice = game.add_player("Alice")
+    game.add_player("Bob")
+    game.start_game()
+    
+    before = game.get_game_state()
+    assert game.get_game_state()['foundation_piles']['north'] is before['foundation_piles']['north']
+    assert game.get_game_state()['players'][0]['hand'] is before['players'][0]['hand']
+    
+    game.draw_card(alice)
+    after = game.get_game_state()
+    assert after['players'][0]['hand'] is not before['players'][0]['hand']
+    assert after['players'][1]['hand'] is before['players'][1]['hand']
+    assert len(after['players'][0]['hand']) == 8
+    
+    play_out(game)
+    fresh = KingsCornerGame.replay(game.seed, game.events, game.game_id)
+    assert game.get_game_state() == fresh.get_game_state()
+    
+    compact = game.get_game_state(include_pile_cards=False)
+    for name, pile in compact['foundation_piles'].items():
+        full = game.get_game_state()['foundation_piles'][name]
+        assert 'cards' not in pile and pile['size'] == len(full['cards'])
+        assert pile['top_card'] == (full['cards'][-1] if full['cards'] else None)
+        assert pile['bottom_card'] == (full['cards'][0] if full['cards'] else None)
+    print(f"Compact state for a {len(game.events)}-event game checked")
+    print()
+
 def test_game_manager():
     """Test the game manager."""
     print("Testing game manager...")
@@ -68,10 +507,19 @@ def test_game_manager():
     player2_id = game_manager.join_game(game_id, "Bob")
     print(f"Bob joined game: {player2_id[:8]}...")
     
-    # Start game
+    # Start game; a stranger may not
+    assert not game_manager.start_game(game_id, "stranger")
     success = game_manager.start_game(game_id, player1_id)
+    assert success and game_manager.get_player_game_id(player2_id) == game_id
     print(f"Game started: {success}")
     
+    # Play resolves the player and card by lookup, not by scanning
+    game = game_manager.get_game(game_id)
+    hand = list(game.get_player(player1_id).hand)
+    assert game_manager.play_card(player2_id, hand[0].rank, hand[0].suit.value, 'north') == \
+        (False, "Card not in hand")
+    assert game_manager.play_card(player1_id, "A", "?", 'north') == (False, "Invalid suit")
+    
     # Get game state
     state = game_manager.get_game_state(game_id)
     if state:
@@ -80,6 +528,593 @@ def test_game_manager():
     
     print()
 
+def test_state_versions():
+    """Test version bumps and change detection."""
+    from game_manager import GameSessionManager
+    from storage import InMemoryGameStore
+    print("Testing state versions...")
+    manager = GameSessionManager(InMemoryGameStore(sweep_interval=None))
+    game_id, alice = manager.create_game("Alice")
+    bob = manager.join_game(game_id, "Bob")
+    manager.start_game(game_id, alice)
+    
+    version = manager.get_game_state(game_id)['version']
+    assert version == 3
+    assert manager.get_game_state_if_changed(game_id, version) == (False, None)
+    
+    assert not manager.draw_card(bob)[0]
+    assert manager.get_game_state_if_changed(game_id, version) == (False, None)
+    
+    assert manager.draw_card(alice)[0]
+    changed, state = manager.get_game_state_if_changed(game_id, version)
+    assert changed and state['version'] == version + 1
+    assert manager.get_game_state_if_changed("missing", version) == (True, None)
+    assert manager.get_version(game_id) == version + 1
+    assert manager.get_version("missing") is None
+    print(f"Version moved {version} -> {state['version']} after one draw")
+    print()
+
+def test_change_notifications():
+    """Test waiting for a game to change and change listeners."""
+    import threading
+    import time
+    from game_manager import ChangeFeed, GameSessionManager
+    from storage import InMemoryGameStore
+    print("Testing change notifications...")
+    manager = GameSessionManager(InMemoryGameStore(sweep_interval=None))
+    game_id, alice = manager.create_game("Alice")
+    manager.join_game(game_id, "Bob")
+    manager.start_game(game_id, alice)
+    version = manager.get_game_state(game_id)['version']
+    
+    heard = []
+    manager.add_listener(lambda changed_id, changed_version: heard.append((changed_id, changed_version)))
+    assert manager.wait_for_change(game_id, version, timeout=0.05) == version
+    assert manager.wait_for_change("missing", version, timeout=0.05) is None
+    
+    threading.Timer(0.05, manager.draw_card, args=(alice,)).start()
+    start = time.monotonic()
+    assert manager.wait_for_change(game_id, version, timeout=5) == version + 1
+    waited = time.monotonic() - start
+    assert waited < 1
+    assert heard == [(game_id, version + 1)]
+    
+    assert not manager.draw_card(alice)[0]
+    assert len(heard) == 1
+    print(f"Woke {waited * 1000:.0f}ms after a draw")
+    
+    feed = ChangeFeed(manager)
+    assert feed.latest_version(game_id) is None
+    manager.play_card(alice, 0, "", "")  # rejected, so not a change
+    assert feed.latest_version(game_id) is None
+    manager.end_turn(manager.get_game(game_id).get_current_player().id)
+    assert feed.latest_version(game_id) == manager.get_version(game_id) == version + 2
+    ChangeFeed.MAX_GAMES, max_games = 1, ChangeFeed.MAX_GAMES
+    try:
+        other_id, carol = manager.create_game("Carol")
+        manager.join_game(other_id, "Dave")
+        manager.start_game(other_id, carol)
+        assert feed.latest_version(other_id) is not None
+        assert feed.latest_version(game_id) is None
+    finally:
+        ChangeFeed.MAX_GAMES = max_games
+    print("Change feed tracks the latest version of each changed game")
+    print()
+
+def test_player_views():
+    """Test that each seat only sees its own hand."""
+    from game_manager import GameSessionManager
+    from storage import InMemoryGameStore
+    print("Testing per-viewer state...")
+    store = InMemoryGameStore(sweep_interval=None)
+    manager = GameSessionManager(store)
+    game_id, alice = manager.create_game("Alice")
+    bob = manager.join_game(game_id, "Bob")
+    manager.start_game(game_id, alice)
+    
+    view = manager.get_player_view(game_id, bob)
+    state = manager.get_game_state(game_id)
+    assert view['seat'] == 1 and 'seed' not in view
+    assert 'hand' not in view['players'][0] and view['players'][0]['hand_size'] == 7
+    assert 'id' not in view['players'][0] and view['players'][1]['id'] == bob
+    assert view['players'][1]['hand'] == state['players'][1]['hand']
+    assert view['foundation_piles'] == state['foundation_piles']
+    assert manager.get_player_view(game_id, bob) is view
+    
+    manager.draw_card(alice)
+    updated = manager.get_player_view(game_id, bob)
+    assert updated is not view and updated['players'][0]['hand_size'] == 8
+    spectator = manager.get_player_view(game_id, "spectator")
+    assert spectator['seat'] is None
+    # Ids that are not seated all share the spectator view, so made-up ids
+    # cannot grow the cache
+    published = len(store._published[game_id])
+    assert all(manager.get_player_view(game_id, f"fake-{i}") is spectator for i in range(100))
+    assert manager.get_state_diff(game_id, updated['version'] - 1, "fake-0") is \
+        manager.get_state_diff(game_id, updated['version'] - 1, "fake-1")
+    assert len(store._published[game_id]) == published + 1
+    print(f"Bob sees {len(view['players'][1]['hand'])} own cards and Alice's hand size only")
+    print()
+
+def test_session_expiry():
+    """Test lazy expiry on read and the background sweeper."""
+    import time
+    from game_manager import GameSessionManager
+    from storage import InMemoryGameStore
+    print("Testing session expiry...")
+    store = InMemoryGameStore(session_timeout=0.05, sweep_interval=None)
+    manager = GameSessionManager(store)
+    stale_id, stale_player = manager.create_game("Alice")
+    live_id, _ = manager.create_game("Bob")
+    time.sleep(0.03)
+    assert manager.get_game(live_id)
+    time.sleep(0.03)
+    
+    # Only the game that is read is checked on the read path
+    assert manager.get_game(live_id)
+    assert stale_id in store._games
+    assert manager.get_game(stale_id) is None
+    assert manager.get_player_game(stale_player) is None
+    
+    swept = InMemoryGameStore(session_timeout=0.01, sweep_interval=0.01)
+    GameSessionManager(swept).create_game("Carol")
+    deadline = time.time() + 2
+    while swept._games and time.time() < deadline:
+        time.sleep(0.01)
+    swept.close()
+    assert not swept._games and not swept._last_activity
+    print("Expired games dropped on read and by the sweeper")
+    print()
+
+def test_concurrent_sessions():
+    """Test that concurrent actions never corrupt a shared game."""
+    import threading
+    from game_manager import GameSessionManager
+    from storage import InMemoryGameStore
+    print("Testing concurrent sessions...")
+    manager = GameSessionManager(InMemoryGameStore(sweep_interval=None))
+    games = []
+    for _ in range(3):
+        game_id, first = manager.create_game("Alice")
+        second = manager.join_game(game_id, "Bob")
+        manager.start_game(game_id, first)
+        games.append((game_id, [first, second]))
+    
+    def hammer(game_id, player_ids):
+        for _ in range(200):
+            for player_id in player_ids:
+                manager.draw_card(player_id)
+                manager.end_turn(player_id)
+                manager.get_game_state(game_id)
+    
+    threads = [threading.Thread(target=hammer, args=game)
+               for game in games for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    for game_id, _ in games:
+        game = manager.get_game(game_id)
+        state = manager.get_game_state(game_id)
+        cards = state['deck_size'] + sum(p['hand_size'] for p in state['players']) + \
+            sum(p['size'] for p in state['foundation_piles'].values())
+        assert cards == 52 and state['deck_size'] == 0
+        assert KingsCornerGame.replay(game.seed, game.events, game_id).get_game_state() == state
+    print(f"{len(threads)} threads across {len(games)} games kept every game consistent")
+    print()
+
+def test_sqlite_store():
+    """Test that games survive a restart through the SQLite store."""
+    import os
+    import sqlite3
+    import tempfile
+    from game_manager import GameSessionManager
+    from storage import SqliteGameStore
+    print("Testing SQLite game store...")
+    path = os.path.join(tempfile.mkdtemp(), "games.db")
+    
+    def open_store(**options):
+        return SqliteGameStore(path, sweep_interval=None, flush_interval=None, **options)
+    
+    store = open_store()
+    manager = GameSessionManager(store)
+    game_id, alice = manager.create_game("Alice")
+    bob = manager.join_game(game_id, "Bob")
+    manager.start_game(game_id, alice)
+    assert manager.draw_card(alice)[0]
+    before = manager.get_game_state(game_id)
+    
+    # Nothing reaches the database until a flush
+    assert sqlite3.connect(path).execute("SELECT COUNT(*) FROM games").fetchone()[0] == 0
+    store.close()
+    
+    # A new store on the same file stands in for a restarted process
+    restarted = GameSessionManager(open_store())
+    assert restarted.get_player_game(bob).game_id == game_id
+    assert restarted.get_game_state(game_id) == before
+    assert restarted.draw_card(bob)[0]
+    assert [g['game_id'] for g in restarted.list_active_games()] == [game_id]
+    restarted._store.flush()
+    
+    # Live games idle past the session timeout are not brought back
+    assert GameSessionManager(open_store(session_timeout=0)).get_game(game_id) is None
+    
+    # Finished games move to cold storage and still load
+    restarted._store.update(game_id, play_out)
+    game = restarted.get_game(game_id)
+    restarted._store.close()
+    assert game.game_over
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT COUNT(*) FROM games").fetchone()[0] == 0
+    assert db.execute("SELECT COUNT(*) FROM finished_games").fetchone()[0] == 1
+    archived = GameSessionManager(open_store(session_timeout=0)).get_game(game_id)
+    assert archived.events == game.events and archived.game_over
+    print(f"Reloaded game {game_id[:8]}... with {len(game.events)} events after a restart")
+    print()
+
+def test_redis_store():
+    """Test the Redis-backed session store against a fake Redis server."""
+    print("Testing Redis game store...")
+    fakeredis = pytest.importorskip("fakeredis")
+    import threading
+    from game_manager import GameSessionManager
+    from storage import RedisGameStore
+    
+    client = fakeredis.FakeRedis()
+    manager = GameSessionManager(RedisGameStore(client=client, session_timeout=600))
+    other = GameSessionManager(RedisGameStore(client=client, session_timeout=600))
+    
+    game_id, alice = manager.create_game("Alice")
+    bob = other.join_game(game_id, "Bob")
+    assert bob and other.start_game(game_id, alice)
+    
+    state = manager.get_game_state(game_id)
+    assert state['game_started'] and [p['name'] for p in state['players']] == ["Alice", "Bob"]
+    assert other.get_game_state(game_id) == state
+    
+    success, _ = manager.draw_card(alice)
+    assert success and other.get_game_state(game_id)['current_player'] == 1
+    assert other.draw_card(alice) == (False, "Not your turn")
+    assert 0 < client.ttl(f"kc:game:{game_id}") <= 600
+    assert [g['game_id'] for g in manager.list_active_games()] == [game_id]
+    
+    view = manager.get_player_view(game_id, alice)
+    assert manager.get_player_view(game_id, alice) is view
+    assert 'hand' in view['players'][0] and 'hand' not in view['players'][1]
+    
+    # Every read keeps all of the game's keys alive, not just the game
+    keys = [f"kc:game:{game_id}", f"kc:version:{game_id}", f"kc:player:{alice}", f"kc:player:{bob}"]
+    for read in (manager.get_version, manager.get_game, lambda game_id: manager.get_player_view(game_id, alice)):
+        for key in keys:
+            client.expire(key, 5)
+        assert read(game_id)
+        assert all(client.ttl(key) > 5 for key in keys)
+    
+    version = other.get_game_state(game_id)['version']
+    assert other.wait_for_change(game_id, version, timeout=0.05) == version
+    assert manager.draw_card(bob)[0]
+    assert other.wait_for_change(game_id, version, timeout=0.05) == version + 1
+    assert other.get_state_diff(game_id, version, bob)['diff']['ops'] == [{'op': 'draw', 'seat': 1}]
+    
+    # Listeners hear changes made through other stores too
+    heard = threading.Event()
+    def listener(changed_id, changed_version):
+        if changed_id == game_id and changed_version == version + 2:
+            heard.set()
+    other.add_listener(listener, remote=True)
+    try:
+        assert manager.draw_card(alice)[0]
+        assert heard.wait(5), "change in another store was not heard"
+    finally:
+        other.remove_listener(listener)
+    print(f"Shared game {game_id[:8]}... across two managers")
+    print()
+
+def test_api_server():
+    """Test the JSON/WebSocket API server with a local client."""
+    import asyncio
+    import json
+    from game_manager import GameSessionManager
+    from storage import InMemoryGameStore
+    from game import apply_state_diff
+    from server import GameServer, connect_websocket, encode_frame, read_frame, request_json
+    print("Testing API server...")
+    
+    async def scenario():
+        server = GameServer(GameSessionManager(InMemoryGameStore(sweep_interval=None)))
+        listener = await server.start("127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            status, created = await request_json(reader, writer, "POST", "/games", {"name": "Alice"})
+            assert status == 201
+            game_id, alice = created['game_id'], created['player_id']
+            status, joined = await request_json(reader, writer, "POST", f"/games/{game_id}/join", {"name": "Bob"})
+            bob = joined['player_id']
+            # Only a player of this game may act on it
+            status, other = await request_json(reader, writer, "POST", "/games", {"name": "Carol"})
+            carol = other['player_id']
+            assert (await request_json(reader, writer, "POST", f"/games/{game_id}/start", {"player_id": carol}))[0] == 403
+            assert (await request_json(reader, writer, "POST", f"/games/{other['game_id']}/start", {"player_id": alice}))[0] == 403
+            status, started = await request_json(reader, writer, "POST", f"/games/{game_id}/start", {"player_id": alice})
+            assert status == 200 and started == {"ok": True}
+            assert (await request_json(reader, writer, "POST", "/games", {}))[0] == 400
+            assert (await request_json(reader, writer, "GET", f"/games/missing/state?player_id={bob}"))[0] == 404
+            
+            # Fields of the wrong type are refused, and the connection stays usable
+            assert (await request_json(reader, writer, "POST", f"/games/{game_id}/bots", {"policy": ["x"]}))[0] == 400
+            assert (await request_json(reader, writer, "POST", "/games", {"name": 7}))[0] == 400
+            assert (await request_json(reader, writer, "POST", f"/games/{game_id}/play",
+                                       {"player_id": alice, "pile": "North", "cards": [[1, "♠"]]}))[0] == 400
+            assert (await request_json(reader, writer, "POST", f"/games/{game_id}/move",
+                                       {"player_id": alice, "from": 5, "to": "North"}))[0] == 400
+            # Unexpected errors answer 500 rather than dropping the connection
+            server.manager.list_active_games = lambda: 1 / 0
+            try:
+                status, failed = await request_json(reader, writer, "GET", "/games")
+                assert status == 500 and failed == {"error": "Internal server error"}
+            finally:
+                del server.manager.list_active_games
+            assert (await request_json(reader, writer, "GET", "/games"))[0] == 200
+            for length in ("-5", "lots"):
+                raw_reader, raw_writer = await asyncio.open_connection("127.0.0.1", port)
+                raw_writer.write(f"POST /games HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode())
+                assert b" 400 " in await raw_reader.readline()
+                raw_writer.close()
+            
+            ws_reader, ws_writer = await connect_websocket("127.0.0.1", port, f"/games/{game_id}/ws?player_id={bob}")
+            first = json.loads((await read_frame(ws_reader))[1])
+            assert first['type'] == "full" and first['state']['seat'] == 1
+            
+            # A draw over HTTP is pushed to Bob's socket
+            status, drawn = await request_json(reader, writer, "POST", f"/games/{game_id}/draw", {"player_id": alice})
+            assert drawn['ok']
+            pushed = json.loads((await asyncio.wait_for(read_frame(ws_reader), 2))[1])
+            assert pushed['type'] == "diff"
+            state = apply_state_diff(first['state'], pushed['diff'])
+            assert state['version'] == first['state']['version'] + 1 and state['current_player'] == 1
+            
+            # Carol watching Bob's game cannot act in it
+            spy_reader, spy_writer = await connect_websocket("127.0.0.1", port, f"/games/{game_id}/ws?player_id={carol}")
+            assert json.loads((await read_frame(spy_reader))[1])['state']['seat'] is None
+            spy_writer.write(encode_frame(json.dumps({"action": "draw"}).encode(), mask=True))
+            assert json.loads((await asyncio.wait_for(read_frame(spy_reader), 2))[1])['type'] == "error"
+            spy_writer.close()
+            
+            # A failing action is answered with an error and the socket stays open
+            server.manager.end_turn = lambda player_id: 1 / 0
+            try:
+                ws_writer.write(encode_frame(json.dumps({"action": "end"}).encode(), mask=True))
+                failed = json.loads((await asyncio.wait_for(read_frame(ws_reader), 2))[1])
+                assert failed == {"type": "error", "error": "Internal server error"}
+            finally:
+                del server.manager.end_turn
+            
+            # Bob acts over the socket: one result, then the new state
+            ws_writer.write(encode_frame(json.dumps({"action": "draw"}).encode(), mask=True))
+            messages = [json.loads((await asyncio.wait_for(read_frame(ws_reader), 2))[1]) for _ in range(2)]
+            assert {m['type'] for m in messages} == {"result", "diff"}
+            
+            status, view = await request_json(reader, writer, "GET", f"/games/{game_id}/state?player_id={alice}")
+            assert status == 200 and view['current_player'] == 0 and 'hand' not in view['players'][1]
+            ws_writer.close()
+            writer.close()
+        finally:
+            server.close()
+            listener.close()
+            await listener.wait_closed()
+    
+    asyncio.run(scenario())
+    print("HTTP actions pushed to a WebSocket client")
+    print()
+
+def test_search():
+    """Test ISMCTS determinization and that searched lines are legal."""
+    import random
+    from bitboard import BitboardState, iter_cards
+    from game_manager import GameSessionManager
+    from search import determinize, search
+    from storage import InMemoryGameStore
+    print("Testing ISMCTS search...")
+    
+    game = KingsCornerGame(seed=3)
+    for name in ("Alice", "Bob", "Carol"):
+        game.add_player(name)
+    game.start_game()
+    alice, bob = game.players[0].id, game.players[1].id
+    
+    # Redealing keeps our hand and every size, and conserves the cards
+    state = BitboardState.from_game(game)
+    sample = determinize(state, 0, random.Random(1))
+    assert sample.hands[0] == state.hands[0]
+    assert [bin(hand).count("1") for hand in sample.hands] == [bin(hand).count("1") for hand in state.hands]
+    assert sample.deck_len == len(sample.deck) == state.deck_len
+    hidden = lambda s: sorted(s.deck[:s.deck_len] + [c for hand in s.hands[1:] for c in iter_cards(hand)])
+    assert hidden(sample) == hidden(state) and sample.hands[1:] != state.hands[1:]
+    
+    try:
+        search(game, bob, 10)
+        assert False, "searched out of turn"
+    except ValueError:
+        pass
+    
+    for workers in (1, 2):
+        result = search(game, alice, 100, workers=workers, seed=5)
+        assert result.rollouts > 0 and 0.0 <= result.value <= 1.0
+        assert result.rollouts_per_second > 0
+        copy = KingsCornerGame.replay(game.seed, game.events, game.game_id)
+        for move in result.moves:
+            if move.kind == "play":
+                assert copy.play_card(alice, move.card, move.target)[0], move
+            else:
+                assert copy.move_pile(alice, move.source, move.target)[0], move
+    
+    manager = GameSessionManager(InMemoryGameStore(sweep_interval=None))
+    game_id, host = manager.create_game("Alice")
+    guest = manager.join_game(game_id, "Bob")
+    manager.start_game(game_id, host)
+    assert manager.get_hint(guest, 10) is None
+    # A deal can leave nothing to play, which needs no rollouts
+    hint = manager.get_hint(host, 20)
+    assert hint is not None and (hint.rollouts > 0 or not hint.moves)
+    
+    print("✅ ISMCTS search tests passed")
+
+def test_turn_solver():
+    """Test the turn solver against brute force and that its lines are legal."""
+    from bitboard import BitboardState
+    from solver import sample_position, solve_turn
+    print("Testing turn solver...")
+    
+    def brute_force(state, seen):
+        key = (state.hands[state.current], tuple(state.piles))
+        if key not in seen:
+            best = 0
+            for move in state.useful_moves():
+                state.apply(move)
+                best = max(best, (move[0] == 0) + brute_force(state, seen))
+                state.undo()
+            seen[key] = best
+        return seen[key]
+    
+    for seed in range(12):
+        game = sample_position(seed, hand_size=5)
+        assert len(game.get_current_player().hand) == 5
+        solution = solve_turn(game, time_limit_ms=None)
+        assert solution.complete
+        assert solution.cards_played == brute_force(BitboardState.from_game(game), {}), seed
+    
+    for seed, hand_size, limit in ((3, 20, None), (14, 20, None), (66, 26, 0)):
+        game = sample_position(seed, hand_size)
+        player = game.get_current_player()
+        solution = solve_turn(game, player.id, time_limit_ms=limit)
+        assert solution.complete == (limit is None)
+        assert solution.cards_played > 0
+        for move in solution.moves:
+            if move.kind == "play":
+                assert game.play_card(player.id, move.card, move.target)[0], move
+            else:
+                assert game.move_pile(player.id, move.source, move.target)[0], move
+        assert len(player.hand) == hand_size - solution.cards_played
+    
+    try:
+        solve_turn(game, "someone else")
+        assert False, "solved out of turn"
+    except ValueError:
+        pass
+    
+    print("✅ Turn solver tests passed")
+
+def test_bots():
+    """Test bot seats, their round trip through the codec, and the BotRunner."""
+    import time
+    from bots import BOT_POLICIES, BotRunner
+    from codec import decode_game, encode_game
+    from game_manager import GameSessionManager
+    from storage import InMemoryGameStore
+    print("Testing bot players...")
+    
+    manager = GameSessionManager(InMemoryGameStore(sweep_interval=None))
+    game_id, alice = manager.create_game("Alice")
+    assert manager.add_bot(game_id, "telepathic") is None
+    assert manager.add_bot("missing", "greedy") is None
+    bot = manager.add_bot(game_id, "lookahead")
+    
+    game = manager.get_game(game_id)
+    assert game.players[1].bot == "lookahead" and game.players[1].name == "Lookahead Bot"
+    assert game.players[0].bot is None
+    assert manager.get_game_state(game_id)['players'][1]['bot'] == "lookahead"
+    restored = decode_game(encode_game(game))
+    assert [p.bot for p in restored.players] == [None, "lookahead"]
+    assert KingsCornerGame.replay(game.seed, game.events, game.game_id).players[1].bot == "lookahead"
+    
+    # Nothing happens until the game starts; then the bot answers Alice's turn
+    runner = BotRunner(manager, seed=1).start()
+    try:
+        assert manager.start_game(game_id, alice)
+        manager.draw_card(alice)
+        deadline = time.monotonic() + 10
+        game = manager.get_game(game_id)
+        while game.get_current_player().id != alice and not game.game_over:
+            assert time.monotonic() < deadline, "bot never finished its turn"
+            manager.wait_for_change(game_id, game.version, timeout=0.5)
+            game = manager.get_game(game_id)
+        # The bot finished its turn, or won during it
+        assert game.game_over or any(event[0] in ("draw", "end") and event[1] == bot
+                                     for event in game.events)
+    finally:
+        runner.close()
+    
+    # A bot whose policy raises is logged and still finishes its turn
+    import logging
+    failures = []
+    handler = logging.Handler()
+    handler.emit = failures.append
+    logging.getLogger("bots").addHandler(handler)
+    BOT_POLICIES['broken'] = lambda game, player_id, rng, deadline: 1 / 0
+    game_id, alice = manager.create_game("Alice")
+    broken = manager.add_bot(game_id, "broken")
+    runner = BotRunner(manager).start()
+    try:
+        manager.start_game(game_id, alice)
+        manager.draw_card(alice)
+        deadline = time.monotonic() + 10
+        while game_id in runner._scheduled or manager.get_game(game_id).get_current_player().id != alice:
+            assert time.monotonic() < deadline, "failed bot turn was never finished"
+            time.sleep(0.01)
+        assert failures and failures[0].exc_info[0] is ZeroDivisionError
+        assert manager.get_game(game_id).events[-1] == ("draw", broken)
+    finally:
+        runner.close()
+        del BOT_POLICIES['broken']
+        logging.getLogger("bots").removeHandler(handler)
+    
+    # A runner started after the bot's turn came up, as after a restart,
+    # still takes it
+    game_id, alice = manager.create_game("Alice")
+    waiting = manager.add_bot(game_id, "greedy")
+    manager.start_game(game_id, alice)
+    manager.draw_card(alice)
+    assert manager.get_game(game_id).get_current_player().id == waiting
+    runner = BotRunner(manager, seed=1).start()
+    try:
+        deadline = time.monotonic() + 10
+        game = manager.get_game(game_id)
+        while game.get_current_player().id == waiting and not game.game_over:
+            assert time.monotonic() < deadline, "runner never took the waiting bot's turn"
+            time.sleep(0.01)
+            game = manager.get_game(game_id)
+    finally:
+        runner.close()
+    
+    print("✅ Bot player tests passed")
+
+def test_benchmarks():
+    """Test the benchmark suite's results and its comparison with a baseline."""
+    import json
+    from benchmarks import BASELINE_PATH, BENCHMARKS, compare, run_benchmarks
+    print("Testing benchmark suite...")
+    
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+    assert set(baseline['results']) == set(BENCHMARKS)
+    
+    results = run_benchmarks(['can_play_on', 'move_pile'], rounds=1)
+    assert list(results['results']) == ['can_play_on', 'move_pile']
+    for result in results['results'].values():
+        assert result['ns_per_op'] > 0 and result['ops_per_second'] > 0
+    json.dumps(results)
+    
+    slow = {'results': {name: {'ns_per_op': result['ns_per_op'] * 3}
+                        for name, result in results['results'].items()}}
+    fast = {'results': {'can_play_on': {'ns_per_op': results['results']['can_play_on']['ns_per_op'] / 3}}}
+    assert compare(results, slow) == []
+    assert [name for name, _ in compare(results, fast)] == ['can_play_on']
+    assert compare(results, fast, tolerance=3) == []
+    print(f"Ran {len(results['results'])} benchmarks")
+    print()
+
 def main():
     """Run all tests."""
     print("🃏 Kings in the Corner - Test Suite")
@@ -87,9 +1122,38 @@ def main():
     
     try:
         test_card_creation()
+        test_card_interning()
+        test_hand_index()
         test_deck()
+        test_seeded_deal()
         test_game_creation()
+        test_legal_moves()
+        test_bitboard_state()
+        test_empty_pile_targets()
+        test_simulator()
+        test_event_replay()
+        test_batch_plays()
+        test_position_hash()
+        test_state_diffs()
+        test_codec()
+        test_cached_state()
         test_game_manager()
+        test_state_versions()
+        test_change_notifications()
+        test_player_views()
+        test_session_expiry()
+        test_concurrent_sessions()
+        test_sqlite_store()
+        try:
+            test_redis_store()
+        except pytest.skip.Exception as skip:
+            print(f"Skipping Redis game store: {skip}")
+            print()
+        test_api_server()
+        test_search()
+        test_turn_solver()
+        test_bots()
+        test_benchmarks()
         
         print("✅ All tests passed!")
         print("\n🃏 Kings in the Corner is ready to play!")
@@ -0,0 +1,56 @@
+"""
+Zobrist hashing of Kings in the Corner positions.
+
+A position is every player's hand, the contents of every pile and whose
+turn it is. Its hash XORs one random 64-bit key per fact:
+
+    ZOBRIST_HAND[seat][card]      card is in the hand of the player in seat
+    ZOBRIST_BOTTOM[pile][card]    card is at the bottom of pile
+    ZOBRIST_BELOW[card][below]    card sits directly on top of below
+    ZOBRIST_TURN[seat]            it is seat's turn
+
+Piles are hashed as links between neighbouring cards rather than by depth,
+so moving a whole pile only swaps its bottom key for a link onto the
+target's top card. Every action therefore changes a constant number of
+keys, and KingsCornerGame keeps its position_hash up to date in O(1). The
+deck is not hashed: its cards are those not anywhere else, and its order
+is hidden. Nor is anything that does not constrain future moves, such as
+the count of actions taken this turn.
+"""
+import random
+from typing import Optional
+
+from cards import Card
+
+_keys = random.Random(0x5A0B)
+ZOBRIST_HAND = tuple(tuple(_keys.getrandbits(64) for _ in range(52)) for _ in range(4))
+# Keyed by pile name, the KingsCornerGame.piles keys
+ZOBRIST_BOTTOM = {
+    name: tuple(_keys.getrandbits(64) for _ in range(52))
+    for name in ('north', 'south', 'east', 'west', 'ne', 'nw', 'se', 'sw')
+}
+ZOBRIST_BELOW = tuple(tuple(_keys.getrandbits(64) for _ in range(52)) for _ in range(52))
+ZOBRIST_TURN = tuple(_keys.getrandbits(64) for _ in range(4))
+del _keys
+
+
+def link_key(pile_name: str, card: Card, below: Optional[Card]) -> int:
+    """The key for `card` lying on `below` in a pile, or at its bottom if None."""
+    if below is None:
+        return ZOBRIST_BOTTOM[pile_name][card.id]
+    return ZOBRIST_BELOW[card.id][below.id]
+
+
+def position_hash(game) -> int:
+    """Hash a KingsCornerGame's position from scratch, in O(cards)."""
+    key = ZOBRIST_TURN[game.current_player_index]
+    for seat, player in enumerate(game.players):
+        hand_keys = ZOBRIST_HAND[seat]
+        for card in player.hand:
+            key ^= hand_keys[card.id]
+    for name, pile in game.piles.items():
+        below = None
+        for card in pile.cards:
+            key ^= link_key(name, card, below)
+            below = card
+    return key